@@ -0,0 +1,272 @@
+"""
+Headless JSON API for logging habits from scripts, shortcuts and smart buttons.
+
+    python api.py --port 8502
+
+Auth: if APP_PASSWORD (bcrypt hash) is set, POST /auth/login {"password": "..."}
+returns a session token; send it as `Authorization: Bearer <token>`.
+
+Endpoints:
+    GET  /habits/today          habits due today and not yet done
+    POST /logs                  {"habit_id", "date"?, "notes"?, "value"?}
+    POST /logs/batch            {"items": [<log>, ...]}
+    POST /logs/increment        {"habit_id", "amount"?, "date"?} adds to a measurable habit
+    POST /logs/skip             {"habit_id", "date"?, "notes"?} rest day, not counted as a miss
+    GET  /progress              XP, level and badges
+    GET  /habits/<id>/stats     log count, last log, streaks and 30-day rate
+"""
+import os
+import json
+import time
+import secrets
+import argparse
+import datetime
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import bcrypt
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+
+from src import database, scheduler, notifications
+from src.data_manager import (
+    BACKEND_NAME, load_due_habits, log_habit_completion, get_user_progress,
+    get_habit_stats, get_habit_bitmap_stats, get_habit, log_progress, process_completion_rewards,
+    skip_habit
+)
+from src.gamification import get_level_info
+
+load_dotenv()
+
+SESSION_TTL = int(os.getenv("API_SESSION_TTL", 12 * 3600))
+MAX_BATCH = 500
+
+# token -> expiry (epoch seconds)
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+def _json_default(obj):
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, (pd.Timestamp, datetime.date, datetime.datetime)):
+        return obj.isoformat()
+    return str(obj)
+
+def _parse_id(raw):
+    """SQLite ids are ints; Mongo ids are ObjectId strings."""
+    raw = str(raw)
+    return int(raw) if raw.isdigit() else raw
+
+def _today():
+    return datetime.date.today()
+
+# --- AUTH ---
+
+def login(password):
+    """Check the password against APP_PASSWORD and return a new token, or None."""
+    stored_hash = os.getenv("APP_PASSWORD")
+    if stored_hash:
+        try:
+            if not bcrypt.checkpw(str(password or "").encode(), stored_hash.encode()):
+                return None
+        except ValueError:
+            return None
+    token = secrets.token_urlsafe(32)
+    with _sessions_lock:
+        _sessions[token] = time.time() + SESSION_TTL
+    return token
+
+def is_authorized(header):
+    if not os.getenv("APP_PASSWORD"):
+        return True
+    if not header or not header.startswith("Bearer "):
+        return False
+    token = header[len("Bearer "):]
+    with _sessions_lock:
+        expiry = _sessions.get(token)
+        if expiry is None:
+            return False
+        if expiry < time.time():
+            del _sessions[token]
+            return False
+    return True
+
+# --- HANDLERS ---
+
+def habits_today(_body):
+    habits = load_due_habits(_today())
+    cols = [c for c in ['id', 'name', 'category', 'frequency_type', 'target_value', 'target_unit'] if c in habits.columns]
+    return 200, {"date": _today(), "habits": habits[cols].to_dict('records')}
+
+def _log_one(item):
+    if not isinstance(item, dict) or "habit_id" not in item:
+        return {"ok": False, "error": "habit_id is required"}
+    day = item.get("date") or str(_today())
+    try:
+        datetime.date.fromisoformat(str(day))
+    except ValueError:
+        return {"ok": False, "error": "date must be YYYY-MM-DD"}
+    try:
+        value = int(item.get("value", 1))
+    except (TypeError, ValueError):
+        return {"ok": False, "error": "value must be an integer"}
+    success, reward = log_habit_completion(
+        _parse_id(item["habit_id"]), day,
+        notes=item.get("notes", ""), value=value
+    )
+    if not success:
+        return {"ok": False, "error": "already logged or unknown habit"}
+    return {"ok": True, "reward": reward}
+
+def create_log(body):
+    result = _log_one(body)
+    return (201 if result["ok"] else 409), result
+
+def create_logs_batch(body):
+    items = (body or {}).get("items")
+    if not isinstance(items, list) or len(items) > MAX_BATCH:
+        return 400, {"error": f"items must be a list of at most {MAX_BATCH} logs"}
+    results = [_log_one(item) for item in items]
+    return 200, {"logged": sum(r["ok"] for r in results), "results": results}
+
+def increment_log(body):
+    if not isinstance(body, dict) or "habit_id" not in body:
+        return 400, {"error": "habit_id is required"}
+    day = body.get("date") or str(_today())
+    try:
+        datetime.date.fromisoformat(str(day))
+        amount = int(body.get("amount", 1))
+    except (TypeError, ValueError):
+        return 400, {"error": "date must be YYYY-MM-DD and amount an integer"}
+    habit = get_habit(_parse_id(body["habit_id"]))
+    if habit is None:
+        return 404, {"error": "habit not found"}
+    result = log_progress(habit, day, amount, notes=body.get("notes", ""))
+    if result is None:
+        return 500, {"error": "could not log progress"}
+    reward = process_completion_rewards(habit.id, day, result["log_id"]) if result["completed_now"] else {}
+    return 200, {**result, "target_value": habit.target_value, "reward": reward}
+
+def skip_log(body):
+    if not isinstance(body, dict) or "habit_id" not in body:
+        return 400, {"error": "habit_id is required"}
+    day = body.get("date") or str(_today())
+    try:
+        datetime.date.fromisoformat(str(day))
+    except ValueError:
+        return 400, {"error": "date must be YYYY-MM-DD"}
+    habit = get_habit(_parse_id(body["habit_id"]))
+    if habit is None:
+        return 404, {"error": "habit not found"}
+    if skip_habit(habit, day, notes=body.get("notes", "")) is None:
+        return 409, {"ok": False, "error": "already logged"}
+    return 201, {"ok": True}
+
+def progress(_body):
+    prog = get_user_progress()
+    curr_lvl, next_lvl = get_level_info(prog['total_xp'])
+    return 200, {**prog, "level": curr_lvl, "next_level": next_lvl}
+
+def habit_stats(_body, habit_id):
+    habit_id = _parse_id(habit_id)
+    habit = get_habit(habit_id)
+    if habit is None:
+        return 404, {"error": "habit not found"}
+    return 200, {"habit_id": habit_id, **get_habit_stats(habit_id), **get_habit_bitmap_stats(habit)}
+
+ROUTES = {
+    ("GET", "/habits/today"): habits_today,
+    ("POST", "/logs"): create_log,
+    ("POST", "/logs/batch"): create_logs_batch,
+    ("POST", "/logs/increment"): increment_log,
+    ("POST", "/logs/skip"): skip_log,
+    ("GET", "/progress"): progress,
+}
+
+class APIHandler(BaseHTTPRequestHandler):
+    # Keep-alive so clients can reuse connections; headers and body go out as
+    # separate writes, so Nagle would otherwise add ~40ms per response
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def _send(self, status, payload):
+        body = json.dumps(payload, default=_json_default).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if not length:
+            return {}
+        return json.loads(self.rfile.read(length))
+
+    def _dispatch(self, method):
+        path = self.path.split("?", 1)[0].rstrip("/") or "/"
+        try:
+            body = self._read_body() if method == "POST" else {}
+        except ValueError:
+            # JSONDecodeError, or a body that is not UTF-8
+            return self._send(400, {"error": "invalid JSON"})
+        if not isinstance(body, dict):
+            return self._send(400, {"error": "body must be a JSON object"})
+
+        if (method, path) == ("POST", "/auth/login"):
+            token = login(body.get("password"))
+            if not token:
+                return self._send(401, {"error": "invalid password"})
+            return self._send(200, {"token": token, "expires_in": SESSION_TTL})
+        if (method, path) == ("GET", "/health"):
+            return self._send(200, {"status": "ok", "backend": BACKEND_NAME})
+
+        if not is_authorized(self.headers.get("Authorization")):
+            return self._send(401, {"error": "unauthorized"})
+
+        handler = ROUTES.get((method, path))
+        args = ()
+        parts = path.strip("/").split("/")
+        if handler is None and method == "GET" and len(parts) == 3 and parts[0] == "habits" and parts[2] == "stats":
+            handler, args = habit_stats, (parts[1],)
+        if handler is None:
+            return self._send(404, {"error": "not found"})
+        try:
+            status, payload = handler(body, *args)
+        except Exception as e:
+            status, payload = 500, {"error": str(e)}
+        self._send(status, payload)
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def log_message(self, format, *args):
+        if os.getenv("API_ACCESS_LOG", "false").lower() == "true":
+            super().log_message(format, *args)
+
+def main():
+    parser = argparse.ArgumentParser(description="Smart Habit Tracker JSON API")
+    parser.add_argument("--host", default=os.getenv("API_HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("API_PORT", 8502)))
+    args = parser.parse_args()
+
+    if BACKEND_NAME == "SQLite":
+        database.use_persistent_connections()
+    scheduler.start()
+    notifications.start()
+    server = ThreadingHTTPServer((args.host, args.port), APIHandler)
+    server.daemon_threads = True
+    print(f"Habit API ({BACKEND_NAME}) listening on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
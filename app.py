@@ -1,16 +1,30 @@
 import streamlit as st
 import pandas as pd
 import datetime
-from src.database import init_db
+import uuid
+from functools import partial
 from src.data_manager import (
-    add_project, get_projects, load_habits, load_logs, add_habit, log_habit_completion, delete_habit, edit_habit,
-    add_reminder, get_reminders, update_project_status, update_reminder_status, delete_reminder
+    init_db, add_project, get_projects, load_habits, load_logs, add_habit, delete_habit, edit_habit,
+    add_reminder, get_reminders, update_project_status, update_reminder_status, delete_reminder, load_due_habits,
+    get_reminders_page, get_projects_page, search, get_day_values,
+    load_value_series, skip_habit, get_miss_stats, get_habit_logs_page, get_habit_stats,
+    get_completion_bitmaps, get_data_generation, get_streaks
 )
-from src.ui_components import render_add_habit_form, render_habit_card, render_edit_habit_form
-from src.analytics import render_analytics
+from src.ui_components import (
+    render_add_habit_form, render_habit_card, render_edit_habit_form, render_pagination, get_page_cursor,
+    get_timeline, render_load_older, render_log_timeline, fragment
+)
+from src.analytics import render_analytics, render_habit_heatmap, ROLLING_HISTORY_DAYS
 from src.ml_logic import get_motivational_message, get_smart_suggestions
-from src.utils import is_habit_due
+from src.models import habits_from_df
 from src.auth import check_password
+from src.utils import to_dates, RECURRENCES
+from src import rewards, scheduler, bitmaps, notifications
+
+SEARCH_PAGE_SIZE = 20
+HISTORY_PAGE_SIZE = 30
+# How often a session waiting on the background worker checks for its rewards
+REWARD_POLL_SECONDS = 1
 
 st.set_page_config(
     page_title="Smart Habit Tracker",
@@ -23,6 +37,13 @@ st.set_page_config(
 if not check_password():
     st.stop()
 
+# Streak/XP/badge processing for Done clicks runs in the background
+rewards.start_worker()
+# Nightly maintenance and precomputation (see src/scheduler.py)
+scheduler.start()
+# Due-time reminder notifications (see src/notifications.py)
+notifications.start()
+
 st.title("✨ Smart Habit Tracker")
 
 # DB Initialization
@@ -33,10 +54,14 @@ if "db_initialized" not in st.session_state:
         st.error("Failed to initialize database.")
         st.stop()
 
+# Rewards finished by the worker are delivered to the session that earned them
+if "reward_session" not in st.session_state:
+    st.session_state.reward_session = uuid.uuid4().hex
+
 # Navigation
 selected_tab = st.radio(
     "Navigation", 
-    ["🔥 Dashboard", "➕ Add Habit", "📝 Add Reminder", "🗂️ Add Project", "📊 Analytics", "⚙️ Settings"], 
+    ["🔥 Dashboard", "➕ Add Habit", "📝 Add Reminder", "🗂️ Add Project", "📊 Analytics", "📖 History", "🔍 Search", "⚙️ Settings"], 
     horizontal=True,
     label_visibility="collapsed"
 )
@@ -80,8 +105,12 @@ st.markdown("""
 
 from src.gamification import get_level_info
 
-if selected_tab == "🔥 Dashboard":
-    # --- GAMIFICATION HEADER ---
+# --- FRAGMENTS ---
+# Each panel below reruns on its own when its buttons are used (see
+# ui_components.fragment), loading only its own data.
+
+def render_progress_header():
+    """Level/XP bar and reward popups; redrawn on full reruns (a card that queued a reward triggers one)."""
     from src.data_manager import get_user_progress
     user_progress = get_user_progress()
     curr_lvl, next_lvl = get_level_info(user_progress['total_xp'])
@@ -104,12 +133,12 @@ if selected_tab == "🔥 Dashboard":
         with c2:
             st.write(f"**XP Progress** ({str_progress})")
             st.progress(progress_val)
-    
-    st.divider()
 
     # --- REWARD POPUP SYSTEM ---
+    ready_rewards = rewards.pop_ready_rewards(st.session_state.reward_session)
     if "latest_reward" in st.session_state:
-        reward = st.session_state.latest_reward
+        ready_rewards.insert(0, st.session_state.pop('latest_reward'))
+    for reward in ready_rewards:
         xp = reward.get('xp_earned', 0)
         st.toast(f"Heroic! +{xp} XP 🌟")
         
@@ -117,10 +146,15 @@ if selected_tab == "🔥 Dashboard":
             st.balloons()
             lvl = reward['current_level']
             st.success(f"🎉 **LEVEL UP!** You are now a **{lvl['name']}** (Level {lvl['level']})!")
-            
-        del st.session_state['latest_reward']
 
-    # --- 0. Projects Section ---
+@fragment(run_every=REWARD_POLL_SECONDS)
+def await_rewards():
+    """Only rendered while the worker has unfinished jobs for this session; reruns the app once they finish."""
+    if not rewards.has_unfinished(st.session_state.reward_session):
+        st.rerun()
+
+@fragment
+def render_dashboard_projects():
     projects = get_projects(pending_only=True)
     if not projects.empty:
         st.markdown("### 🗂️ Pending Projects")
@@ -134,11 +168,21 @@ if selected_tab == "🔥 Dashboard":
                     # Emoji must be present for :has() selector to work
                     st.markdown(f" <b style='font-size: 1.5rem;'>{icon} {row['text']}</b>", unsafe_allow_html=True)
                 with c2:
-                    if st.button("Done", key=f"dash_project_{row['id']}", help="Mark Done"):
-                        update_project_status(row['id'], True)
-                        st.rerun()
+                    st.button("Done", key=f"dash_project_{row['id']}", help="Mark Done",
+                              on_click=update_project_status, args=(row['id'], True))
 
-    # --- 1. Reminders Section ---
+def reminder_due_caption(row):
+    """'🔔 Mon 14 Oct, 09:00 • repeats weekly' for a reminder with a due time, else ''."""
+    due_at = row.get('due_at')
+    if due_at is None or pd.isna(due_at) or due_at == "":
+        return ""
+    caption = f"🔔 {pd.Timestamp(due_at):%a %d %b, %H:%M}"
+    if isinstance(row.get('recurrence'), str):
+        caption += f" • repeats {row['recurrence']}"
+    return caption
+
+@fragment
+def render_dashboard_reminders():
     reminders = get_reminders(pending_only=True)
     if not reminders.empty:
         st.markdown("### 📝 Reminders")
@@ -151,10 +195,143 @@ if selected_tab == "🔥 Dashboard":
                 with c1:
                     # Emoji must be present for :has() selector to work
                     st.markdown(f" <b style='font-size: 1.5rem;'>{icon} {row['text']}</b>", unsafe_allow_html=True)
+                    if reminder_due_caption(row):
+                        st.caption(reminder_due_caption(row))
                 with c2:
-                    if st.button("Done", key=f"dash_rem_{row['id']}", help="Mark Done"):
-                        update_reminder_status(row['id'], True)
-                        st.rerun()
+                    st.button("Done", key=f"dash_rem_{row['id']}", help="Mark Done",
+                              on_click=update_reminder_status, args=(row['id'], True))
+
+@fragment
+def render_reminder_list():
+    reminders = get_reminders(pending_only=True)
+    if reminders.empty:
+        st.info("No active reminders. You're free! 🎉")
+    else:
+        st.subheader("⚠️ Pending Reminders")
+        for idx, row in reminders.iterrows():
+            # Determine icon for CSS targeting
+            icon = "🚨" if row['priority'] == 'high' else "⚠️" if row['priority'] == 'medium' else "🟢"
+            
+            # Layout: Box with colored background via CSS
+            with st.container(border=True):
+                c1, c2 = st.columns([6, 1])
+                with c1:
+                    # Emoji must be present for :has() selector to work
+                    st.markdown(f"**{icon} {row['text']}**")
+                    if reminder_due_caption(row):
+                        st.caption(reminder_due_caption(row))
+                with c2:
+                    st.button("Done", key=f"dash_rem_{row['id']}", help="Mark Done",
+                              on_click=update_reminder_status, args=(row['id'], True))
+        st.divider()
+
+@fragment
+def render_project_list():
+    projects = get_projects(pending_only=True)
+    if projects.empty:
+        st.info("No active Projects. You're free! 🎉")
+    else:
+        st.subheader("⚠️ Pending Projects")
+        for idx, row in projects.iterrows():
+            # Determine icon for CSS
+            p_emoji = "🟥" if row['priority'] == 'high' else "🟨" if row['priority'] == 'medium' else "🟩"
+            
+            with st.container(border=True):
+                rc1, rc2 = st.columns([6, 1])
+                
+                with rc1:
+                    st.markdown(f"**{p_emoji} {row['text']}**")
+                    if row['description']:
+                        st.caption(row['description'])
+                with rc2:
+                    st.button("Done", key=f"project_done_{row['id']}", help="Mark as Done",
+                              on_click=update_project_status, args=(row['id'], True))
+            st.divider()
+
+@fragment
+def render_history_heatmap(habit, completions, years):
+    """Year picker and heatmap: switching years redraws only this panel."""
+    year = st.selectbox("Year", years, key="history_year")
+    render_habit_heatmap(habit, completions, year)
+
+@fragment
+def render_history_timeline(habit):
+    """Timeline with its own "Load older" button: each page reruns only this panel."""
+    st.markdown("#### Timeline")
+    # Keyset pages by (habit_id, date): older pages load on demand only
+    load_page = lambda cursor: get_habit_logs_page(habit.id, cursor=cursor, limit=HISTORY_PAGE_SIZE)
+    timeline = get_timeline("history_timeline", load_page, habit.id, get_data_generation())
+    if not timeline["rows"]:
+        st.info("Nothing logged yet.")
+    render_log_timeline(habit, timeline["rows"])
+    render_load_older("history_timeline", load_page)
+
+@fragment
+def render_manage_reminders():
+    # ALL reminders (active + completed) to allow cleanup, one keyset page at a time
+    reminders, next_cursor = get_reminders_page(pending_only=False, cursor=get_page_cursor("manage_rem_pages"))
+    if reminders.empty:
+        st.info("No reminders found.")
+    else:
+        for row in reminders.to_dict('records'):
+            with st.container(border=True):
+                c1, c2 = st.columns([5, 1])
+                with c1:
+                    # Status Icon
+                    is_done = row['is_completed'] == 1
+                    status = "✅" if is_done else "⏳"
+                    priority_icon = "🚨" if row['priority'] == 'high' else "⚠️" if row['priority'] == 'medium' else "🟢"
+                    
+                    st.markdown(f"**{priority_icon} {row['text']}**")
+                    st.caption(" • ".join(filter(None, [
+                        f"Status: {status}", 'Completed' if is_done else 'Pending', reminder_due_caption(row)
+                    ])))
+                    
+                with c2:
+                    st.write("") # Align
+                    st.button("🗑️", key=f"del_rem_{row['id']}", help="Delete Reminder",
+                              on_click=delete_reminder, args=(row['id'],))
+    render_pagination("manage_rem_pages", next_cursor)
+
+@fragment
+def render_manage_projects():
+    from src.data_manager import delete_project
+    projects, next_cursor = get_projects_page(pending_only=False, cursor=get_page_cursor("manage_proj_pages"))
+    if projects.empty:
+        st.info("No projects found.")
+    else:
+        for row in projects.to_dict('records'):
+            with st.container(border=True):
+                c1, c2 = st.columns([5, 1])
+                with c1:
+                    is_done = row['is_completed'] == 1
+                    status = "✅" if is_done else "⏳"
+                    p_emoji = "🟥" if row['priority'] == 'high' else "🟨" if row['priority'] == 'medium' else "🟩"
+                    
+                    st.markdown(f"**{p_emoji} {row['text']}**")
+                    if row['description']:
+                        st.caption(row['description'])
+                    st.caption(f"Status: {status}")
+                    
+                with c2:
+                    st.write("")
+                    st.button("🗑️", key=f"del_proj_{row['id']}", help="Delete Project",
+                              on_click=delete_project, args=(row['id'],))
+    render_pagination("manage_proj_pages", next_cursor)
+
+if selected_tab == "🔥 Dashboard":
+    # --- GAMIFICATION HEADER ---
+    render_progress_header()
+    if rewards.has_unfinished(st.session_state.reward_session):
+        await_rewards()
+    
+    st.divider()
+
+    # --- 0. Projects Section ---
+    render_dashboard_projects()
+
+    # --- 1. Reminders Section ---
+    render_dashboard_reminders()
 
     # --- 2. Habits Section ---
     st.markdown("### Today's Focus")
@@ -170,32 +347,25 @@ if selected_tab == "🔥 Dashboard":
         if suggestions:
              st.info(suggestions[0])
 
-        # Filter for TODAY
-        today = pd.Timestamp.now()
-        today_str = today.strftime("%Y-%m-%d")
-        
-        todays_habits = []
-        for _, habit in habits.iterrows():
-            if is_habit_due(habit, today):
-                todays_habits.append(habit)
+        # Pending for TODAY: one indexed query on habits.next_due_date
+        today = pd.Timestamp.now().normalize()
+        pending_habits = habits_from_df(load_due_habits(today.date()))
         
-        todays_habits_df = pd.DataFrame(todays_habits)
-
+        if pending_habits:
+            day_values = get_day_values(today.date())
+            # Each card is a fragment: Done/+1/Skip rerun only that card (and the
+            # XP header picks up the reward on its next refresh)
+            for habit in pending_habits:
+                render_habit_card(
+                    habit, partial(rewards.complete_habit, session=st.session_state.reward_session),
+                    progress=day_values.get(habit.id, 0),
+                    on_increment=partial(rewards.add_progress, session=st.session_state.reward_session),
+                    on_skip=skip_habit
+                )
         # Filter out Completed (Vanish Effect)
-        if not todays_habits_df.empty:
-            pending_habits = []
-            if logs.empty:
-                 pending_habits = todays_habits_df
-            else:
-                completed_ids = logs[logs['date'].astype(str) == today_str]['habit_id'].unique()
-                pending_habits = todays_habits_df[~todays_habits_df['id'].isin(completed_ids)]
-            
-            if pending_habits.empty:
-                 st.balloons()
-                 st.success("🎉 All habits completed for today! You are crushing it!")
-            else:
-                for index, habit in pending_habits.iterrows():
-                    render_habit_card(habit, logs, log_habit_completion)
+        elif not logs.empty and (logs['date'] == today).any():
+            st.balloons()
+            st.success("🎉 All habits completed for today! You are crushing it!")
         else:
             st.write("No habits scheduled for today.")
 
@@ -222,9 +392,16 @@ elif selected_tab == "📝 Add Reminder":
     def add_reminder_callback():
         text = st.session_state.get("rem_input", "").strip()
         priority = st.session_state.get("rem_priority", "Medium")
+        due_at, recurrence = None, None
+        if st.session_state.get("rem_notify"):
+            due_at = datetime.datetime.combine(st.session_state.rem_due_date, st.session_state.rem_due_time)
+            repeat = st.session_state.get("rem_repeat", "Never")
+            recurrence = None if repeat == "Never" else repeat.lower()
         
         if text:
-            if add_reminder(text, priority.lower()):
+            if add_reminder(text, priority.lower(), due_at=due_at, recurrence=recurrence):
+                if due_at is not None:
+                    notifications.refresh()
                 st.toast("Reminder added successfully! 🚀")
                 st.session_state.rem_input = "" # Clear input safely
             else:
@@ -235,6 +412,16 @@ elif selected_tab == "📝 Add Reminder":
     
     st.text_input("New Reminder", label_visibility="collapsed", placeholder="What needs to be done?", key="rem_input")
 
+    # Optional due time: a desktop/webhook notification fires then (and on every repeat)
+    if st.checkbox("🔔 Notify me", key="rem_notify"):
+        d1, d2, d3 = st.columns(3)
+        with d1:
+            st.date_input("Due date", value=datetime.date.today(), key="rem_due_date")
+        with d2:
+            st.time_input("Due time", value=datetime.time(9, 0), key="rem_due_time")
+        with d3:
+            st.selectbox("Repeat", ["Never"] + [r.capitalize() for r in RECURRENCES], key="rem_repeat")
+
     c1, c2 = st.columns([3, 1],gap="large")
     with c1:
         st.selectbox("Priority", ["High", "Medium", "Low"], label_visibility="collapsed", index=1, key="rem_priority")
@@ -244,26 +431,7 @@ elif selected_tab == "📝 Add Reminder":
     st.divider()
     
     # List Reminders
-    reminders = get_reminders(pending_only=True)
-    if reminders.empty:
-        st.info("No active reminders. You're free! 🎉")
-    else:
-        st.subheader("⚠️ Pending Reminders")
-        for idx, row in reminders.iterrows():
-            # Determine icon for CSS targeting
-            icon = "🚨" if row['priority'] == 'high' else "⚠️" if row['priority'] == 'medium' else "🟢"
-            
-            # Layout: Box with colored background via CSS
-            with st.container(border=True):
-                c1, c2 = st.columns([6, 1])
-                with c1:
-                    # Emoji must be present for :has() selector to work
-                    st.markdown(f"**{icon} {row['text']}**")
-                with c2:
-                    if st.button("Done", key=f"dash_rem_{row['id']}", help="Mark Done"):
-                        update_reminder_status(row['id'], True)
-                        st.rerun()
-        st.divider()
+    render_reminder_list()
 
 elif selected_tab == "🗂️ Add Project":
     st.write("### 🗂️ Add Projects")
@@ -300,39 +468,85 @@ elif selected_tab == "🗂️ Add Project":
     st.divider()
     
     # List Projects
-    projects = get_projects(pending_only=True)
-    if projects.empty:
-        st.info("No active Projects. You're free! 🎉")
-    else:
-        st.subheader("⚠️ Pending Projects")
-        for idx, row in projects.iterrows():
-            # Determine icon for CSS
-            p_emoji = "🟥" if row['priority'] == 'high' else "🟨" if row['priority'] == 'medium' else "🟩"
-            
-            with st.container(border=True):
-                rc1, rc2 = st.columns([6, 1])
-                
-                with rc1:
-                    st.markdown(f"**{p_emoji} {row['text']}**")
-                    if row['description']:
-                        st.caption(row['description'])
-                with rc2:
-                    if st.button("Done", key=f"project_done_{row['id']}", help="Mark as Done"):
-                        update_project_status(row['id'], True)
-                        st.rerun()
-            st.divider()
+    render_project_list()
 
 elif selected_tab == "📊 Analytics":
     habits = load_habits()
     logs = load_logs()
-    render_analytics(habits, logs)
+    # Value totals are grouped in the database; only fetched if a habit has a target
+    value_series = load_value_series(days_back=30) if (habits['target_value'] > 1).any() else None
+    history = load_logs(days_back=ROLLING_HISTORY_DAYS, columns=['habit_id', 'date'])
+    # Misses are counted from the day markers (see get_miss_stats); streaks of
+    # daily/every-N-days habits come back from one window-function query
+    render_analytics(habits, logs, value_series, history, get_miss_stats(days=30), get_streaks())
+
+elif selected_tab == "📖 History":
+    st.write("### 📖 Habit History")
+    habits = habits_from_df(load_habits(active_only=False))
+    if not habits:
+        st.info("No habits yet. Go to 'Add Habit' to start!")
+    else:
+        by_label = {}
+        for h in habits:
+            label = h.name + ("" if h.is_active else " (archived)")
+            by_label[label if label not in by_label else f"{label} #{h.id}"] = h
+        habit = by_label[st.selectbox("Habit", list(by_label), key="history_habit")]
+        # Bitmaps are one row per year; without the store, build them from the dates
+        if bitmaps.ENABLED:
+            completions = get_completion_bitmaps(habit.id)
+        else:
+            dates = load_logs(days_back=None, columns=['date'], habit_id=habit.id)['date']
+            completions = bitmaps.build_year_bitmaps(to_dates(dates))
+
+        today = datetime.date.today()
+        stats = get_habit_stats(habit.id)
+        streaks = bitmaps.streak_stats(habit, completions, today)
+        rate, _ = bitmaps.completion_rate(habit, completions, today - datetime.timedelta(days=29), today)
+        m1, m2, m3, m4 = st.columns(4)
+        m1.metric("Check-ins", stats['count'])
+        m2.metric("Current Streak", streaks['current'])
+        m3.metric("Longest Streak", streaks['longest'])
+        m4.metric("30-day Rate", f"{rate:.0f}%")
+
+        first_year = min([habit.created_at.year if habit.created_at else today.year, *completions])
+        render_history_heatmap(habit, completions, list(range(today.year, first_year - 1, -1)))
+        render_history_timeline(habit)
+
+elif selected_tab == "🔍 Search":
+    st.write("### 🔍 Search")
+    st.caption("Find habits, log notes, reminders and projects.")
+    
+    def reset_search_page():
+        st.session_state.search_page = 1
+    
+    query = st.text_input("Search", placeholder="e.g. zoo, call mom, reading", label_visibility="collapsed", key="search_query", on_change=reset_search_page)
+    page = st.session_state.setdefault("search_page", 1)
+    
+    if query.strip():
+        results = search(query, page=page, page_size=SEARCH_PAGE_SIZE)
+        if results.empty:
+            st.info("No matches found." if page == 1 else "No more results.")
+        else:
+            entity_icons = {"habit": "✨", "log": "📅", "reminder": "📝", "project": "🗂️"}
+            for row in results.to_dict('records'):
+                with st.container(border=True):
+                    st.markdown(f"**{entity_icons.get(row['entity'], '')} {row['title']}**")
+                    st.markdown(row['snippet'])
+        
+        c1, c2 = st.columns(2)
+        with c1:
+            if page > 1:
+                st.button("← Previous", key="search_prev", on_click=lambda: st.session_state.update(search_page=page - 1))
+        with c2:
+            if len(results) == SEARCH_PAGE_SIZE:
+                st.button("Next →", key="search_next", on_click=lambda: st.session_state.update(search_page=page + 1))
 
 elif selected_tab == "⚙️ Settings":
     st.header("⚙️ Habit Management Center")
     st.caption("Manage your data, clear old tasks, and organize your workspace.")
     
     # 3 Sub-tabs for content
-    tab_habits, tab_reminders, tab_projects = st.tabs(["✨ Habits", "📝 Reminders", "🗂️ Projects"])
+    tab_habits, tab_reminders, tab_projects, tab_jobs = st.tabs(["✨ Habits", "📝 Reminders", "🗂️ Projects", "🛠️ Jobs"])
     
     # --- HABITS MANAGEMENT ---
     with tab_habits:
@@ -363,7 +577,7 @@ elif selected_tab == "⚙️ Settings":
                         st.error("Failed to update habit.")
             else:
                 # List Mode
-                for index, habit in habits.iterrows():
+                for habit in habits_from_df(habits):
                     with st.container(border=True):
                         c1, c2 = st.columns([4, 1])
                         with c1:
@@ -384,51 +598,32 @@ elif selected_tab == "⚙️ Settings":
 
     # --- REMINDERS MANAGEMENT ---
     with tab_reminders:
-        # Get ALL reminders (active + completed) to allow cleanup
-        reminders = get_reminders(pending_only=False)
-        if reminders.empty:
-            st.info("No reminders found.")
-        else:
-            for index, row in reminders.iterrows():
-                with st.container(border=True):
-                    c1, c2 = st.columns([5, 1])
-                    with c1:
-                        # Status Icon
-                        is_done = row['is_completed'] == 1
-                        status = "✅" if is_done else "⏳"
-                        priority_icon = "🚨" if row['priority'] == 'high' else "⚠️" if row['priority'] == 'medium' else "🟢"
-                        
-                        st.markdown(f"**{priority_icon} {row['text']}**")
-                        st.caption(f"Status: {status} • {'Completed' if is_done else 'Pending'}")
-                        
-                    with c2:
-                        st.write("") # Align
-                        if st.button("🗑️", key=f"del_rem_{row['id']}", help="Delete Reminder"):
-                            if delete_reminder(row['id']):
-                                st.rerun()
+        render_manage_reminders()
 
     # --- PROJECTS MANAGEMENT ---
     with tab_projects:
-        from src.data_manager import delete_project
-        projects = get_projects(pending_only=False)
-        if projects.empty:
-            st.info("No projects found.")
-        else:
-            for index, row in projects.iterrows():
-                with st.container(border=True):
-                    c1, c2 = st.columns([5, 1])
-                    with c1:
-                        is_done = row['is_completed'] == 1
-                        status = "✅" if is_done else "⏳"
-                        p_emoji = "🟥" if row['priority'] == 'high' else "🟨" if row['priority'] == 'medium' else "🟩"
-                        
-                        st.markdown(f"**{p_emoji} {row['text']}**")
-                        if row['description']:
-                            st.caption(row['description'])
-                        st.caption(f"Status: {status}")
-                        
-                    with c2:
-                        st.write("")
-                        if st.button("🗑️", key=f"del_proj_{row['id']}", help="Delete Project"):
-                            if delete_project(row['id']):
-                                st.rerun()
+        render_manage_projects()
+
+    # --- BACKGROUND JOBS ---
+    with tab_jobs:
+        st.caption("Maintenance runs in the background on these schedules (cron syntax, server time).")
+        jobs = pd.DataFrame(scheduler.status())
+        st.dataframe(
+            jobs[['name', 'schedule', 'next_run', 'last_started', 'last_status', 'last_duration', 'avg_duration', 'runs', 'failures', 'last_error']],
+            hide_index=True, use_container_width=True,
+            column_config={
+                "last_duration": st.column_config.NumberColumn("last (s)", format="%.2f"),
+                "avg_duration": st.column_config.NumberColumn("avg (s)", format="%.2f"),
+            }
+        )
+        c1, c2 = st.columns([3, 1])
+        job_name = c1.selectbox("Job", jobs['name'], label_visibility="collapsed")
+        if c2.button("▶️ Run now", use_container_width=True):
+            with st.spinner(f"Running {job_name}..."):
+                result = scheduler.run_now(job_name)
+            if result == "ok":
+                st.success(f"{job_name} finished.")
+            elif result == "busy":
+                st.info(f"{job_name} is already running in another process.")
+            else:
+                st.error(f"{job_name} failed; see last_error.")
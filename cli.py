@@ -0,0 +1,261 @@
+"""
+Maintenance CLI over the data layer (no Streamlit or plotting imports).
+
+    python cli.py backfill-logs --habit 3 --start 2024-01-01 --end 2024-03-31
+    python cli.py recompute-xp [--dry-run]
+    python cli.py rebuild-streaks
+    python cli.py close-days [--start 2024-01-01 --end 2024-03-31]
+    python cli.py vacuum
+    python cli.py export --what logs --format csv --out logs.csv
+    python cli.py check-schema
+    python cli.py sync [--direction push|pull|both]
+    python cli.py jobs [--history NAME]
+    python cli.py run-job refresh-next-due
+    python cli.py buffer [--retry]
+
+Each command reports its wall time and throughput. Uses the same backend as the
+app (USE_CLOUD_DB / DATABASE_PATH from the environment).
+"""
+import sys
+import time
+import argparse
+import datetime
+from contextlib import contextmanager
+
+from src.data_manager import (
+    BACKEND_NAME, load_habits, load_logs, get_habit, get_user_progress, update_user_progress,
+    bulk_insert_logs, rebuild_completion_bitmaps, refresh_next_due_dates, materialize_missed_days,
+    check_schema, vacuum_db, get_reminders, get_projects
+)
+from src.gamification import replay_total_xp
+from src.models import habits_from_df
+from src.utils import LOG_ALL_COLUMNS, to_date
+
+@contextmanager
+def timed(label):
+    """Print elapsed time and items/s for the block; set stats['items'] inside it."""
+    stats = {"items": 0}
+    start = time.perf_counter()
+    yield stats
+    elapsed = time.perf_counter() - start
+    rate = stats["items"] / elapsed if elapsed > 0 else 0
+    print(f"{label}: {stats['items']} items in {elapsed:.3f}s ({rate:,.0f}/s) [{BACKEND_NAME}]")
+
+def _parse_id(raw):
+    """SQLite ids are ints; Mongo ids are ObjectId strings."""
+    return int(raw) if str(raw).isdigit() else raw
+
+def _date(raw):
+    return datetime.date.fromisoformat(raw)
+
+# --- COMMANDS ---
+
+def cmd_backfill_logs(args):
+    habit = get_habit(_parse_id(args.habit))
+    if habit is None:
+        print(f"Unknown habit {args.habit}", file=sys.stderr)
+        return 1
+    end = args.end or datetime.date.today()
+    days = []
+    day = args.start
+    while day <= end:
+        if args.all_days or habit.is_due(day):
+            days.append(day)
+        day += datetime.timedelta(days=1)
+    with timed("backfill-logs") as stats:
+        stats["items"] = bulk_insert_logs(habit.id, days, status=args.status, value=args.value)
+    print(f"{len(days) - stats['items']} dates already logged, skipped")
+    return 0
+
+def cmd_recompute_xp(args):
+    with timed("recompute-xp") as stats:
+        habits = habits_from_df(load_habits(active_only=False))
+        logs = load_logs(days_back=None, columns=['habit_id', 'date'])
+        dates_by_habit = {}
+        if not logs.empty:
+            for hid, day in zip(logs['habit_id'], logs['date']):
+                dates_by_habit.setdefault(hid, set()).add(to_date(day))
+        total = replay_total_xp(habits, dates_by_habit)
+        stats["items"] = len(logs)
+    current = get_user_progress()['total_xp']
+    print(f"Stored XP: {current}, replayed XP: {total}")
+    if total != current and not args.dry_run:
+        update_user_progress(total - current)
+        print("User progress updated")
+    return 0
+
+def cmd_rebuild_streaks(args):
+    with timed("rebuild-streaks") as stats:
+        stats["items"] = rebuild_completion_bitmaps()
+    with timed("refresh-next-due") as stats:
+        stats["items"] = refresh_next_due_dates(force=True)
+    return 0
+
+def cmd_close_days(args):
+    with timed("close-days") as stats:
+        stats["items"] = materialize_missed_days(args.start, args.end)
+    return 0
+
+def cmd_vacuum(args):
+    with timed("vacuum") as stats:
+        result = vacuum_db()
+        stats["items"] = len(result)
+    for key, value in result.items():
+        print(f"  {key}: {value}")
+    return 0
+
+EXPORTERS = {
+    "habits": lambda: load_habits(active_only=False),
+    "logs": lambda: load_logs(days_back=None, columns=LOG_ALL_COLUMNS),
+    "reminders": lambda: get_reminders(pending_only=False),
+    "projects": lambda: get_projects(pending_only=False),
+}
+
+def cmd_export(args):
+    out = open(args.out, "w", newline="") if args.out else sys.stdout
+    try:
+        with timed(f"export {args.what}") as stats:
+            df = EXPORTERS[args.what]()
+            if args.format == "csv":
+                df.to_csv(out, index=False)
+            else:
+                df.to_json(out, orient="records", lines=True, date_format="iso", default_handler=str)
+            stats["items"] = len(df)
+    finally:
+        if args.out:
+            out.close()
+    return 0
+
+def cmd_check_schema(args):
+    with timed("check-schema") as stats:
+        problems = check_schema()
+        stats["items"] = len(problems)
+    for problem in problems:
+        print(f"  {problem}")
+    print("Schema OK" if not problems else f"{len(problems)} problem(s) found")
+    return 1 if problems else 0
+
+def cmd_sync(args):
+    # Always between the local SQLite file and MONGO_URI, whichever backend the app uses
+    from src import sync
+
+    print(f"{sync.pending_changes()} local change(s) pending")
+    directions = ["pull", "push"] if args.direction == "both" else [args.direction]
+    for direction in directions:
+        with timed(f"sync {direction}") as stats:
+            counts = sync.sync(direction, args.batch_size)[direction]
+            stats["items"] = sum(counts.values())
+        for table, count in counts.items():
+            print(f"  {table}: {count}")
+    return 0
+
+def cmd_jobs(args):
+    from src import scheduler
+
+    if args.history:
+        for run in scheduler.history(args.history, args.limit):
+            duration = f"{run['duration']:.3f}s" if run['duration'] is not None else "-"
+            print(f"{run['started_at']}  {run['status']:<8} {duration:>9}  {run['owner']}  {run['error'] or run['result'] or ''}")
+        return 0
+    for job in scheduler.status():
+        last = f"{job['last_status']} in {job['last_duration']:.3f}s" if job['last_duration'] is not None else (job['last_status'] or "never run")
+        avg = f", avg {job['avg_duration']:.3f}s" if job['avg_duration'] is not None else ""
+        scope = " (per process)" if job['scope'] == "process" else ""
+        print(f"{job['name']:<18} {job['schedule']:<13} next {job['next_run']}  last {last}{avg}  "
+              f"runs {job['runs']} failed {job['failures']}{scope}")
+        if job['last_error']:
+            print(f"  {job['last_error']}")
+    return 0
+
+def cmd_run_job(args):
+    from src import scheduler
+
+    if args.name not in scheduler.job_names():
+        print(f"Unknown job {args.name}; one of: {', '.join(scheduler.job_names())}", file=sys.stderr)
+        return 1
+    with timed(f"run-job {args.name}") as stats:
+        result = scheduler.run_now(args.name)
+        stats["items"] = 1
+    print(f"  {result}")
+    return 0 if result == "ok" else 1
+
+def cmd_buffer(args):
+    # The Mongo write buffer's journal (src/write_buffer.py); empty on other backends
+    from src import write_buffer
+
+    write_buffer.init_journal()
+    if args.retry:
+        with timed("buffer retry") as stats:
+            stats["items"] = write_buffer.retry_failed()
+        print(f"  {stats['items']} failed entr{'y' if stats['items'] == 1 else 'ies'} requeued")
+        return 0
+    state = write_buffer.status()
+    print(f"{state['pending']} pending, {state['failed']} failed")
+    for entry in write_buffer.failed(args.limit):
+        print(f"  #{entry['id']} {entry['op']} {entry['created_at']}  attempts {entry['attempts']}: {entry['last_error']}")
+    return 1 if state['failed'] else 0
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Smart Habit Tracker maintenance CLI")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("backfill-logs", help="Insert logs for a date range (skips dates already logged)")
+    p.add_argument("--habit", required=True, help="Habit id")
+    p.add_argument("--start", required=True, type=_date, help="First date, YYYY-MM-DD")
+    p.add_argument("--end", type=_date, help="Last date, YYYY-MM-DD (default: today)")
+    p.add_argument("--status", default="Completed")
+    p.add_argument("--value", type=int, default=1)
+    p.add_argument("--all-days", action="store_true", help="Log every day, not only due days")
+    p.set_defaults(func=cmd_backfill_logs)
+
+    p = sub.add_parser("recompute-xp", help="Replay all logs and reset total XP to match")
+    p.add_argument("--dry-run", action="store_true")
+    p.set_defaults(func=cmd_recompute_xp)
+
+    p = sub.add_parser("rebuild-streaks", help="Rebuild completion bitmaps and next due dates")
+    p.set_defaults(func=cmd_rebuild_streaks)
+
+    p = sub.add_parser("close-days", help="Record 'Missed' markers for due days left unlogged (idempotent backfill)")
+    p.add_argument("--start", type=_date, help="First date, YYYY-MM-DD (default: 35 days before --end)")
+    p.add_argument("--end", type=_date, help="Last date, YYYY-MM-DD (default and latest: yesterday)")
+    p.set_defaults(func=cmd_close_days)
+
+    p = sub.add_parser("vacuum", help="Analyze and compact the database")
+    p.set_defaults(func=cmd_vacuum)
+
+    p = sub.add_parser("export", help="Export a table as CSV or JSON lines")
+    p.add_argument("--what", choices=sorted(EXPORTERS), default="logs")
+    p.add_argument("--format", choices=["csv", "json"], default="csv")
+    p.add_argument("--out", help="Output file (default: stdout)")
+    p.set_defaults(func=cmd_export)
+
+    p = sub.add_parser("check-schema", help="Report missing tables, columns and indexes")
+    p.set_defaults(func=cmd_check_schema)
+
+    p = sub.add_parser("sync", help="Replicate changes between local SQLite and MongoDB")
+    p.add_argument("--direction", choices=["push", "pull", "both"], default="both",
+                   help="push = SQLite to Mongo, pull = Mongo to SQLite (both pulls first)")
+    p.add_argument("--batch-size", type=int, default=500)
+    p.set_defaults(func=cmd_sync)
+
+    p = sub.add_parser("jobs", help="Show background job schedules, last status and timings")
+    p.add_argument("--history", metavar="NAME", help="Show recent runs of one job")
+    p.add_argument("--limit", type=int, default=20)
+    p.set_defaults(func=cmd_jobs)
+
+    p = sub.add_parser("run-job", help="Run a background job now (skipped if running elsewhere)")
+    p.add_argument("name")
+    p.set_defaults(func=cmd_run_job)
+
+    p = sub.add_parser("buffer", help="Show Mongo write-buffer entries waiting or failed")
+    p.add_argument("--retry", action="store_true", help="Requeue failed entries")
+    p.add_argument("--limit", type=int, default=20)
+    p.set_defaults(func=cmd_buffer)
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    return args.func(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,323 @@
+"""
+Concurrent-session load test for the Streamlit app.
+
+Drives app.py headlessly with Streamlit's AppTest, one script-run thread per
+simulated session, the same way a Streamlit server serves every browser tab
+from one process. Each session repeats a scripted flow:
+
+    open_home        a new session loads the Dashboard
+    complete_habit   click Done (or +1) on a random habit card
+    open_reminders   switch to the Add Reminder tab
+    add_reminder     type a reminder and submit it
+    open_analytics   switch to the Analytics tab
+
+and the run is repeated at increasing concurrency. For each level it reports
+p50/p95/p99 latency per interaction, throughput, database lock errors and
+other app errors (exceptions raised in the script, or "Database Error" lines
+the data layer prints and swallows).
+
+    python loadtest.py                                  # SQLite, 1 2 4 8 sessions
+    python loadtest.py --concurrency 1 4 16 32 --flows 5
+    python loadtest.py --backend mongo                  # mongomock stand-in
+    python loadtest.py --backend mongo --mongo-uri mongodb://localhost:27017
+    python loadtest.py --save load.json
+
+Never touches the app's data: the store is seeded in a temporary directory
+(or a scratch Mongo database that is dropped afterwards) and shared by all
+levels, so later levels run against the reminders earlier ones added.
+Exits 1 when any interaction failed or hit a lock error.
+"""
+import os
+import re
+import sys
+import json
+import time
+import random
+import logging
+import argparse
+import datetime
+import tempfile
+import threading
+from types import SimpleNamespace
+from collections import defaultdict
+from unittest.mock import MagicMock
+
+APP = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+BACKENDS = ("sqlite", "memory", "mongo")
+INTERACTIONS = ("open_home", "complete_habit", "open_reminders", "add_reminder", "open_analytics")
+LOCK_ERROR = re.compile(r"database (table )?is locked|database is busy|SQLITE_BUSY|WriteConflict", re.IGNORECASE)
+# Errors the data layer and workers print (and swallow) instead of raising
+APP_ERROR = re.compile(r"^(Database Error|Error |Failed to |[\w ]+ error: )")
+# Operators mongomock lacks ($setWindowFields, $indexOfArray...); a real mongod has them
+UNSUPPORTED = re.compile(r"not implemented in Mongomock", re.IGNORECASE)
+# Habit card buttons: "Done" is btn_<id>, "+1" on measurable habits is btn_inc_<id>
+# (ids are integers on SQLite/memory, ObjectId hex on Mongo)
+HABIT_BUTTON = re.compile(r"btn_(inc_)?[0-9a-f]+$")
+
+# --- STORE SETUP ---
+
+def _isolate(workdir, backend, mongo_uri):
+    """Point every store at `workdir` before any src module reads its config."""
+    os.environ.update({
+        "DATABASE_PATH": os.path.join(workdir, "habits.db"),
+        "MEMORY_SNAPSHOT_PATH": os.path.join(workdir, "habits.snapshot"),
+        "WRITE_BUFFER_PATH": os.path.join(workdir, "mongo_journal.db"),
+        "REWARD_QUEUE_PATH": os.path.join(workdir, "reward_queue.db"),
+        "SCHEDULER_PATH": os.path.join(workdir, "scheduler.db"),
+        "MONGO_URI": f"{(mongo_uri or 'mongodb://loadtest').rstrip('/')}/habit_loadtest_{os.getpid()}",
+        "USE_CLOUD_DB": "true" if backend == "mongo" else "false",
+        "DB_BACKEND": backend,
+        # Only the request path is measured; no password gate or background jobs
+        "APP_PASSWORD": "",
+        "SCHEDULER_ENABLED": "false",
+        "NOTIFICATIONS_ENABLED": "false",
+    })
+
+def _use_mongo(mongo_uri):
+    """Hand db_mongo a mongomock client (or one on `mongo_uri`) shared by every session."""
+    import pymongo
+    if mongo_uri:
+        client = pymongo.MongoClient(mongo_uri, serverSelectionTimeoutMS=3000)
+    else:
+        try:
+            import mongomock
+        except ImportError:
+            raise RuntimeError("pip install mongomock, or pass --mongo-uri")
+        client = mongomock.MongoClient()
+    # db_mongo builds its client from MONGO_URI at import; it stays patched for the run
+    pymongo.MongoClient = lambda *args, **kwargs: client
+    return client
+
+def seed(habits, days, rng):
+    """Daily habits (half measurable, so +1 never runs out) with `days` of history."""
+    from src import data_manager
+    today = datetime.date.today()
+    for i in range(habits):
+        measurable = i % 2 == 1
+        data_manager.add_habit({
+            "name": f"{'Steps' if measurable else 'Read'} {i + 1}", "category": "Health" if measurable else "Learning",
+            "frequency_type": "daily", "frequency_value": None,
+            "target_value": 10000 if measurable else 1, "target_unit": "steps" if measurable else "times",
+        })
+    for habit_id in data_manager.load_habits(columns=["id"])["id"]:
+        dates = [today - datetime.timedelta(days=d) for d in range(days, 0, -1) if rng.random() < 0.7]
+        data_manager.bulk_insert_logs(habit_id, dates)
+    for i in range(habits // 2):
+        data_manager.add_reminder(f"Seed reminder {i + 1}", ["low", "medium", "high"][i % 3])
+    return data_manager.BACKEND_NAME
+
+# --- ERROR TAP ---
+
+class ErrorTap:
+    """
+    Stand-in for sys.stdout/stderr that counts lock and other error lines.
+    The data layer prints and swallows database errors, so they never reach AppTest.
+    """
+
+    def __init__(self, stream, counts, echo):
+        self.stream, self.counts, self.echo = stream, counts, echo
+
+    def write(self, text):
+        for line in text.splitlines():
+            if APP_ERROR.search(line):
+                self.counts.hit("lock_errors" if LOCK_ERROR.search(line) else "app_errors")
+        if self.echo:
+            self.stream.write(text)
+        return len(text)
+
+    def flush(self):
+        self.stream.flush()
+
+# --- SESSIONS ---
+
+class LevelStats:
+    """Latencies and error counts for one concurrency level (shared by its sessions)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    def hit(self, kind):
+        with self._lock:
+            self.errors[kind] += 1
+
+    def timed(self, name, action):
+        """Run one interaction; returns its AppTest, or None if it failed."""
+        start = time.perf_counter()
+        try:
+            at = action()
+        except Exception as e:
+            self.hit("lock_errors" if LOCK_ERROR.search(str(e)) else "failures")
+            print(f"{name} failed: {type(e).__name__}: {e}", file=sys.__stderr__)
+            return None
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self.latencies[name].append(elapsed)
+        for exc in at.exception:
+            if UNSUPPORTED.search(exc.value):
+                self.hit("unsupported")
+            else:
+                self.hit("lock_errors" if LOCK_ERROR.search(exc.value) else "app_errors")
+        if not at.main.children and not at.sidebar.children:
+            # Script failed to compile or stopped before rendering anything
+            self.hit("failures")
+            print(f"{name} failed: empty page", file=sys.__stderr__)
+            return None
+        return at
+
+def _share_server_state():
+    """
+    AppTest gives every run a fresh mock Runtime (cleared afterwards) and every
+    session its own script cache. Concurrent runs then break each other, and
+    st.cache_data and the compiled script are thrown away between runs. Share one
+    of each across all sessions instead, as a real server does.
+    """
+    from streamlit.runtime import Runtime
+    from streamlit.runtime.caching.storage.dummy_cache_storage import MemoryCacheStorageManager
+    from streamlit.runtime.media_file_manager import MediaFileManager
+    from streamlit.runtime.memory_media_file_storage import MemoryMediaFileStorage
+    from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+    from streamlit.testing.v1 import app_test, local_script_runner
+    runtime = MagicMock(spec=Runtime)
+    runtime.media_file_mgr = MediaFileManager(MemoryMediaFileStorage("/mock/media"))
+    runtime.cache_storage_manager = MemoryCacheStorageManager()
+    Runtime._instance = runtime
+    # AppTest's per-run install/teardown now lands on a throwaway namespace
+    app_test.Runtime = SimpleNamespace()
+    script_cache = ScriptCache()
+    local_script_runner.ScriptCache = lambda: script_cache
+
+def _goto(at, tab):
+    return at.radio[0].set_value(tab).run()
+
+def _add_reminder(at, text):
+    at.text_input(key="rem_input").input(text)
+    return next(b for b in at.button if b.label == "Add Reminder").click().run()
+
+def run_session(stats, session, args, start_gate):
+    from streamlit.testing.v1 import AppTest
+    rng = random.Random(args.seed * 1000 + session)
+    start_gate.wait()
+    for flow in range(args.flows):
+        at = stats.timed("open_home", lambda: AppTest.from_file(APP, default_timeout=args.timeout).run())
+        if at is None:
+            continue
+        for _ in range(args.clicks):
+            buttons = [b for b in at.button if HABIT_BUTTON.match(b.key or "") and not b.disabled]
+            if buttons:
+                at = stats.timed("complete_habit", lambda: rng.choice(buttons).click().run()) or at
+        if stats.timed("open_reminders", lambda: _goto(at, "📝 Add Reminder")) is not None:
+            stats.timed("add_reminder", lambda: _add_reminder(at, f"Load test s{session} f{flow}"))
+        stats.timed("open_analytics", lambda: _goto(at, "📊 Analytics"))
+        if args.think:
+            time.sleep(rng.uniform(0, 2 * args.think))
+
+def run_level(concurrency, args):
+    stats = LevelStats()
+    tap_out, tap_err = ErrorTap(sys.__stdout__, stats, args.verbose), ErrorTap(sys.__stderr__, stats, True)
+    start_gate = threading.Barrier(concurrency + 1)
+    threads = [
+        threading.Thread(target=run_session, args=(stats, s, args, start_gate), name=f"session-{s}", daemon=True)
+        for s in range(concurrency)
+    ]
+    sys.stdout, sys.stderr = tap_out, tap_err
+    try:
+        for t in threads:
+            t.start()
+        start_gate.wait()
+        start = time.perf_counter()
+        for t in threads:
+            t.join()
+        wall = time.perf_counter() - start
+    finally:
+        sys.stdout, sys.stderr = sys.__stdout__, sys.__stderr__
+    interactions = sum(len(v) for v in stats.latencies.values())
+    return {
+        "concurrency": concurrency,
+        "seconds": wall,
+        "interactions": interactions,
+        "throughput": interactions / wall if wall else 0.0,
+        "lock_errors": stats.errors["lock_errors"],
+        "app_errors": stats.errors["app_errors"],
+        "failures": stats.errors["failures"],
+        "unsupported": stats.errors["unsupported"],
+        "latency_ms": {name: summarize(stats.latencies[name]) for name in INTERACTIONS if stats.latencies[name]},
+    }
+
+# --- REPORT ---
+
+def percentile(values, q):
+    """Nearest-rank percentile of a non-empty list."""
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * q // 100))
+    return ordered[int(rank) - 1]
+
+def summarize(seconds):
+    ms = [s * 1000 for s in seconds]
+    return {"n": len(ms), "p50": percentile(ms, 50), "p95": percentile(ms, 95), "p99": percentile(ms, 99), "max": max(ms)}
+
+def print_report(levels, backend):
+    print(f"\nBackend: {backend}")
+    stand_in = any(r["unsupported"] for r in levels)
+    header = f"{'sessions':>8}{'interactions':>14}{'wall s':>9}{'req/s':>8}{'lock err':>10}{'app err':>9}{'failed':>8}"
+    header += f"{'n/a':>6}" if stand_in else ""
+    print(header)
+    print("-" * len(header))
+    for r in levels:
+        row = (f"{r['concurrency']:>8}{r['interactions']:>14}{r['seconds']:>9.1f}{r['throughput']:>8.2f}"
+               f"{r['lock_errors']:>10}{r['app_errors']:>9}{r['failures']:>8}")
+        print(row + (f"{r['unsupported']:>6}" if stand_in else ""))
+    if stand_in:
+        print("n/a: runs that hit an operator mongomock lacks (use --mongo-uri for a real mongod)")
+    width = max(len(i) for i in INTERACTIONS) + 2
+    for r in levels:
+        print(f"\n{r['concurrency']} session(s), latency ms")
+        print(f"{'interaction':<{width}}{'n':>6}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}")
+        for name, s in r["latency_ms"].items():
+            print(f"{name:<{width}}{s['n']:>6}{s['p50']:>10.1f}{s['p95']:>10.1f}{s['p99']:>10.1f}{s['max']:>10.1f}")
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Drive app.py with concurrent headless sessions and report latency")
+    parser.add_argument("--backend", choices=BACKENDS, default="sqlite")
+    parser.add_argument("--mongo-uri", help="Real mongod for the mongo backend (default: mongomock)")
+    parser.add_argument("--concurrency", nargs="+", type=int, default=[1, 2, 4, 8], help="Simultaneous sessions per level")
+    parser.add_argument("--flows", type=int, default=3, help="Flows per session")
+    parser.add_argument("--clicks", type=int, default=2, help="Habit completions per flow")
+    parser.add_argument("--habits", type=int, default=12)
+    parser.add_argument("--days", type=int, default=90, help="Days of seeded history")
+    parser.add_argument("--think", type=float, default=0.0, help="Mean pause between flows (seconds)")
+    parser.add_argument("--timeout", type=float, default=120, help="Per-run AppTest timeout (seconds)")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--save", help="Write the results to this JSON file")
+    parser.add_argument("--verbose", action="store_true", help="Echo the app's stdout")
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    with tempfile.TemporaryDirectory(prefix="habit-loadtest-") as workdir:
+        _isolate(workdir, args.backend, args.mongo_uri)
+        client = _use_mongo(args.mongo_uri) if args.backend == "mongo" else None
+        start = time.perf_counter()
+        backend = seed(args.habits, args.days, random.Random(args.seed))
+        print(f"{backend}: seeded {args.habits} habits in {time.perf_counter() - start:.2f}s", file=sys.stderr)
+        _share_server_state()
+        if not args.verbose:
+            # Script exceptions are counted from AppTest; don't print each traceback
+            logging.getLogger("streamlit.error_util").setLevel(logging.CRITICAL)
+        levels = []
+        try:
+            for concurrency in args.concurrency:
+                levels.append(run_level(concurrency, args))
+                print(f"{concurrency} session(s): {levels[-1]['seconds']:.1f}s", file=sys.stderr)
+        finally:
+            if client is not None:
+                client.drop_database(f"habit_loadtest_{os.getpid()}")
+    print_report(levels, backend)
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump({"backend": backend, "levels": levels}, f, indent=2)
+    return 1 if any(r["lock_errors"] or r["failures"] for r in levels) else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,618 @@
+"""
+Cross-backend parity and performance harness.
+
+Runs one scenario (habits, backfilled logs, completions, progress, reminders,
+projects, search) against every data backend, each on a throwaway store, and
+prints per-operation latency and query counts side by side. Results are
+normalized (ids mapped to names, dates to ISO strings, numeric types unified,
+timestamps dropped) and compared against the first backend.
+
+    python parity.py                               # sqlite, memory, mongo (mongomock)
+    python parity.py --mongo-uri mongodb://localhost:27017
+    python parity.py --habits 24 --days 365 --repeat 5
+    python parity.py --save baseline.json
+    python parity.py --baseline baseline.json --tolerance 1.5
+
+Exits 1 when a result differs between backends, or when an operation is slower
+than the baseline by more than `--tolerance` (or issues more queries).
+Never touches the app's data: DATABASE_PATH, snapshots and journals point to a
+temporary directory, and Mongo runs against a mongomock client or, with
+--mongo-uri, a scratch database that is dropped afterwards.
+"""
+import os
+import sys
+import json
+import time
+import random
+import sqlite3
+import argparse
+import datetime
+import tempfile
+import importlib
+import threading
+import statistics
+import dataclasses
+
+BACKENDS = ("sqlite", "memory", "mongo")
+MODULES = {"sqlite": "src.db_sqlite", "memory": "src.db_memory", "mongo": "src.db_mongo"}
+
+# Differ by clock/backend by design; never compared
+VOLATILE = {"created_at", "timestamp", "updated_at", "notified_at"}
+
+# name, category, frequency_type, frequency_value, target_value
+TEMPLATES = [
+    ("Read", "Learning", "daily", None, 1),
+    ("Run", "Health", "days_of_week", "Mon,Wed,Fri", 1),
+    ("Water", "Health", "daily", None, 8),
+    ("Review week", "Work", "weekly", "Sun", 1),
+    ("Budget", "Finance", "monthly", "15", 1),
+    ("Call family", "Social", "biweekly", "Sat", 1),
+    ("Stretch", "Health", "custom", "3", 1),
+    ("Journal", "Mindfulness", "daily", None, 1),
+]
+
+# --- BACKEND SETUP ---
+
+def _isolate(workdir):
+    """Point every store at `workdir` before any src module reads its config."""
+    os.environ.update({
+        "DATABASE_PATH": os.path.join(workdir, "habits.db"),
+        "MEMORY_SNAPSHOT_PATH": os.path.join(workdir, "habits.snapshot"),
+        "WRITE_BUFFER_PATH": os.path.join(workdir, "mongo_journal.db"),
+        "REWARD_QUEUE_PATH": os.path.join(workdir, "reward_queue.db"),
+        # Apply Mongo writes synchronously so results are comparable at once
+        "MONGO_WRITE_BUFFER": "false",
+        "MONGO_URI": f"mongodb://parity/habit_parity_{os.getpid()}",
+        "USE_CLOUD_DB": "false",
+        "DB_BACKEND": "sqlite",
+    })
+
+class QueryCounter:
+    """Statements sent to SQLite and collection calls sent to Mongo, per backend."""
+
+    def __init__(self):
+        self.count = 0
+        self._local = threading.local()
+
+    def sqlite(self, statement):
+        # Trigger bodies are reported as "-- TRIGGER name"; they are not round trips
+        if not statement.startswith("--"):
+            self.count += 1
+
+    def wrap(self, method):
+        def counted(*args, **kwargs):
+            # find_one calls find internally: count the outermost call only
+            depth = getattr(self._local, "depth", 0)
+            if depth == 0:
+                self.count += 1
+            self._local.depth = depth + 1
+            try:
+                return method(*args, **kwargs)
+            finally:
+                self._local.depth = depth
+        return counted
+
+MONGO_METHODS = (
+    "find", "find_one", "find_one_and_update", "find_one_and_delete", "aggregate",
+    "count_documents", "estimated_document_count", "distinct", "insert_one", "insert_many",
+    "update_one", "update_many", "replace_one", "delete_one", "delete_many", "bulk_write",
+)
+
+def _count_sqlite(counter):
+    from src import database, db_sqlite
+    connect = database.get_db_connection
+
+    def traced_connection():
+        conn = connect()
+        conn.set_trace_callback(counter.sqlite)
+        return conn
+
+    database.get_db_connection = traced_connection
+    db_sqlite.get_db_connection = traced_connection
+
+def _import_mongo(mongo_uri):
+    """Import db_mongo against mongomock, or a scratch database on `mongo_uri`."""
+    import pymongo
+    real_client = pymongo.MongoClient
+    if mongo_uri:
+        client = real_client(mongo_uri, serverSelectionTimeoutMS=3000)
+    else:
+        try:
+            import mongomock
+        except ImportError:
+            raise RuntimeError("pip install mongomock, or pass --mongo-uri")
+        client = mongomock.MongoClient()
+    # db_mongo builds its client from MONGO_URI at import; hand it ours instead
+    pymongo.MongoClient = lambda *args, **kwargs: client
+    try:
+        return importlib.import_module(MODULES["mongo"])
+    finally:
+        pymongo.MongoClient = real_client
+
+def load_backend(name, counter, mongo_uri=None):
+    if name == "mongo":
+        module = _import_mongo(mongo_uri)
+        collection_class = type(module.get_db().habits)
+        for method in MONGO_METHODS:
+            if hasattr(collection_class, method):
+                setattr(collection_class, method, counter.wrap(getattr(collection_class, method)))
+        return module
+    module = importlib.import_module(MODULES[name])
+    if name == "sqlite":
+        _count_sqlite(counter)
+    return module
+
+def drop_backend(name, module):
+    if name == "mongo":
+        module.CLIENT.drop_database(module.DB.name)
+
+# --- NORMALIZATION ---
+
+def plain(value):
+    """Backend-neutral form of a result: builtins only, dates as ISO strings (SQLite's 'YYYY-MM-DD HH:MM:SS')."""
+    import pandas as pd
+    if isinstance(value, sqlite3.Row):
+        value = dict(value)
+    if dataclasses.is_dataclass(value) and not isinstance(value, type):
+        value = {f.name: getattr(value, f.name) for f in dataclasses.fields(value) if f.name != "freq"}
+    if isinstance(value, dict):
+        return {str(plain(k)): plain(v) for k, v in value.items() if k not in VOLATILE}
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return [plain(v) for v in value]
+    if isinstance(value, pd.DataFrame):
+        return [plain(r) for r in value.to_dict("records")]
+    if value is None or (not isinstance(value, (str, bytes)) and pd.isna(value)):
+        return None
+    if hasattr(value, "item"):
+        value = value.item()
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, (datetime.datetime, pd.Timestamp)):
+        return value.date().isoformat() if value.time() == datetime.time() else value.isoformat(sep=" ")
+    if isinstance(value, datetime.date):
+        return value.isoformat()
+    if isinstance(value, (int, float, str)):
+        return value
+    return str(value)
+
+class Context:
+    """Per-backend ids of the scenario's entities, and their backend-neutral labels."""
+
+    def __init__(self, db, today, rng):
+        self.db = db
+        self.today = today
+        self.rng = rng
+        self.habits = {}
+        self.labels = {"habit": {}, "log": {}, "reminder": {}, "project": {}}
+        self.completed = []
+
+    def label(self, kind, value):
+        value = plain(value)
+        if kind == "log" and value not in self.labels["log"]:
+            self.refresh_logs()
+        return self.labels[kind].get(value, f"?{value}")
+
+    def refresh_logs(self):
+        logs = self.db.load_logs(days_back=None, columns=["id", "habit_id", "date"], include_partial=True)
+        for row in plain(logs):
+            self.labels["log"][row["id"]] = f"{self.label('habit', row['habit_id'])}@{row['date']}"
+
+    def refresh(self, kind, frame, key):
+        for row in plain(frame):
+            self.labels[kind][row["id"]] = row[key]
+
+    def frame(self, df, ids=None, ordered=False):
+        """Records of `df` with id columns replaced by labels ({column: kind})."""
+        ids = ids or {}
+        rows = []
+        for row in plain(df):
+            rows.append({k: (self.label(ids[k], v) if k in ids and v is not None else v) for k, v in row.items()})
+        return rows if ordered else sorted(rows, key=lambda r: json.dumps(r, sort_keys=True, default=str))
+
+# --- SCENARIO ---
+
+@dataclasses.dataclass
+class Step:
+    name: str
+    run: object                 # run(ctx) -> raw result (timed)
+    norm: object = None         # norm(raw, ctx) -> comparable result (untimed)
+    calls: object = 1           # int, or calls(ctx) for per-entity steps
+    read_only: bool = False     # repeated for timing
+    compare: bool = True
+    mongomock: bool = True      # False where mongomock lacks the feature ($text)
+
+# mongomock raises NotImplementedError for operators it lacks ($dateFromString, ...)
+UNSUPPORTED = "unsupported by mongomock"
+
+def _habit_specs(count):
+    specs = []
+    for i in range(count):
+        name, category, ftype, fvalue, target = TEMPLATES[i % len(TEMPLATES)]
+        suffix = f" {i // len(TEMPLATES) + 1}" if i >= len(TEMPLATES) else ""
+        specs.append({"name": name + suffix, "category": category, "frequency_type": ftype,
+                      "frequency_value": fvalue, "target_value": target})
+    return specs
+
+def _measurable(ctx):
+    return [n for n in sorted(ctx.habits) if ctx.db.get_habit(ctx.habits[n]).target_value > 1]
+
+def _simple(ctx):
+    return [n for n in sorted(ctx.habits) if ctx.db.get_habit(ctx.habits[n]).target_value == 1]
+
+def _add_habits(ctx, specs):
+    for spec in specs:
+        ctx.db.add_habit(dict(spec))
+    ctx.refresh("habit", ctx.db.load_habits(active_only=False, columns=["id", "name"]), "name")
+    ctx.habits = {name: hid for hid, name in ctx.labels["habit"].items()}
+    return len(specs)
+
+def _backfill(ctx, days):
+    inserted = {}
+    for name in sorted(ctx.habits):
+        habit = ctx.db.get_habit(ctx.habits[name])
+        dates = []
+        for offset in range(days, 0, -1):
+            day = ctx.today - datetime.timedelta(days=offset)
+            # Backdated: the habit existed for the whole window
+            if habit.freq.valid and _due(habit, day) and ctx.rng.random() < 0.7:
+                dates.append(day)
+        inserted[name] = ctx.db.bulk_insert_logs(habit.id, dates)
+    return inserted
+
+def _due(habit, day):
+    return dataclasses.replace(habit, created_at=day - datetime.timedelta(days=365)).is_due(day)
+
+def _record_today(ctx):
+    names = _simple(ctx)[:3]
+    log_ids = [ctx.db.record_completion(ctx.db.get_habit(ctx.habits[n]), ctx.today) for n in names]
+    ctx.completed = list(zip(names, log_ids))
+    return log_ids
+
+def _rewards(ctx):
+    return [ctx.db.process_completion_rewards(ctx.habits[n], ctx.today, log_id) for n, log_id in ctx.completed]
+
+def _progress(ctx):
+    name = _measurable(ctx)[0]
+    habit = ctx.db.get_habit(ctx.habits[name])
+    return [ctx.db.log_progress(habit, ctx.today, amount=3, notes="glass of water") for _ in range(3)]
+
+def _old_completions(ctx, days):
+    day = ctx.today - datetime.timedelta(days=days + 7)
+    return [ctx.db.log_habit_completion(ctx.habits[n], day, notes=f"Caught up on {n.lower()} reading")
+            for n in _simple(ctx)[:2]]
+
+def _skips(ctx):
+    # Today and two days ago (past days fall outside each habit's created_at, so
+    # materialize_missed_days has nothing to close in this scenario)
+    days = [ctx.today, ctx.today - datetime.timedelta(days=2)]
+    return [ctx.db.skip_habit(ctx.db.get_habit(ctx.habits[n]), day, notes="rest day")
+            for n in _simple(ctx)[3:5] for day in days]
+
+def _complete_skipped(ctx):
+    name = _simple(ctx)[3]
+    return [ctx.db.record_completion(ctx.db.get_habit(ctx.habits[name]), ctx.today - datetime.timedelta(days=2))]
+
+def _due_at(ctx, i):
+    # Every fifth reminder has a due time, spread from yesterday to tomorrow
+    if i % 5:
+        return None
+    return datetime.datetime.combine(ctx.today, datetime.time(9, 30)) + datetime.timedelta(hours=5 * (i // 5) - 24)
+
+def _add_reminders(ctx, count):
+    from src.utils import RECURRENCES
+    for i in range(count):
+        due_at = _due_at(ctx, i)
+        recurrence = RECURRENCES[(i // 5) % len(RECURRENCES)] if due_at and i % 10 == 0 else None
+        ctx.db.add_reminder(f"Reminder {i:03d} renew library books", ["low", "medium", "high"][i % 3],
+                            due_at=due_at, recurrence=recurrence)
+    for i in range(count // 3):
+        ctx.db.add_project(f"Project {i:03d}", f"Reading plan part {i}", "medium")
+    ctx.refresh("reminder", ctx.db.get_reminders(pending_only=False), "text")
+    ctx.refresh("project", ctx.db.get_projects(pending_only=False), "text")
+    return count + count // 3
+
+def _entity_ids(ctx, kind):
+    return sorted(ctx.labels[kind], key=lambda i: ctx.labels[kind][i])
+
+def _update_reminders(ctx):
+    reminders, projects = _entity_ids(ctx, "reminder"), _entity_ids(ctx, "project")
+    results = [ctx.db.update_reminder_status(rid) for rid in reminders[::4]]
+    results += [ctx.db.delete_reminder(reminders[1])]
+    results += [ctx.db.update_project_status(projects[0])] if projects else []
+    results += [ctx.db.delete_project(projects[-1])] if len(projects) > 1 else []
+    return results
+
+def _due_until(ctx):
+    return datetime.datetime.combine(ctx.today, datetime.time(12))
+
+def _claim_reminders(ctx):
+    # Fire the two soonest due reminders (a recurring one moves on), then a stale repeat claim
+    from src import notifications
+    due = ctx.db.get_due_reminders(_due_until(ctx), limit=2)
+    results = []
+    for r in due:
+        nxt = notifications.next_occurrence(r["due_at"], r["recurrence"], _due_until(ctx)) if r["recurrence"] else None
+        results.append(ctx.db.claim_reminder(r["id"], r["due_at"], nxt))
+    if due:
+        results.append(ctx.db.claim_reminder(due[0]["id"], due[0]["due_at"]))
+    return results
+
+def _reminder_pages(ctx, limit=10):
+    pages, cursor = [], None
+    while True:
+        df, cursor = ctx.db.get_reminders_page(pending_only=True, cursor=cursor, limit=limit)
+        pages.append(df)
+        if cursor is None:
+            return pages
+
+def _history_pages(ctx, limit=10):
+    # Every habit's timeline, page by page (day markers have no log label, so ids are dropped)
+    walks = {}
+    for name in sorted(ctx.habits):
+        pages, cursor = [], None
+        while True:
+            df, cursor = ctx.db.get_habit_logs_page(ctx.habits[name], cursor=cursor, limit=limit)
+            pages.append(df.drop(columns=["id"]))
+            if cursor is None:
+                break
+        walks[name] = pages
+    return walks
+
+def _edit_and_delete(ctx):
+    names = sorted(ctx.habits)
+    edited = {"name": names[0] + " daily", "category": "Learning", "frequency_type": "daily",
+              "frequency_value": None, "target_value": 1}
+    return [ctx.db.edit_habit(ctx.habits[names[0]], edited), ctx.db.delete_habit(ctx.habits[names[-1]])]
+
+def build_scenario(args):
+    specs = _habit_specs(args.habits)
+    each = lambda ctx: len(ctx.habits)
+    habit_ids = lambda ctx: [ctx.habits[n] for n in sorted(ctx.habits)]
+    L = lambda kind: (lambda raw, ctx: [ctx.label(kind, v) if v is not None else None for v in raw])
+    by_habit = lambda raw, ctx: dict(zip(sorted(ctx.habits), plain(raw)))
+    logs = {"id": "log", "habit_id": "habit"}
+    return [
+        # Writes (timed once)
+        Step("add_habit", lambda ctx: _add_habits(ctx, specs), calls=len(specs)),
+        Step("bulk_insert_logs", lambda ctx: _backfill(ctx, args.days), calls=each),
+        Step("record_completion", _record_today, L("log"), calls=3),
+        Step("record_completion (duplicate)", lambda ctx: [ctx.db.record_completion(ctx.db.get_habit(ctx.habits[n]), ctx.today) for n, _ in ctx.completed], calls=3),
+        Step("process_completion_rewards", _rewards, calls=3),
+        Step("log_progress", _progress,
+             lambda raw, ctx: [{**plain(r), "log_id": ctx.label("log", r["log_id"])} if r else r for r in raw], calls=3),
+        Step("log_habit_completion", lambda ctx: _old_completions(ctx, args.days), calls=2),
+        Step("skip_habit", _skips, lambda raw, ctx: [v is not None for v in raw], calls=4),
+        Step("record_completion (skipped day)", _complete_skipped, L("log")),
+        Step("materialize_missed_days", lambda ctx: ctx.db.materialize_missed_days()),
+        Step("add_reminder/add_project", lambda ctx: _add_reminders(ctx, args.reminders), calls=args.reminders + args.reminders // 3),
+        Step("update/delete reminders+projects", _update_reminders, calls=lambda ctx: len(_entity_ids(ctx, "reminder")[::4]) + 3),
+        Step("claim_reminder", _claim_reminders, calls=3),
+        Step("edit_habit/delete_habit", _edit_and_delete, calls=2),
+        Step("save_model_state", lambda ctx: ctx.db.save_model_state("parity", {"weights": [0.5, 1.5], "n": 3})),
+        Step("rebuild_completion_bitmaps", lambda ctx: ctx.db.rebuild_completion_bitmaps()),
+        Step("refresh_next_due_dates (force)", lambda ctx: ctx.db.refresh_next_due_dates(ctx.today, force=True)),
+        # Reads (repeated for timing)
+        Step("get_habit", lambda ctx: [ctx.db.get_habit(h) for h in habit_ids(ctx)],
+             lambda raw, ctx: [{**plain(h), "id": ctx.label("habit", h.id)} for h in raw], calls=each, read_only=True),
+        Step("load_habits (all)", lambda ctx: ctx.db.load_habits(active_only=False),
+             lambda raw, ctx: ctx.frame(raw, {"id": "habit"}), read_only=True),
+        Step("load_habits (active)", lambda ctx: ctx.db.load_habits(),
+             lambda raw, ctx: ctx.frame(raw, {"id": "habit"}), read_only=True),
+        Step("load_due_habits", lambda ctx: ctx.db.load_due_habits(ctx.today),
+             lambda raw, ctx: ctx.frame(raw, {"id": "habit"}), read_only=True),
+        Step("load_logs (30 days)", lambda ctx: ctx.db.load_logs(30),
+             lambda raw, ctx: ctx.frame(raw, logs), read_only=True),
+        Step("load_logs (all, partial)", lambda ctx: ctx.db.load_logs(None, include_partial=True),
+             lambda raw, ctx: ctx.frame(raw, logs), read_only=True),
+        Step("load_logs (one habit)", lambda ctx: ctx.db.load_logs(None, habit_id=habit_ids(ctx)[0]),
+             lambda raw, ctx: ctx.frame(raw, logs), read_only=True),
+        Step("load_log_notes", lambda ctx: ctx.db.load_log_notes(list(ctx.labels["log"])),
+             lambda raw, ctx: {ctx.label("log", k): v for k, v in raw.items()}, read_only=True),
+        Step("get_day_values", lambda ctx: ctx.db.get_day_values(ctx.today),
+             lambda raw, ctx: {ctx.label("habit", k): plain(v) for k, v in raw.items()}, read_only=True),
+        Step("load_value_series (week)", lambda ctx: ctx.db.load_value_series(args.days, "week"),
+             lambda raw, ctx: ctx.frame(raw, {"habit_id": "habit"}), read_only=True),
+        Step("load_value_series (month)", lambda ctx: ctx.db.load_value_series(None, "month", include_partial=False),
+             lambda raw, ctx: ctx.frame(raw, {"habit_id": "habit"}), read_only=True),
+        Step("get_habit_bitmap_stats", lambda ctx: [ctx.db.get_habit_bitmap_stats(ctx.db.get_habit(h), ctx.today) for h in habit_ids(ctx)],
+             by_habit, calls=each, read_only=True),
+        Step("get_habit_logs_page (walk)", _history_pages,
+             lambda raw, ctx: {n: [ctx.frame(df, ordered=True) for df in pages] for n, pages in raw.items()},
+             calls=each, read_only=True),
+        Step("get_habit_stats", lambda ctx: [ctx.db.get_habit_stats(h) for h in habit_ids(ctx)],
+             by_habit, calls=each, read_only=True),
+        Step("get_miss_stats", lambda ctx: ctx.db.get_miss_stats(30, ctx.today),
+             lambda raw, ctx: ctx.frame(raw, {"habit_id": "habit"}), read_only=True),
+        Step("get_streaks", lambda ctx: ctx.db.get_streaks(ctx.today),
+             lambda raw, ctx: ctx.frame(raw, {"habit_id": "habit"}), read_only=True, mongomock=False),
+        Step("get_user_progress", lambda ctx: ctx.db.get_user_progress(), read_only=True),
+        Step("load_model_state", lambda ctx: ctx.db.load_model_state("parity"), read_only=True),
+        Step("search_entities", lambda ctx: ctx.db.search_entities(["reading"], ["habit", "log", "reminder", "project"], 50, 0),
+             lambda raw, ctx: sorted(f"{r['entity']}:{ctx.label(r['entity'], r['id'])}" for r in plain(raw)),
+             read_only=True, mongomock=False),
+        Step("get_reminders", lambda ctx: ctx.db.get_reminders(pending_only=False),
+             lambda raw, ctx: ctx.frame(raw, {"id": "reminder"}), read_only=True),
+        Step("get_reminders_page (walk)", _reminder_pages,
+             lambda raw, ctx: [ctx.frame(df, {"id": "reminder"}, ordered=True) for df in raw], read_only=True),
+        Step("get_due_reminders", lambda ctx: ctx.db.get_due_reminders(_due_until(ctx) + datetime.timedelta(days=1)),
+             lambda raw, ctx: [{**plain(r), "id": ctx.label("reminder", r["id"])} for r in raw], read_only=True),
+        Step("get_projects", lambda ctx: ctx.db.get_projects(),
+             lambda raw, ctx: ctx.frame(raw, {"id": "project"}), read_only=True),
+        Step("get_data_generation", lambda ctx: ctx.db.get_data_generation(), read_only=True, compare=False),
+        Step("check_schema", lambda ctx: ctx.db.check_schema(), read_only=True),
+    ]
+
+# --- RUN ---
+
+def run_backend(name, args):
+    counter = QueryCounter()
+    db = load_backend(name, counter, args.mongo_uri)
+    ctx = Context(db, datetime.date.today(), random.Random(args.seed))
+    stand_in = name == "mongo" and not args.mongo_uri
+    results = {}
+    try:
+        for step in build_scenario(args):
+            counter.count = 0
+            start = time.perf_counter()
+            try:
+                if stand_in and not step.mongomock:
+                    raise NotImplementedError(step.name)
+                raw = step.run(ctx)
+                error = None
+            except NotImplementedError as e:
+                if not stand_in:
+                    raise
+                raw, error = None, UNSUPPORTED
+            except Exception as e:
+                raw, error = None, f"error: {type(e).__name__}: {e}"
+            elapsed = [time.perf_counter() - start]
+            queries = counter.count
+            calls = step.calls(ctx) if callable(step.calls) else step.calls
+            if step.read_only and error is None:
+                for _ in range(args.repeat - 1):
+                    start = time.perf_counter()
+                    step.run(ctx)
+                    elapsed.append(time.perf_counter() - start)
+            value = error or (step.norm or (lambda raw, ctx: plain(raw)))(raw, ctx)
+            results[step.name] = {
+                "ms": statistics.median(elapsed) * 1000 / max(1, calls),
+                "queries": None if name == "memory" else queries / max(1, calls),
+                "value": value,
+                "compare": step.compare,
+                "calls": calls,
+            }
+    finally:
+        drop_backend(name, db)
+    return results
+
+def _first_difference(a, b, path=""):
+    if type(a) != type(b):
+        return f"{path or 'result'}: {_short(a)} != {_short(b)}"
+    if isinstance(a, dict):
+        for key in sorted(set(a) | set(b)):
+            if key not in a or key not in b:
+                return f"{path}.{key}: {'missing' if key not in a else _short(a[key])} != {'missing' if key not in b else _short(b[key])}"
+            diff = _first_difference(a[key], b[key], f"{path}.{key}")
+            if diff:
+                return diff
+        return None
+    if isinstance(a, list):
+        if len(a) != len(b):
+            return f"{path or 'result'}: {len(a)} items != {len(b)} items"
+        for i, (x, y) in enumerate(zip(a, b)):
+            diff = _first_difference(x, y, f"{path}[{i}]")
+            if diff:
+                return diff
+        return None
+    return None if a == b else f"{path or 'result'}: {_short(a)} != {_short(b)}"
+
+def _short(value, width=60):
+    text = json.dumps(value, default=str)
+    return text if len(text) <= width else text[:width] + "…"
+
+def compare(results, backends):
+    """{step: [(backend, difference)]} against the first backend."""
+    reference = backends[0]
+    diffs = {}
+    for step, ref in results[reference].items():
+        if not ref["compare"]:
+            continue
+        for other in backends[1:]:
+            if UNSUPPORTED in (ref["value"], results[other][step]["value"]):
+                continue
+            diff = _first_difference(ref["value"], results[other][step]["value"])
+            if diff:
+                diffs.setdefault(step, []).append((other, diff))
+    return diffs
+
+def regressions(results, baseline, tolerance, min_ms=0.2):
+    """Operations slower than baseline * tolerance, or issuing more queries."""
+    found = []
+    for backend, steps in results.items():
+        for step, now in steps.items():
+            before = baseline.get(backend, {}).get(step)
+            if before is None:
+                continue
+            if now["ms"] > before["ms"] * tolerance and now["ms"] - before["ms"] > min_ms:
+                found.append(f"{backend} {step}: {before['ms']:.3f} -> {now['ms']:.3f} ms/call")
+            if now["queries"] is not None and before.get("queries") is not None and now["queries"] > before["queries"] + 1e-9:
+                found.append(f"{backend} {step}: {before['queries']:g} -> {now['queries']:g} queries/call")
+    return found
+
+def print_report(results, backends, diffs):
+    steps = list(results[backends[0]])
+    width = max(len(s) for s in steps) + 2
+    header = f"{'operation':<{width}}{'calls':>6}" + "".join(f"{b + ' ms':>12}" for b in backends)
+    header += "".join(f"{b + ' q':>10}" for b in backends if b != "memory") + "  parity"
+    print(header)
+    print("-" * len(header))
+    for step in steps:
+        row = f"{step:<{width}}{results[backends[0]][step]['calls']:>6}"
+        for b in backends:
+            r = results[b][step]
+            if r["value"] == UNSUPPORTED:
+                row += f"{'n/a':>12}"
+            elif isinstance(r["value"], str) and r["value"].startswith("error:"):
+                row += f"{'error':>12}"
+            else:
+                row += f"{r['ms']:>12.3f}"
+        for b in backends:
+            if b != "memory":
+                r = results[b][step]
+                row += f"{'-':>10}" if r["value"] == UNSUPPORTED else f"{r['queries']:>10.1f}"
+        skipped = [b for b in backends if results[b][step]["value"] == UNSUPPORTED]
+        if not results[backends[0]][step]["compare"]:
+            row += "  -"
+        elif step in diffs:
+            row += "  DIFF " + ", ".join(b for b, _ in diffs[step])
+        else:
+            row += "  ok" + (f" ({', '.join(skipped)} n/a)" if skipped else "")
+        print(row)
+    for step, found in diffs.items():
+        for backend, diff in found:
+            print(f"\n{step} [{backends[0]} vs {backend}]\n  {diff}")
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Run one scenario against every backend and compare")
+    parser.add_argument("--backends", nargs="+", choices=BACKENDS, default=list(BACKENDS),
+                        help="Backends to run; results are compared against the first")
+    parser.add_argument("--mongo-uri", help="Real mongod for the mongo backend (default: mongomock)")
+    parser.add_argument("--habits", type=int, default=len(TEMPLATES))
+    parser.add_argument("--days", type=int, default=120, help="Days of backfilled history")
+    parser.add_argument("--reminders", type=int, default=24)
+    parser.add_argument("--repeat", type=int, default=3, help="Timing runs per read (median is reported)")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--save", help="Write timings and query counts to this JSON file")
+    parser.add_argument("--baseline", help="Compare timings and query counts with a saved run")
+    parser.add_argument("--tolerance", type=float, default=1.5, help="Allowed slowdown factor vs baseline")
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="habit-parity-") as workdir:
+        _isolate(workdir)
+        for backend in args.backends:
+            start = time.perf_counter()
+            results[backend] = run_backend(backend, args)
+            print(f"{backend}: scenario in {time.perf_counter() - start:.2f}s", file=sys.stderr)
+    diffs = compare(results, args.backends)
+    print_report(results, args.backends, diffs)
+
+    timings = {b: {s: {"ms": r["ms"], "queries": r["queries"]} for s, r in steps.items()} for b, steps in results.items()}
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(timings, f, indent=2)
+    slow = []
+    if args.baseline:
+        with open(args.baseline) as f:
+            slow = regressions(timings, json.load(f), args.tolerance)
+        print(f"\n{len(slow)} regression(s) vs {args.baseline}")
+        for line in slow:
+            print(f"  {line}")
+    return 1 if diffs or slow else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
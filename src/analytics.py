@@ -1,8 +1,22 @@
+import numpy as np
 import pandas as pd
 import streamlit as st
 import plotly.express as px
 from datetime import timedelta
-from src.utils import is_habit_due
+from src.models import Habit, habits_from_df
+from src.utils import to_dates
+from src import chart_data, bitmaps
+from src.ui_components import fragment
+
+ROLLING_WINDOWS = (7, 30, 90)
+# Enough history for the longest window and its momentum (previous window)
+ROLLING_HISTORY_DAYS = 2 * max(ROLLING_WINDOWS)
+
+def _as_records(habits):
+    """Accept a habits DataFrame or a list of Habit records."""
+    if isinstance(habits, pd.DataFrame):
+        return habits_from_df(habits)
+    return habits
 
 def calculate_streaks(habit, habit_logs):
     """
@@ -11,26 +25,23 @@ def calculate_streaks(habit, habit_logs):
     if habit_logs.empty:
         return 0
     
+    habit = Habit.from_row(habit)
     today = pd.Timestamp.now().date()
-    try:
-        created_at = pd.to_datetime(habit['created_at']).date()
-    except:
-        return 0
-        
-    if created_at > today: return 0
+    created_at = habit.created_at
+    if created_at is None or created_at > today: return 0
 
     # Get all dates where habit was due, up to today
     due_dates = []
     curr = created_at
     while curr <= today:
-        if is_habit_due(habit, curr):
+        if habit.is_due(curr):
             due_dates.append(curr)
         curr += timedelta(days=1)
         
     if not due_dates: return 0
     
     due_dates.sort(reverse=True)
-    logged_dates = set(pd.to_datetime(habit_logs['date']).dt.date)
+    logged_dates = set(to_dates(habit_logs['date']))
     
     streak = 0
     for d in due_dates:
@@ -47,18 +58,15 @@ def calculate_completion_rate(habit, habit_logs):
     """
     Calculate completion percentage: (Days Completed / Days Due) * 100
     """
+    habit = Habit.from_row(habit)
     today = pd.Timestamp.now().date()
-    try:
-        created_at = pd.to_datetime(habit['created_at']).date()
-    except:
-        return 0.0, 0
-    
-    if created_at > today: return 0.0, 0
+    created_at = habit.created_at
+    if created_at is None or created_at > today: return 0.0, 0
     
     total_due = 0
     curr = created_at
     while curr <= today:
-        if is_habit_due(habit, curr):
+        if habit.is_due(curr):
             total_due += 1
         curr += timedelta(days=1)
         
@@ -68,52 +76,123 @@ def calculate_completion_rate(habit, habit_logs):
     pct = min(100.0, (completed_count / total_due) * 100)
     return pct, total_due
 
-def calculate_missed_habits(habits, logs, days=30):
+def calculate_missed_habits(habits, miss_stats, days=30):
     """
-    Identify habits missed most frequently in the last X days.
+    Identify habits missed most frequently in the last X days (today is not over yet).
+    `miss_stats` (from get_miss_stats) holds the counts; due days come from the due
+    bitmaps, and skipped days don't count against the miss rate.
     """
     today = pd.Timestamp.now().date()
     start_date = today - timedelta(days=days)
+    stats = {str(row.habit_id): row for row in miss_stats.itertuples(index=False)}
     
     missed_data = []
-    
-    for _, habit in habits.iterrows():
-        missed_count = 0
-        total_due = 0
-        
-        # Determine habit start (cannot miss before created)
-        try:
-            h_created = pd.to_datetime(habit['created_at']).date()
-        except:
-            h_created = start_date
-            
-        check_start = max(start_date, h_created)
-        
-        # Iterate days
-        curr = check_start
-        habit_logs = logs[logs['habit_id'] == habit['id']]
-        logged_dates = set(pd.to_datetime(habit_logs['date']).dt.date) if not habit_logs.empty else set()
-        
-        while curr < today: # Don't count today as missed yet
-            if is_habit_due(habit, curr):
-                total_due += 1
-                if curr not in logged_dates:
-                    missed_count += 1
-            curr += timedelta(days=1)
-            
-        if missed_count > 0:
-            missed_data.append({
-                "Habit": habit['name'],
-                "Missed": missed_count,
-                "Total Due": total_due,
-                "Miss Rate": (missed_count/total_due*100) if total_due > 0 else 0
-            })
+    for habit in _as_records(habits):
+        row = stats.get(str(habit.id))
+        if row is None or not row.missed:
+            continue
+        _, total_due = bitmaps.completion_rate(habit, {}, start_date, today - timedelta(days=1))
+        counted = max(total_due - int(row.skipped), int(row.missed))
+        missed_data.append({
+            "Habit": habit.name,
+            "Missed": int(row.missed),
+            "Skipped": int(row.skipped),
+            "Total Due": total_due,
+            "Miss Rate": row.missed / counted * 100
+        })
             
     df = pd.DataFrame(missed_data)
     if "Missed" in df.columns:
         return df.sort_values("Missed", ascending=False)
     return df
 
+# --- ROLLING METRICS ---
+# Due and completed days form (habits x days) bool matrices; one cumulative sum
+# per matrix gives every window's counts as a difference of two columns, so all
+# windows, dates and habits cost one O(habits * days) pass.
+
+def _due_matrix(habits, start, days):
+    """Bool (habits x days) matrix of due days from the cached yearly due bitmaps."""
+    due = np.zeros((len(habits), days), dtype=bool)
+    end = start + timedelta(days=days - 1)
+    for row, habit in enumerate(habits):
+        due_bits, _ = bitmaps.window_bitmaps(habit, {}, start, end)
+        due[row] = bitmaps.to_array(due_bits, days)
+    return due
+
+def _done_matrix(habits, logs, start, days):
+    """Bool (habits x days) matrix of logged days, filled with one vectorized scatter."""
+    done = np.zeros((len(habits), days), dtype=bool)
+    if logs.empty:
+        return done
+    row_of = {habit.id: row for row, habit in enumerate(habits)}
+    rows = logs['habit_id'].map(row_of)
+    offsets = (pd.to_datetime(logs['date']) - pd.Timestamp(start)).dt.days
+    mask = rows.notna() & (offsets >= 0) & (offsets < days)
+    done[rows[mask].astype(int).to_numpy(), offsets[mask].to_numpy()] = True
+    return done
+
+def _window_rates(hit_cs, due_cs, window):
+    """Rolling rate (%) ending at each day from padded cumulative sums; NaN if nothing was due."""
+    hits = hit_cs[..., window:] - hit_cs[..., :-window]
+    due = due_cs[..., window:] - due_cs[..., :-window]
+    # Windows that reach before the first day are shorter, not skipped
+    lead_hits = hit_cs[..., 1:window]
+    lead_due = due_cs[..., 1:window]
+    hits = np.concatenate([lead_hits, hits], axis=-1)
+    due = np.concatenate([lead_due, due], axis=-1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(due > 0, hits / due * 100, np.nan)
+
+def calculate_rolling_rates(habits, logs, today=None, windows=ROLLING_WINDOWS, history_days=ROLLING_HISTORY_DAYS):
+    """
+    Rolling completion rates for every day of the last `history_days`.
+    `logs` must cover that span. Today's due day only counts once it is done.
+    Returns (dates, habit_ids, {window: (habits x days) array}, {window: aggregate array}).
+    """
+    habits = _as_records(habits)
+    today = today or pd.Timestamp.now().date()
+    start = today - timedelta(days=history_days - 1)
+    due = _due_matrix(habits, start, history_days)
+    done = _done_matrix(habits, logs, start, history_days)
+    hit = due & done
+    due[:, -1] &= done[:, -1]
+
+    pad = np.zeros((len(habits), 1), dtype=np.int32)
+    hit_cs = np.concatenate([pad, hit.cumsum(axis=1, dtype=np.int32)], axis=1)
+    due_cs = np.concatenate([pad, due.cumsum(axis=1, dtype=np.int32)], axis=1)
+    per_habit, overall = {}, {}
+    for w in windows:
+        per_habit[w] = _window_rates(hit_cs, due_cs, w)
+        overall[w] = _window_rates(hit_cs.sum(axis=0), due_cs.sum(axis=0), w)
+    dates = pd.date_range(start, periods=history_days, freq="D")
+    return dates, [h.id for h in habits], per_habit, overall
+
+def _momentum(series, window):
+    """Change in the rolling rate versus one window earlier (percentage points)."""
+    if series.shape[-1] <= window:
+        return np.full(series.shape[:-1], np.nan)
+    return series[..., -1] - series[..., -1 - window]
+
+def rolling_summary(habits, logs, today=None, spark_window=30, spark_days=90):
+    """
+    Per-habit table: 7/30/90-day rates, 30-day momentum and a sparkline series
+    of the 30-day rate over the last `spark_days`. Also returns the aggregate rates frame.
+    """
+    habits = _as_records(habits)
+    dates, habit_ids, per_habit, overall = calculate_rolling_rates(habits, logs, today)
+    momentum = _momentum(per_habit[spark_window], spark_window)
+    spark = np.nan_to_num(per_habit[spark_window][:, -spark_days:], nan=0.0).round(1)
+
+    table = pd.DataFrame({"Name": [h.name for h in habits]})
+    for w in ROLLING_WINDOWS:
+        table[f"{w}d"] = per_habit[w][:, -1]
+    table["Momentum"] = momentum
+    table["Trend"] = list(spark)
+
+    aggregate = pd.DataFrame({f"{w}d": overall[w] for w in ROLLING_WINDOWS}, index=dates)
+    return table, aggregate
+
 def get_day_of_week_stats(logs):
     """
     Return total completions by day of week (Mon=0, Sun=6).
@@ -121,17 +200,42 @@ def get_day_of_week_stats(logs):
     if logs.empty:
         return pd.DataFrame()
         
-    df = logs.copy()
-    df['date'] = pd.to_datetime(df['date'])
-    df['day_name'] = df['date'].dt.day_name()
+    dates = logs['date'] if pd.api.types.is_datetime64_any_dtype(logs['date']) else pd.to_datetime(logs['date'])
     # Ensure correct order
     days_order = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
     
-    stats = df['day_name'].value_counts().reindex(days_order, fill_value=0).reset_index()
+    stats = dates.dt.day_name().value_counts().reindex(days_order, fill_value=0).reset_index()
     stats.columns = ['Day', 'Completions']
     return stats
 
-def render_analytics(habits, logs):
+@fragment
+def render_trend_panel():
+    """
+    Long-range trend with its own grouping/range pickers. A fragment: changing
+    them reruns only this panel, not the rest of the analytics page.
+    """
+    st.markdown("### 📈 Long-range Trend")
+    t1, t2 = st.columns(2)
+    bucket_label = t1.radio("Group by", list(chart_data.BUCKETS), index=list(chart_data.BUCKETS).index(chart_data.DEFAULT_BUCKET),
+                            horizontal=True, key="trend_bucket")
+    range_label = t2.radio("Range", list(chart_data.TREND_RANGES), index=list(chart_data.TREND_RANGES).index(chart_data.DEFAULT_RANGE),
+                           horizontal=True, key="trend_range")
+    # Aggregated in the database, downsampled and cached per data generation
+    trend = chart_data.trend_series(chart_data.BUCKETS[bucket_label], chart_data.TREND_RANGES[range_label])
+    if not trend.empty:
+        fig = px.line(trend, x='date', y='completions', markers=len(trend) < 60)
+        fig.update_layout(xaxis_title=None, yaxis_title="Completed days", height=300)
+        st.plotly_chart(fig, use_container_width=True)
+    else:
+        st.info("Not enough data to show a trend yet.")
+
+def render_analytics(habits, logs, value_series=None, history=None, miss_stats=None, streaks=None):
+    """
+    `value_series` (from load_value_series) feeds the measurable-habits section;
+    `history` is logs covering ROLLING_HISTORY_DAYS for the rolling-rate columns;
+    `miss_stats` (from get_miss_stats) feeds Top Struggles;
+    `streaks` (from get_streaks) covers daily/every-N-days habits, the rest use calculate_streaks.
+    """
     if habits.empty:
         st.info("No data yet. Start tracking habits!")
         return
@@ -148,12 +252,17 @@ def render_analytics(habits, logs):
     
     # Calculate per-habit metrics for table
     metrics = []
-    for _, habit in habits.iterrows():
-        habit_logs = logs[logs['habit_id'] == habit['id']]
-        streak = calculate_streaks(habit, habit_logs)
+    logs_by_habit = dict(tuple(logs.groupby('habit_id', observed=True))) if not logs.empty else {}
+    empty_logs = logs.iloc[0:0]
+    current_streaks = dict(zip(streaks['habit_id'].tolist(), streaks['current'].tolist())) if streaks is not None else {}
+    for habit in _as_records(habits):
+        habit_logs = logs_by_habit.get(habit.id, empty_logs)
+        streak = current_streaks.get(habit.id)
+        if streak is None:
+            streak = calculate_streaks(habit, habit_logs)
         rate, _ = calculate_completion_rate(habit, habit_logs)
         metrics.append({
-            "Name": habit['name'],
+            "Name": habit.name,
             "Streak": streak,
             "Completion Rate": rate
         })
@@ -170,7 +279,7 @@ def render_analytics(habits, logs):
     with c1:
         st.markdown("### ⚠️ Top Struggles (Last 30 Days)")
         st.caption("Habits you missed the most recently.")
-        missed_df = calculate_missed_habits(habits, logs)
+        missed_df = calculate_missed_habits(habits, miss_stats) if miss_stats is not None else pd.DataFrame()
         
         if not missed_df.empty:
             st.dataframe(
@@ -200,8 +309,90 @@ def render_analytics(habits, logs):
     # --- 3. HABIT PERFORMANCE TABLE ---
     st.markdown("### 🏆 Habit Leaderboard")
     if not df_metrics.empty:
+        rate_columns = {}
+        if history is not None:
+            rolling, aggregate = rolling_summary(habits, history)
+            df_metrics = pd.concat([df_metrics, rolling.drop(columns="Name")], axis=1)
+            rate_columns = {
+                **{f"{w}d": st.column_config.NumberColumn(f"{w}d", format="%.0f%%") for w in ROLLING_WINDOWS},
+                "Momentum": st.column_config.NumberColumn("Momentum", format="%+.0f pts", help="30-day rate vs. the 30 days before"),
+                "Trend": st.column_config.LineChartColumn("30d rate (90 days)", y_min=0, y_max=100),
+            }
         st.dataframe(
             df_metrics.sort_values("Completion Rate", ascending=False).style.format({"Completion Rate": "{:.1f}%"}),
             use_container_width=True,
-            hide_index=True
+            hide_index=True,
+            column_config=rate_columns
         )
+        if history is not None:
+            st.caption("Rolling completion rate, all habits")
+            st.line_chart(aggregate, height=200)
+
+    # --- 4. LONG-RANGE TREND ---
+    st.divider()
+    render_trend_panel()
+
+    # --- 5. MEASURABLE HABITS ---
+    measurable = [h for h in _as_records(habits) if h.target_value > 1]
+    if measurable and value_series is not None and not value_series.empty:
+        st.divider()
+        st.markdown("### 📏 Measurable Habits")
+        st.caption("Daily totals against each habit's target.")
+        for habit in measurable:
+            series = value_series[value_series['habit_id'] == habit.id]
+            if series.empty:
+                continue
+            fig = px.bar(series, x='date', y='value', title=f"{habit.name} ({habit.target_unit})")
+            fig.add_hline(y=habit.target_value, line_dash="dash", annotation_text="Target")
+            fig.update_layout(xaxis_title=None, yaxis_title=None, height=250)
+            st.plotly_chart(fig, use_container_width=True)
+
+# --- HABIT HISTORY ---
+# The heatmap is drawn from the habit's completion bitmaps (one small row per
+# year, maintained on write) and its due bitmap, so a year costs the same
+# whatever the length of the habit's history.
+
+HEATMAP_WEEKDAYS = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
+# Not due, due but not done, done
+HEATMAP_COLORS = [[0.0, "#262730"], [0.5, "#FF6B6B"], [1.0, "#00C853"]]
+
+def calendar_grid(habit, completions, year, today=None):
+    """
+    Weekday x week grid for `year` (rows Mon..Sun): 2 done, 1 due but not done,
+    0 not due; NaN outside the year, after today, or before the habit existed
+    (unless done then). Returns (grid, dates) with ISO date labels per cell.
+    """
+    today = today or pd.Timestamp.now().date()
+    start = pd.Timestamp(year, 1, 1).date()
+    end = min(pd.Timestamp(year, 12, 31).date(), today)
+    grid = np.full((7, 54), np.nan)
+    labels = np.full((7, 54), "", dtype=object)
+    if end < start:
+        return grid, labels
+    days = (end - start).days + 1
+    due, done = bitmaps.window_bitmaps(habit, completions, start, end)
+    done_a = bitmaps.to_array(done, days)
+    cells = np.where(done_a, 2.0, np.where(bitmaps.to_array(due, days), 1.0, 0.0))
+    if habit.created_at and habit.created_at > start:
+        before = min(days, (habit.created_at - start).days)
+        cells[:before][~done_a[:before]] = np.nan
+    pos = np.arange(days) + start.weekday()
+    grid[pos % 7, pos // 7] = cells
+    labels[pos % 7, pos // 7] = [str(d.date()) for d in pd.date_range(start, periods=days)]
+    return grid, labels
+
+def render_habit_heatmap(habit, completions, year):
+    """Calendar heatmap of one habit's year."""
+    grid, labels = calendar_grid(habit, completions, year)
+    fig = px.imshow(
+        grid, y=HEATMAP_WEEKDAYS, zmin=0, zmax=2,
+        color_continuous_scale=HEATMAP_COLORS, aspect="auto"
+    )
+    fig.update_traces(customdata=labels, hovertemplate="%{customdata}<extra></extra>", xgap=3, ygap=3)
+    fig.update_layout(
+        coloraxis_showscale=False, height=220, margin=dict(l=0, r=0, t=10, b=0),
+        xaxis=dict(showticklabels=False, showgrid=False), yaxis=dict(showgrid=False),
+        plot_bgcolor="rgba(0,0,0,0)"
+    )
+    st.plotly_chart(fig, use_container_width=True)
+    st.caption("🟩 done  •  🟥 due, not done  •  ⬛ not due")
@@ -0,0 +1,135 @@
+import os
+import datetime
+import numpy as np
+from functools import lru_cache
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Optional store: set USE_BITMAP_STORE=false to skip maintaining bitmaps on write.
+# After re-enabling, run rebuild_completion_bitmaps() to backfill from logs.
+ENABLED = os.getenv("USE_BITMAP_STORE", "true").lower() == "true"
+
+# --- COMPLETION BITMAPS ---
+# One bit per day of the year (bit 0 = Jan 1), stored little-endian.
+# 366 bits fit in 46 bytes, so a habit's year of history is a single small BLOB.
+# Due bitmaps are derived from the habit's frequency and paired with the stored
+# completion bitmaps, so streaks and rates become AND + popcount on Python ints.
+
+YEAR_BYTES = 46
+
+def day_index(day):
+    """Return (year, bit index) for a date."""
+    return day.year, day.timetuple().tm_yday - 1
+
+def to_int(blob):
+    return int.from_bytes(blob or b"", "little")
+
+def to_blob(bits):
+    return bits.to_bytes(YEAR_BYTES, "little")
+
+def set_day(blob, day):
+    """Return `blob` with the bit for `day` set."""
+    _, idx = day_index(day)
+    return to_blob(to_int(blob) | (1 << idx))
+
+def to_array(bits, length):
+    """Unpack a bitmap int into a bool array of `length` days (index 0 = bit 0)."""
+    nbytes = max(1, (length + 7) // 8)
+    raw = np.frombuffer((bits & ((1 << length) - 1)).to_bytes(nbytes, "little"), dtype=np.uint8)
+    return np.unpackbits(raw, bitorder="little")[:length].astype(bool)
+
+def build_year_bitmaps(dates):
+    """Group dates into {year: int} completion bitmaps."""
+    years = {}
+    for d in dates:
+        year, idx = day_index(d)
+        years[year] = years.get(year, 0) | (1 << idx)
+    return years
+
+@lru_cache(maxsize=4096)
+def due_bitmap(habit, year):
+    """Bitmap of the days in `year` on which `habit` (a Habit record) is due."""
+    bits = 0
+    day = datetime.date(year, 1, 1)
+    if habit.created_at and habit.created_at.year > year:
+        return 0
+    if habit.created_at and habit.created_at.year == year:
+        day = habit.created_at
+    one_day = datetime.timedelta(days=1)
+    while day.year == year:
+        if habit.is_due(day):
+            bits |= 1 << (day.timetuple().tm_yday - 1)
+        day += one_day
+    return bits
+
+def _window(year_bits, start, end):
+    """Combine per-year bitmaps into one int where bit 0 is `start`, masked to `end`."""
+    combined = 0
+    for year in range(start.year, end.year + 1):
+        bits = year_bits(year)
+        if not bits:
+            continue
+        offset = (datetime.date(year, 1, 1) - start).days
+        combined |= bits << offset if offset >= 0 else bits >> -offset
+    return combined & ((1 << ((end - start).days + 1)) - 1)
+
+def window_bitmaps(habit, completions, start, end):
+    """Return (due, done) bitmaps for [start, end]; `completions` is {year: int}."""
+    due = _window(lambda y: due_bitmap(habit, y), start, end)
+    done = _window(lambda y: completions.get(y, 0), start, end)
+    return due, done
+
+def due_days(habit, start, end):
+    """Dates in [start, end] on which `habit` is due (from its creation date on)."""
+    due, _ = window_bitmaps(habit, {}, start, end)
+    days = []
+    while due:
+        low = due & -due
+        days.append(start + datetime.timedelta(days=low.bit_length() - 1))
+        due ^= low
+    return days
+
+def streak_stats(habit, completions, today=None):
+    """
+    Current and longest streak of consecutive due days completed.
+    Same rule as analytics.calculate_streaks: today only breaks the streak once it is over.
+    """
+    today = today or datetime.date.today()
+    start = habit.created_at or (min(datetime.date(y, 1, 1) for y in completions) if completions else today)
+    if start > today:
+        return {"current": 0, "longest": 0}
+
+    due, done = window_bitmaps(habit, completions, start, today)
+    hit = due & done
+    missed = due & ~done
+    today_bit = 1 << (today - start).days
+    missed_before_today = missed & ~today_bit
+
+    last_miss = missed_before_today.bit_length() - 1
+    current = (hit >> (last_miss + 1)).bit_count() if last_miss >= 0 else hit.bit_count()
+
+    # Longest run: completed due days between consecutive misses
+    longest, lower = 0, 0
+    remaining = missed
+    while remaining:
+        low = remaining & -remaining
+        pos = low.bit_length() - 1
+        run = ((hit >> lower) & ((1 << (pos - lower)) - 1)).bit_count()
+        longest = max(longest, run)
+        lower = pos + 1
+        remaining ^= low
+    longest = max(longest, (hit >> lower).bit_count(), current)
+    return {"current": current, "longest": longest}
+
+def completion_rate(habit, completions, start, end):
+    """Percent of due days in [start, end] that were completed, and the due count."""
+    if habit.created_at and habit.created_at > start:
+        start = habit.created_at
+    if start > end:
+        return 0.0, 0
+    due, done = window_bitmaps(habit, completions, start, end)
+    total_due = due.bit_count()
+    if total_due == 0:
+        return 0.0, 0
+    return (due & done).bit_count() / total_due * 100, total_due
@@ -0,0 +1,108 @@
+import os
+import datetime
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# --- CHART DATA ---
+# Plot-ready series for long-range charts. Buckets are aggregated in the database
+# (load_value_series), long series are downsampled with LTTB to a point budget,
+# and results are cached per log generation so reruns with unchanged data are free.
+
+MAX_POINTS = int(os.getenv("CHART_MAX_POINTS", 500))
+BUCKETS = {"Daily": "day", "Weekly": "week", "Monthly": "month"}
+# Trend range label -> days back (None = all history)
+TREND_RANGES = {"90 days": 90, "1 year": 365, "All time": None}
+# What the Analytics trend panel opens with (and the nightly warm-up fills)
+DEFAULT_BUCKET, DEFAULT_RANGE = "Weekly", "1 year"
+CACHE_SIZE = 32
+
+_cache = OrderedDict()
+
+def lttb(x, y, threshold):
+    """
+    Largest-Triangle-Three-Buckets: indices of `threshold` points that keep the
+    visual shape of (x, y). First and last points are always kept.
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+
+    # Interior points split into threshold - 2 buckets
+    edges = np.linspace(1, n - 1, threshold - 1).astype(int)
+    selected = np.empty(threshold, dtype=int)
+    selected[0], selected[-1] = 0, n - 1
+    prev = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        # Average of the next bucket (or the last point) is the third vertex
+        if i + 2 < len(edges):
+            nxt = slice(edges[i + 1], edges[i + 2])
+            avg_x, avg_y = x[nxt].mean(), y[nxt].mean()
+        else:
+            avg_x, avg_y = x[-1], y[-1]
+        bx, by = x[start:end], y[start:end]
+        area = np.abs((x[prev] - avg_x) * (by - y[prev]) - (x[prev] - bx) * (avg_y - y[prev]))
+        prev = start + int(area.argmax())
+        selected[i + 1] = prev
+    return selected
+
+def downsample(df, x_col="date", y_col="value", max_points=MAX_POINTS):
+    """Return `df` (sorted by x_col) reduced to at most max_points rows via LTTB."""
+    if len(df) <= max_points:
+        return df
+    df = df.sort_values(x_col)
+    x = df[x_col]
+    if pd.api.types.is_datetime64_any_dtype(x):
+        x = x.astype("int64")
+    return df.iloc[lttb(x.to_numpy(), df[y_col].to_numpy(), max_points)]
+
+def _cached(key, build):
+    """Memoize build() under key + current log generation (small LRU)."""
+    from src.data_manager import get_data_generation
+
+    # Relative windows move with the calendar, so the day is part of the key
+    key = key + (get_data_generation(), datetime.date.today())
+    if key in _cache:
+        _cache.move_to_end(key)
+        return _cache[key]
+    result = build()
+    _cache[key] = result
+    if len(_cache) > CACHE_SIZE:
+        _cache.popitem(last=False)
+    return result
+
+def trend_series(bucket="week", days_back=None, per_habit=False, max_points=MAX_POINTS):
+    """
+    Completed days and logged value per bucket, across all habits or per habit.
+    Returns a DataFrame: [habit_id,] date, completions, value (each series <= max_points).
+    """
+    from src.data_manager import load_value_series
+
+    def build():
+        df = load_value_series(days_back=days_back, bucket=bucket, include_partial=False)
+        if df.empty:
+            return pd.DataFrame(columns=(['habit_id'] if per_habit else []) + ['date', 'completions', 'value'])
+        df = df.rename(columns={'days_logged': 'completions'})
+        if not per_habit:
+            df = df.groupby('date', as_index=False)[['completions', 'value']].sum()
+            return downsample(df, 'date', 'completions', max_points).reset_index(drop=True)
+        parts = [
+            downsample(group, 'date', 'completions', max_points)
+            for _, group in df.groupby('habit_id', sort=False)
+        ]
+        return pd.concat(parts, ignore_index=True)[['habit_id', 'date', 'completions', 'value']]
+
+    return _cached(("trend", bucket, days_back, per_habit, max_points), build)
+
+def clear_cache():
+    _cache.clear()
+
+def warm_up():
+    """Fill this process's cache with the trend the Analytics panel opens with (no UI imports)."""
+    return len(trend_series(BUCKETS[DEFAULT_BUCKET], TREND_RANGES[DEFAULT_RANGE]))
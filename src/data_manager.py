@@ -1,16 +1,21 @@
 import os
-import streamlit as st
+import pandas as pd
 from dotenv import load_dotenv
 
 load_dotenv()
 
 # Configuration
-# User can set USE_CLOUD_DB=true in .env to enable Mongo
+# User can set USE_CLOUD_DB=true in .env to enable Mongo,
+# or DB_BACKEND=memory for the in-memory store (single process, snapshot files)
 USE_CLOUD = os.getenv("USE_CLOUD_DB", "false").lower() == "true"
+USE_MEMORY = os.getenv("DB_BACKEND", "").lower() == "memory"
 BACKEND_NAME = "SQLite"
 
 try:
-    if USE_CLOUD:
+    if USE_MEMORY:
+        from src.db_memory import *
+        BACKEND_NAME = "Memory"
+    elif USE_CLOUD:
         from src.db_mongo import *
         # Verify connection explicitly
         if not init_db():
@@ -20,11 +25,27 @@ try:
         raise ImportError("Cloud DB disabled.")
         
 except Exception as e:
-    # Fallback to Local
-    if USE_CLOUD:
-        print(f"⚠️ Cloud DB Connection Failed ({e}). Falling back to SQLite.")
+    # Fallback to Local (configuration errors only: an unreachable cluster stays
+    # on Mongo and buffers writes locally, see src/write_buffer.py)
+    if USE_MEMORY or USE_CLOUD:
+        print(f"⚠️ {'Memory' if USE_MEMORY else 'Cloud DB'} backend failed ({e}). Falling back to SQLite.")
     from src.db_sqlite import *
     BACKEND_NAME = "SQLite"
 
 # We expose everything from the selected backend.
 # The app imports from here, so it gets the functions from the chosen module.
+
+# --- SEARCH ---
+SEARCH_ENTITY_TYPES = ("habit", "log", "reminder", "project")
+
+def search(query, entity_types=None, page=1, page_size=20):
+    """
+    Full-text search over habits, log notes, reminders and projects.
+    Returns a DataFrame [entity, id, title, snippet, score], best match first;
+    snippets mark matches with **bold**. `page` is 1-based.
+    """
+    terms = [t for t in "".join(ch if ch.isalnum() else " " for ch in (query or "")).split() if t]
+    entity_types = [e for e in (entity_types or SEARCH_ENTITY_TYPES) if e in SEARCH_ENTITY_TYPES]
+    if not terms or not entity_types:
+        return pd.DataFrame(columns=['entity', 'id', 'title', 'snippet', 'score'])
+    return search_entities(terms, entity_types, page_size, (max(1, page) - 1) * page_size)
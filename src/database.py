@@ -1,6 +1,8 @@
 import sqlite3
 import os
-from datetime import datetime
+import threading
+import datetime
+import numpy as np
 import pandas as pd
 from dotenv import load_dotenv
 
@@ -10,6 +12,33 @@ load_dotenv()
 # Default path if env var not set
 DB_PATH = os.getenv("DATABASE_PATH", "data/habits.db")
 
+# Loaders return compact numpy dtypes (int32 ids etc.), so let sqlite3 bind them directly
+for _np_int in (np.int8, np.int16, np.int32, np.int64):
+    sqlite3.register_adapter(_np_int, int)
+
+# Long-running processes (e.g. api.py) can keep one connection per thread
+# instead of reconnecting for every run_query call.
+_PERSISTENT = False
+_local = threading.local()
+
+def use_persistent_connections():
+    """Reuse one SQLite connection per thread in run_query (WAL so readers don't block the app)."""
+    global _PERSISTENT
+    _PERSISTENT = True
+    conn = get_db_connection()
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.close()
+
+def _query_connection():
+    if not _PERSISTENT:
+        return get_db_connection()
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = get_db_connection()
+        conn.execute("PRAGMA busy_timeout = 5000")
+        _local.conn = conn
+    return conn
+
 def get_db_connection():
     """Create a database connection to the SQLite database."""
     # Ensure data directory exists
@@ -19,11 +48,13 @@ def get_db_connection():
     conn.row_factory = sqlite3.Row  # Return rows as dictionaries
     return conn
 
-def init_db():
-    """Initialize the database with necessary tables."""
-    conn = get_db_connection()
-    c = conn.cursor()
-    
+# --- MIGRATIONS ---
+# Numbered, append-only schema steps. schema_version records the ones applied, so
+# startup is a single version read; pending steps run in one transaction.
+# Never edit a released step: add a new one.
+
+def _m001_baseline(c):
+    """Tables and indexes as of the migration framework (idempotent, adopts older DBs)."""
     # Habits Table
     # Added new columns for advanced frequency and measurable habits
     c.execute('''
@@ -36,10 +67,17 @@ def init_db():
             target_value INTEGER DEFAULT 1,
             target_unit TEXT DEFAULT 'times',
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            is_active BOOLEAN DEFAULT 1
+            is_active BOOLEAN DEFAULT 1,
+            next_due_date DATE
         )
     ''')
     
+    # Older databases predate next_due_date (maintained by the data layer for the Today view)
+    habit_columns = [row['name'] for row in c.execute("PRAGMA table_info(habits)")]
+    if "next_due_date" not in habit_columns:
+        c.execute("ALTER TABLE habits ADD COLUMN next_due_date DATE")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_habits_next_due ON habits (is_active, next_due_date)")
+    
     # Logs Table
     c.execute('''
         CREATE TABLE IF NOT EXISTS logs (
@@ -53,6 +91,26 @@ def init_db():
             FOREIGN KEY (habit_id) REFERENCES habits (id)
         )
     ''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_logs_habit_date ON logs (habit_id, date)")
+    
+    # Completion bitmaps: one 46-byte BLOB per habit per year (see src/bitmaps.py)
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS habit_bitmaps (
+            habit_id INTEGER NOT NULL,
+            year INTEGER NOT NULL,
+            bits BLOB NOT NULL,
+            PRIMARY KEY (habit_id, year)
+        ) WITHOUT ROWID
+    ''')
+    
+    # Model State Table: persisted weights for ml_logic's online models
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS model_state (
+            name TEXT PRIMARY KEY,
+            state TEXT NOT NULL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
     
     # Reminders Table (New Feature)
     c.execute('''
@@ -77,26 +135,308 @@ def init_db():
         )
     ''')
 
-    # Gamification: User Progress Table (New Feature)
+    # Keyset pagination indexes: lists are ordered by (created_at, id)
+    for table in ("reminders", "projects"):
+        c.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_status_created ON {table} (is_completed, created_at)")
+        c.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_created ON {table} (created_at)")
+
+    init_search_index(c)
+
+def _m002_user_progress(c):
+    """
+    One user_progress schema. init_db used to create (total_xp, current_level, last_login)
+    while the gamification init created (total_xp, unlocked_badges); keep XP and badges.
+    """
+    columns = [row['name'] for row in c.execute("PRAGMA table_info(user_progress)")]
     c.execute('''
-        CREATE TABLE IF NOT EXISTS user_progress (
+        CREATE TABLE user_progress_new (
             id INTEGER PRIMARY KEY CHECK (id = 1),
             total_xp INTEGER DEFAULT 0,
-            current_level INTEGER DEFAULT 1,
-            last_login DATE
+            unlocked_badges TEXT DEFAULT '[]'
         )
     ''')
+    if columns:
+        badges = "COALESCE(unlocked_badges, '[]')" if "unlocked_badges" in columns else "'[]'"
+        c.execute(f"""
+            INSERT INTO user_progress_new (id, total_xp, unlocked_badges)
+            SELECT 1, COALESCE(total_xp, 0), {badges} FROM user_progress WHERE id = 1
+        """)
+        c.execute("DROP TABLE user_progress")
+    c.execute("ALTER TABLE user_progress_new RENAME TO user_progress")
+    c.execute("INSERT OR IGNORE INTO user_progress (id, total_xp, unlocked_badges) VALUES (1, 0, '[]')")
+
+def _m003_backfill_bitmaps(c):
+    """Build completion bitmaps for logs written before the bitmap store existed."""
+    from src import bitmaps
     
-    # Initialize user progress if active
-    c.execute('INSERT OR IGNORE INTO user_progress (id, total_xp, current_level) VALUES (1, 0, 1)')
-    
-    conn.commit()
-    conn.close()
+    dates_by_habit = {}
+    for habit_id, day in c.execute("SELECT habit_id, date FROM logs"):
+        dates_by_habit.setdefault(habit_id, []).append(datetime.date.fromisoformat(str(day)[:10]))
+    c.executemany(
+        "INSERT OR REPLACE INTO habit_bitmaps (habit_id, year, bits) VALUES (?, ?, ?)",
+        [
+            (hid, year, bitmaps.to_blob(bits))
+            for hid, dates in dates_by_habit.items()
+            for year, bits in bitmaps.build_year_bitmaps(dates).items()
+        ]
+    )
+
+def _m004_unique_daily_logs(c):
+    """One log row per habit and day (measurable habits add to its value); merge duplicates first."""
+    c.execute("""
+        UPDATE logs SET value = (
+            SELECT SUM(COALESCE(dup.value, 1)) FROM logs dup
+            WHERE dup.habit_id = logs.habit_id AND dup.date = logs.date
+        )
+        WHERE id IN (SELECT MIN(id) FROM logs GROUP BY habit_id, date HAVING COUNT(*) > 1)
+    """)
+    c.execute("DELETE FROM logs WHERE id NOT IN (SELECT MIN(id) FROM logs GROUP BY habit_id, date)")
+    c.execute("DROP INDEX IF EXISTS idx_logs_habit_date")
+    c.execute("CREATE UNIQUE INDEX idx_logs_habit_date ON logs (habit_id, date)")
+
+def _m005_data_generation(c):
+    """Counter bumped by triggers on every log write; caches key on it (see src/chart_data.py)."""
+    c.execute('''
+        CREATE TABLE data_generation (
+            name TEXT PRIMARY KEY,
+            value INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    c.execute("INSERT INTO data_generation (name, value) VALUES ('logs', 0)")
+    for event in ("INSERT", "UPDATE", "DELETE"):
+        c.execute(f"""
+            CREATE TRIGGER logs_generation_{event.lower()} AFTER {event} ON logs BEGIN
+                UPDATE data_generation SET value = value + 1 WHERE name = 'logs';
+            END
+        """)
+
+# Columns whose changes are replicated (see src/sync.py); derived columns such as
+# habits.next_due_date are recomputed on each side and deliberately left out.
+SYNC_TABLES = {
+    "habits": ("name", "category", "frequency_type", "frequency_value", "target_value",
+               "target_unit", "created_at", "is_active"),
+    "logs": ("habit_id", "date", "value", "status", "notes", "timestamp"),
+    "reminders": ("text", "priority", "created_at", "is_completed", "due_at", "recurrence"),
+    "projects": ("text", "description", "priority", "created_at", "is_completed"),
+}
+
+# The synced columns as of migrations 6 and 7. Released migrations must build the
+# same triggers on every install, so they use this frozen copy; a migration that
+# adds synced columns recreates its table's triggers from SYNC_TABLES (see m009).
+_SYNC_TABLES_V6 = {
+    "habits": ("name", "category", "frequency_type", "frequency_value", "target_value",
+               "target_unit", "created_at", "is_active"),
+    "logs": ("habit_id", "date", "value", "status", "notes", "timestamp"),
+    "reminders": ("text", "priority", "created_at", "is_completed"),
+    "projects": ("text", "description", "priority", "created_at", "is_completed"),
+}
+
+def _m006_change_tracking(c):
+    """
+    updated_at on synced tables, plus `changes`: the latest change sequence per row
+    (deleted = 1 is a tombstone). Triggers skip rows written by the sync engine
+    itself (sync_state 'applying', set inside its transaction) so pulls don't echo.
+    """
+    c.execute("CREATE TABLE sync_state (key TEXT PRIMARY KEY, value TEXT)")
+    c.execute('''
+        CREATE TABLE sync_ids (
+            table_name TEXT NOT NULL,
+            local_id INTEGER NOT NULL,
+            remote_id TEXT NOT NULL,
+            PRIMARY KEY (table_name, local_id)
+        ) WITHOUT ROWID
+    ''')
+    c.execute("CREATE UNIQUE INDEX idx_sync_ids_remote ON sync_ids (table_name, remote_id)")
+    c.execute('''
+        CREATE TABLE changes (
+            table_name TEXT NOT NULL,
+            row_id INTEGER NOT NULL,
+            seq INTEGER NOT NULL,
+            deleted INTEGER DEFAULT 0,
+            PRIMARY KEY (table_name, row_id)
+        ) WITHOUT ROWID
+    ''')
+    c.execute("CREATE UNIQUE INDEX idx_changes_seq ON changes (seq)")
+
+    not_applying = "NOT EXISTS (SELECT 1 FROM sync_state WHERE key = 'applying')"
+    next_seq = "(SELECT IFNULL(MAX(seq), 0) + 1 FROM changes)"
+    for table, cols in _SYNC_TABLES_V6.items():
+        c.execute(f"ALTER TABLE {table} ADD COLUMN updated_at TIMESTAMP")
+        c.execute(f"UPDATE {table} SET updated_at = CURRENT_TIMESTAMP")
+        c.execute(f"""
+            CREATE TRIGGER {table}_track_insert AFTER INSERT ON {table} WHEN {not_applying} BEGIN
+                UPDATE {table} SET updated_at = CURRENT_TIMESTAMP WHERE id = new.id;
+                INSERT OR REPLACE INTO changes (table_name, row_id, seq, deleted) VALUES ('{table}', new.id, {next_seq}, 0);
+            END
+        """)
+        c.execute(f"""
+            CREATE TRIGGER {table}_track_update AFTER UPDATE OF {", ".join(cols)} ON {table} WHEN {not_applying} BEGIN
+                UPDATE {table} SET updated_at = CURRENT_TIMESTAMP WHERE id = new.id;
+                INSERT OR REPLACE INTO changes (table_name, row_id, seq, deleted) VALUES ('{table}', new.id, {next_seq}, 0);
+            END
+        """)
+        c.execute(f"""
+            CREATE TRIGGER {table}_track_delete AFTER DELETE ON {table} WHEN {not_applying} BEGIN
+                INSERT OR REPLACE INTO changes (table_name, row_id, seq, deleted) VALUES ('{table}', old.id, {next_seq}, 1);
+            END
+        """)
+        # Existing rows are all pending for the first push (habits before their logs)
+        c.execute(f"""
+            INSERT INTO changes (table_name, row_id, seq, deleted)
+            SELECT '{table}', id, ROW_NUMBER() OVER (ORDER BY id) + (SELECT IFNULL(MAX(seq), 0) FROM changes), 0
+            FROM {table}
+        """)
+
+def _change_triggers(c, table, cols):
+    """(Re)create the change-tracking triggers of one synced table."""
+    not_applying = "NOT EXISTS (SELECT 1 FROM sync_state WHERE key = 'applying')"
+    record = """
+        INSERT INTO changes (table_name, row_id, seq, deleted)
+        VALUES ('{table}', {row}.id, (SELECT IFNULL(MAX(seq), 0) + 1 FROM changes), {deleted})
+        ON CONFLICT (table_name, row_id) DO UPDATE SET seq = excluded.seq, deleted = excluded.deleted;
+    """
+    for event in ("insert", "update", "delete"):
+        c.execute(f"DROP TRIGGER IF EXISTS {table}_track_{event}")
+    touch = f"UPDATE {table} SET updated_at = CURRENT_TIMESTAMP WHERE id = new.id;"
+    c.execute(f"""
+        CREATE TRIGGER {table}_track_insert AFTER INSERT ON {table} WHEN {not_applying} BEGIN
+            {touch} {record.format(table=table, row="new", deleted=0)}
+        END
+    """)
+    c.execute(f"""
+        CREATE TRIGGER {table}_track_update AFTER UPDATE OF {", ".join(cols)} ON {table} WHEN {not_applying} BEGIN
+            {touch} {record.format(table=table, row="new", deleted=0)}
+        END
+    """)
+    c.execute(f"""
+        CREATE TRIGGER {table}_track_delete AFTER DELETE ON {table} WHEN {not_applying} BEGIN
+            {record.format(table=table, row="old", deleted=1)}
+        END
+    """)
+
+def _m007_change_upserts(c):
+    """
+    Recreate the change triggers with an upsert: an outer INSERT ... ON CONFLICT
+    (log_progress) overrides a trigger's INSERT OR REPLACE, which then failed.
+    """
+    for table, cols in _SYNC_TABLES_V6.items():
+        _change_triggers(c, table, cols)
+
+def _m008_logs_status_index(c):
+    # Miss analytics count 'Missed'/'Skipped' markers in a date range
+    c.execute("CREATE INDEX IF NOT EXISTS idx_logs_status_date ON logs (status, date)")
+
+def _m009_reminder_due_times(c):
+    """
+    Due time and recurrence on reminders. notified_at marks a one-off reminder as
+    delivered (recurring ones move due_at forward instead); the notifier reads
+    its next window off (is_completed, notified_at, due_at).
+    """
+    for column in ("due_at TIMESTAMP", "recurrence TEXT", "notified_at TIMESTAMP"):
+        c.execute(f"ALTER TABLE reminders ADD COLUMN {column}")
+    c.execute("CREATE INDEX idx_reminders_due ON reminders (is_completed, notified_at, due_at)")
+    # due_at and recurrence replicate; the update trigger must watch them too
+    _change_triggers(c, "reminders", SYNC_TABLES["reminders"])
+
+MIGRATIONS = [
+    (1, "baseline schema", _m001_baseline),
+    (2, "unify user_progress", _m002_user_progress),
+    (3, "backfill completion bitmaps", _m003_backfill_bitmaps),
+    (4, "unique daily logs", _m004_unique_daily_logs),
+    (5, "data generation counter", _m005_data_generation),
+    (6, "change tracking", _m006_change_tracking),
+    (7, "change tracking upserts", _m007_change_upserts),
+    (8, "logs status index", _m008_logs_status_index),
+    (9, "reminder due times", _m009_reminder_due_times),
+]
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+def get_schema_version(conn):
+    try:
+        return conn.execute("SELECT MAX(version) FROM schema_version").fetchone()[0] or 0
+    except sqlite3.OperationalError:
+        # No schema_version table yet: fresh or pre-migration database
+        return 0
+
+def migrate():
+    """Apply pending migrations. Returns the schema version."""
+    conn = get_db_connection()
+    try:
+        version = get_schema_version(conn)
+        if version >= LATEST_VERSION:
+            return version
+        
+        # Write lock up front; re-read in case another process migrated meanwhile
+        conn.execute("BEGIN IMMEDIATE")
+        c = conn.cursor()
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS schema_version (
+                version INTEGER PRIMARY KEY,
+                name TEXT NOT NULL,
+                applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        version = get_schema_version(conn)
+        for number, name, step in MIGRATIONS:
+            if number > version:
+                step(c)
+                c.execute("INSERT INTO schema_version (version, name) VALUES (?, ?)", (number, name))
+                version = number
+        conn.commit()
+        return version
+    except Exception:
+        if conn.in_transaction:
+            conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+def init_db():
+    """Initialize the database: bring the schema up to date."""
+    migrate()
     return True
 
+# Full-text search: one external-content FTS5 table per entity, kept in sync by triggers.
+# {table: indexed columns}
+SEARCH_TABLES = {
+    "habits": ("name", "category"),
+    "logs": ("notes",),
+    "reminders": ("text",),
+    "projects": ("text", "description"),
+}
+
+def init_search_index(c):
+    """Create FTS5 tables + sync triggers; backfill any table that was just created."""
+    for table, cols in SEARCH_TABLES.items():
+        fts = f"{table}_fts"
+        exists = c.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (fts,)).fetchone()
+        col_list = ", ".join(cols)
+        new_vals = ", ".join(f"new.{col}" for col in cols)
+        old_vals = ", ".join(f"old.{col}" for col in cols)
+        
+        c.execute(f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5({col_list}, content='{table}', content_rowid='id')")
+        c.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table} BEGIN
+                INSERT INTO {fts} (rowid, {col_list}) VALUES (new.id, {new_vals});
+            END
+        """)
+        c.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table} BEGIN
+                INSERT INTO {fts} ({fts}, rowid, {col_list}) VALUES ('delete', old.id, {old_vals});
+            END
+        """)
+        c.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF {col_list} ON {table} BEGIN
+                INSERT INTO {fts} ({fts}, rowid, {col_list}) VALUES ('delete', old.id, {old_vals});
+                INSERT INTO {fts} (rowid, {col_list}) VALUES (new.id, {new_vals});
+            END
+        """)
+        if not exists:
+            c.execute(f"INSERT INTO {fts} ({fts}) VALUES ('rebuild')")
+
 def run_query(query, params=(), return_df=False):
     """Execute a query and return results."""
-    conn = get_db_connection()
+    conn = _query_connection()
     try:
         if return_df:
             return pd.read_sql_query(query, conn, params=params)
@@ -104,12 +444,17 @@ def run_query(query, params=(), return_df=False):
         c = conn.cursor()
         c.execute(query, params)
         if query.strip().upper().startswith(("INSERT", "UPDATE", "DELETE")):
+            # Writes with a RETURNING clause return their rows, others the last row id
+            rows = c.fetchall() if "RETURNING" in query.upper() else None
             conn.commit()
-            return c.lastrowid
+            return c.lastrowid if rows is None else rows
         else:
             return c.fetchall()
     except Exception as e:
         print(f"Database Error: {e}")
+        if conn.in_transaction:
+            conn.rollback()
         return None
     finally:
-        conn.close()
+        if not _PERSISTENT:
+            conn.close()
@@ -0,0 +1,937 @@
+import os
+import json
+import pickle
+import bisect
+import threading
+from collections import Counter
+import pandas as pd
+from datetime import datetime, timedelta
+from dotenv import load_dotenv
+from src.gamification import calculate_xp_gain, get_level_info
+from src import bitmaps
+from src.models import Habit
+from src.utils import HABIT_COLUMNS, LOG_COLUMNS, LOG_ALL_COLUMNS, compact_habits, compact_logs, to_date, to_timestamp, report_error, DAY_MARKERS, MISSED_LOOKBACK_DAYS, HISTORY_COLUMNS, REMINDER_COLUMNS, PROJECT_COLUMNS
+
+load_dotenv()
+
+# --- IN-MEMORY STORE ---
+# Everything lives in Python structures: rows in dicts keyed by id, plus indexes
+# (log id per (habit_id, date), sorted dates per habit, log ids and completed
+# counts per date). Every mutation is a whole-row put/delete appended to a JSON
+# lines log; every SNAPSHOT_EVERY ops the state is pickled and the log reset.
+# Startup loads the snapshot and replays the log (puts/deletes are idempotent, so
+# a crash between the two steps is harmless). Single process only.
+
+SNAPSHOT_PATH = os.getenv(
+    "MEMORY_SNAPSHOT_PATH",
+    os.path.join(os.path.dirname(os.getenv("DATABASE_PATH", "data/habits.db")) or ".", "habits.snapshot")
+)
+LOG_PATH = SNAPSHOT_PATH + ".log"
+SNAPSHOT_EVERY = int(os.getenv("MEMORY_SNAPSHOT_EVERY", 1000))
+SNAPSHOT_VERSION = 1
+
+TABLES = ("habits", "logs", "reminders", "projects")
+
+_lock = threading.RLock()
+_tables = {t: {} for t in TABLES}
+_meta = {}
+_next_id = {t: 1 for t in TABLES}
+_log_ids = {}          # (habit_id, date) -> log id
+_habit_dates = {}      # habit_id -> sorted [date]
+_date_logs = {}        # date -> [log id] (ascending)
+_completed_on = Counter()  # date -> completed logs
+_bitmaps = {}          # habit_id -> {year: int}
+_built_bitmaps = {}    # habit_id -> {year: int} built from the logs, valid for _built_generation
+_built_generation = None
+_habit_records = {}    # habit_id -> Habit (frozen, built once per row version)
+_reminder_due = []     # sorted [(due_at, reminder id)] of pending, not yet notified reminders
+_generation = 0
+_log_file = None
+_ops_since_snapshot = 0
+
+def _now():
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+def _is_completed(row):
+    # Partial days (measurable habits below target) are progress, not completions;
+    # day markers are neither
+    return row.get('status') not in ('Partial',) + DAY_MARKERS
+
+def _is_marker(row):
+    return row.get('status') in DAY_MARKERS
+
+# --- INDEXES ---
+
+def _index_log(row):
+    key = (row['habit_id'], row['date'])
+    _log_ids[key] = row['id']
+    bisect.insort(_habit_dates.setdefault(row['habit_id'], []), row['date'])
+    bisect.insort(_date_logs.setdefault(row['date'], []), row['id'])
+    if _is_completed(row):
+        _completed_on[row['date']] += 1
+
+def _unindex_log(row):
+    _log_ids.pop((row['habit_id'], row['date']), None)
+    dates = _habit_dates.get(row['habit_id'], [])
+    i = bisect.bisect_left(dates, row['date'])
+    if i < len(dates) and dates[i] == row['date']:
+        dates.pop(i)
+    ids = _date_logs.get(row['date'], [])
+    i = bisect.bisect_left(ids, row['id'])
+    if i < len(ids) and ids[i] == row['id']:
+        ids.pop(i)
+    if _is_completed(row):
+        _completed_on[row['date']] -= 1
+
+def _due_key(row):
+    if row.get('due_at') and not row.get('notified_at') and not row['is_completed']:
+        return (row['due_at'], row['id'])
+    return None
+
+def _index_reminder(row):
+    key = _due_key(row)
+    if key is not None:
+        bisect.insort(_reminder_due, key)
+
+def _unindex_reminder(row):
+    key = _due_key(row)
+    i = bisect.bisect_left(_reminder_due, key) if key is not None else len(_reminder_due)
+    if i < len(_reminder_due) and _reminder_due[i] == key:
+        _reminder_due.pop(i)
+
+def _apply(op):
+    """Mutate state for one logged op: ["put", table, row] or ["del", table, id] or ["meta", key, value]."""
+    global _generation
+    kind, name, value = op
+    if kind == "meta":
+        _meta[name] = value
+        return
+    table = _tables[name]
+    row_id = value['id'] if kind == "put" else value
+    old = table.pop(row_id, None)
+    if name == "habits":
+        _habit_records.pop(row_id, None)
+    if name == "logs":
+        if old is not None:
+            _unindex_log(old)
+        _generation += 1
+    if name == "reminders" and old is not None:
+        _unindex_reminder(old)
+    if kind == "put":
+        table[row_id] = value
+        _next_id[name] = max(_next_id[name], row_id + 1)
+        if name == "logs":
+            _index_log(value)
+        elif name == "reminders":
+            _index_reminder(value)
+
+# --- PERSISTENCE ---
+
+def _commit(*ops):
+    """Apply ops and append them to the log (caller holds _lock)."""
+    global _ops_since_snapshot
+    for op in ops:
+        _apply(op)
+        _log_file.write(json.dumps(op, default=_plain) + "\n")
+    _log_file.flush()
+    _ops_since_snapshot += len(ops)
+    if _ops_since_snapshot >= SNAPSHOT_EVERY:
+        snapshot()
+
+def _plain(value):
+    # numpy scalars from DataFrame-backed forms
+    return value.item() if hasattr(value, "item") else str(value)
+
+def _new_id(table):
+    row_id = _next_id[table]
+    _next_id[table] += 1
+    return row_id
+
+def snapshot():
+    """Write the full state and reset the append log. Returns the snapshot size in bytes."""
+    global _log_file, _ops_since_snapshot
+    with _lock:
+        state = {"version": SNAPSHOT_VERSION, "tables": _tables, "meta": _meta, "next_id": _next_id}
+        tmp = SNAPSHOT_PATH + ".tmp"
+        with open(tmp, "wb") as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, SNAPSHOT_PATH)
+        if _log_file is not None:
+            _log_file.close()
+        _log_file = open(LOG_PATH, "w")
+        _ops_since_snapshot = 0
+        return os.path.getsize(SNAPSHOT_PATH)
+
+def _rebuild_indexes():
+    for index in (_log_ids, _habit_dates, _date_logs, _completed_on):
+        index.clear()
+    for row in _tables["logs"].values():
+        _index_log(row)
+    _reminder_due.clear()
+    for row in _tables["reminders"].values():
+        _index_reminder(row)
+    rebuild_completion_bitmaps()
+
+def init_db():
+    """Load the snapshot and replay the append log (once per process)."""
+    global _log_file, _ops_since_snapshot
+    with _lock:
+        if _log_file is not None:
+            return True
+        os.makedirs(os.path.dirname(SNAPSHOT_PATH) or ".", exist_ok=True)
+        if os.path.exists(SNAPSHOT_PATH):
+            with open(SNAPSHOT_PATH, "rb") as f:
+                state = pickle.load(f)
+            for t in TABLES:
+                _tables[t].update(state["tables"][t])
+            _meta.update(state["meta"])
+            _next_id.update(state["next_id"])
+        replayed = 0
+        if os.path.exists(LOG_PATH):
+            with open(LOG_PATH) as f:
+                for line in f:
+                    if not line.endswith("\n"):
+                        break  # torn last write
+                    _apply(json.loads(line))
+                    replayed += 1
+        _rebuild_indexes()
+        _log_file = open(LOG_PATH, "a")
+        _ops_since_snapshot = replayed
+        return True
+
+# --- GAMIFICATION ---
+def get_user_progress():
+    """Fetch current user progress."""
+    progress = _meta.get("user_progress") or {"total_xp": 0, "unlocked_badges": []}
+    return {"total_xp": progress["total_xp"], "unlocked_badges": list(progress["unlocked_badges"])}
+
+def update_user_progress(xp_delta, new_badges=None):
+    """Add XP and save new badges."""
+    with _lock:
+        curr = get_user_progress()
+        new_xp = curr['total_xp'] + xp_delta
+        badges = curr['unlocked_badges']
+        for b in new_badges or []:
+            if b not in badges:
+                badges.append(b)
+        _commit(["meta", "user_progress", {"total_xp": new_xp, "unlocked_badges": badges}])
+    return new_xp, badges
+
+# --- MODEL STATE ---
+def load_model_state(name):
+    """Return the persisted state dict for an ml_logic model, or None."""
+    return _meta.get(f"model_state:{name}")
+
+def save_model_state(name, state):
+    with _lock:
+        _commit(["meta", f"model_state:{name}", state])
+
+# --- HABITS ---
+def _projection(columns, default, allowed):
+    """Validate a requested column list."""
+    columns = list(columns or default)
+    unknown = [c for c in columns if c not in allowed]
+    if unknown:
+        raise ValueError(f"Unknown columns: {unknown}")
+    return columns
+
+def load_habits(active_only=True, columns=None, due_on=None):
+    columns = _projection(columns, HABIT_COLUMNS, HABIT_COLUMNS)
+    due_on = str(due_on) if due_on is not None else None
+    with _lock:
+        rows = [
+            r for r in _tables["habits"].values()
+            if (not active_only or r['is_active'] == 1) and (due_on is None or r['next_due_date'] == due_on)
+        ]
+    if not rows:
+        return pd.DataFrame(columns=columns)
+    rows.sort(key=lambda r: (r['created_at'], r['id']), reverse=True)
+    return compact_habits(pd.DataFrame(rows), columns)
+
+def _log_rows(days_back=None, habit_id=None, include_partial=False, date=None):
+    """Log rows matching the filters, newest date first (uses the per-habit/per-date indexes)."""
+    start = str(datetime.now().date() - timedelta(days=int(days_back))) if days_back is not None else None
+    logs = _tables["logs"]
+    with _lock:
+        if date is not None:
+            rows = [logs[i] for i in _date_logs.get(date, [])]
+            if habit_id is not None:
+                rows = [r for r in rows if r['habit_id'] == habit_id]
+        elif habit_id is not None:
+            dates = _habit_dates.get(habit_id, [])
+            if start is not None:
+                dates = dates[bisect.bisect_left(dates, start):]
+            rows = [logs[_log_ids[(habit_id, d)]] for d in reversed(dates)]
+        else:
+            rows = [r for r in logs.values() if start is None or r['date'] >= start]
+            rows.sort(key=lambda r: r['date'], reverse=True)
+    if not include_partial:
+        return [r for r in rows if _is_completed(r)]
+    return [r for r in rows if not _is_marker(r)]
+
+def load_logs(days_back=30, columns=None, habit_id=None, include_partial=False):
+    """
+    Load logs for recent history with compact dtypes.
+    `days_back=None` loads the full history. Partial days are skipped unless `include_partial`;
+    day markers always are.
+    """
+    columns = _projection(columns, LOG_COLUMNS, LOG_ALL_COLUMNS)
+    rows = _log_rows(days_back, _norm_id(habit_id), include_partial)
+    if not rows:
+        return pd.DataFrame(columns=columns)
+    return compact_logs(pd.DataFrame(rows, columns=LOG_ALL_COLUMNS), columns)
+
+def load_log_notes(log_ids):
+    """Notes for the given log ids. Returns {log_id: notes}."""
+    logs = _tables["logs"]
+    notes = {}
+    for i in log_ids or []:
+        row = logs.get(int(i))
+        if row and row.get('notes'):
+            notes[row['id']] = row['notes']
+    return notes
+
+def get_habit_logs_page(habit_id, cursor=None, limit=30):
+    """
+    One page of a habit's history (day markers included), newest first, sliced
+    from the per-habit date index. Returns (df, next_cursor).
+    """
+    habit_id = _norm_id(habit_id)
+    logs = _tables["logs"]
+    with _lock:
+        dates = _habit_dates.get(habit_id, [])
+        end = bisect.bisect_left(dates, cursor) if cursor is not None else len(dates)
+        rows = [logs[_log_ids[(habit_id, d)]] for d in reversed(dates[max(0, end - limit - 1):end])]
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = rows[-1]['date']
+    return pd.DataFrame(rows, columns=LOG_ALL_COLUMNS)[HISTORY_COLUMNS], next_cursor
+
+def _norm_id(row_id):
+    return int(row_id) if row_id is not None else None
+
+def get_habit(habit_id):
+    """Return a single habit as a Habit record, or None."""
+    try:
+        habit_id = int(habit_id)
+    except (TypeError, ValueError):
+        return None
+    habit = _habit_records.get(habit_id)
+    if habit is None:
+        row = _tables["habits"].get(habit_id)
+        if row is None:
+            return None
+        habit = _habit_records[habit_id] = Habit.from_row(row)
+    return habit
+
+# --- NEXT DUE DATE ---
+def _is_logged_on(habit_id, day):
+    # Completed or skipped: nothing left to do that day
+    log_id = _log_ids.get((habit_id, str(day)))
+    return log_id is not None and _tables["logs"][log_id].get('status') not in ('Partial', 'Missed')
+
+def update_next_due_date(habit_id, today=None, habit=None):
+    """Recompute next_due_date for a single habit."""
+    today = today or datetime.now().date()
+    habit_id = int(habit_id)
+    with _lock:
+        row = _tables["habits"].get(habit_id)
+        if row is None:
+            return None
+        next_due = get_habit(habit_id).next_due_date(today, _is_logged_on(habit_id, today))
+        if row['next_due_date'] != next_due:
+            _commit(["put", "habits", {**row, "next_due_date": next_due}])
+    return next_due
+
+def refresh_next_due_dates(today=None, force=False):
+    """
+    Roll forward stale next_due_date values. Returns rows updated.
+    `force` recomputes every active habit.
+    """
+    today = today or datetime.now().date()
+    with _lock:
+        stale = [
+            r for r in _tables["habits"].values()
+            if r['is_active'] == 1 and (force or r['next_due_date'] is None or r['next_due_date'] < str(today))
+        ]
+        ops = []
+        for row in stale:
+            next_due = get_habit(row['id']).next_due_date(today, _is_logged_on(row['id'], today))
+            ops.append(["put", "habits", {**row, "next_due_date": next_due}])
+        if ops:
+            _commit(*ops)
+    return len(ops)
+
+_next_due_refreshed_on = None
+
+def load_due_habits(today=None, columns=None):
+    """Pending habits for the Today view: due today and not yet completed."""
+    global _next_due_refreshed_on
+    today = today or datetime.now().date()
+    if _next_due_refreshed_on != today:
+        refresh_next_due_dates(today)
+        _next_due_refreshed_on = today
+    return load_habits(active_only=True, columns=columns, due_on=today)
+
+def add_habit(habit_data):
+    """Add a new habit."""
+    today = datetime.now().date()
+    try:
+        with _lock:
+            row = {
+                "id": _new_id("habits"),
+                "name": habit_data['name'],
+                "category": habit_data['category'],
+                "frequency_type": habit_data['frequency_type'],
+                "frequency_value": habit_data['frequency_value'],
+                "target_value": habit_data.get('target_value', 1),
+                "target_unit": habit_data.get('target_unit', 'times'),
+                "created_at": _now(),
+                "is_active": 1,
+                "next_due_date": Habit.from_row({**habit_data, 'created_at': today}).next_due_date(today),
+            }
+            _commit(["put", "habits", row])
+        return True
+    except Exception as e:
+        report_error(f"Error adding habit: {e}")
+        return False
+
+def edit_habit(habit_id, updated_data):
+    """Update an existing habit."""
+    try:
+        with _lock:
+            row = _tables["habits"][int(habit_id)]
+            fields = ('name', 'category', 'frequency_type', 'frequency_value', 'target_value')
+            _commit(["put", "habits", {**row, **{f: updated_data[f] for f in fields}}])
+            update_next_due_date(habit_id)
+        return True
+    except Exception as e:
+        report_error(f"Error updating habit: {e}")
+        return False
+
+def delete_habit(habit_id):
+    """Soft delete a habit."""
+    try:
+        with _lock:
+            row = _tables["habits"][int(habit_id)]
+            _commit(["put", "habits", {**row, "is_active": 0}])
+        return True
+    except Exception as e:
+        report_error(f"Error deleting habit: {e}")
+        return False
+
+def record_completion(habit, date, status="Completed", notes="", value=1):
+    """
+    Fast path for the Done button: insert the log and roll next_due_date forward.
+    Returns the log id, or None if the habit was already logged on `date`
+    (a Missed/Skipped marker for that day is replaced, keeping its id).
+    """
+    habit = Habit.from_row(habit)
+    day = str(to_date(date))
+    with _lock:
+        log_id = _log_ids.get((habit.id, day))
+        if log_id is not None and not _is_marker(_tables["logs"][log_id]):
+            return None
+        log_id = log_id or _new_id("logs")
+        ops = [["put", "logs", {
+            "id": log_id, "habit_id": habit.id, "date": day, "value": value,
+            "status": status, "notes": notes, "timestamp": _now(),
+        }]]
+        today = datetime.now().date()
+        row = _tables["habits"].get(habit.id)
+        if day == str(today) and row is not None:
+            ops.append(["put", "habits", {**row, "next_due_date": habit.next_due_date(today, done_today=True)}])
+        _commit(*ops)
+        if bitmaps.ENABLED and _is_completed(ops[0][2]):
+            mark_completion_bit(habit.id, day)
+    return log_id
+
+def process_completion_rewards(habit_id, date, log_id=None):
+    """
+    Streak, XP, badge and level processing for a recorded completion.
+    Returns RewardInfo: 'xp_earned', 'level_up', 'current_level', 'new_badges'.
+    """
+    habit = get_habit(habit_id)
+    if habit is None:
+        return {"xp_earned": 0}
+    habit_id = habit.id
+
+    if bitmaps.ENABLED:
+        current_streak = bitmaps.streak_stats(habit, get_completion_bitmaps(habit_id))["current"]
+    else:
+        from src.analytics import calculate_streaks
+        current_streak = calculate_streaks(habit, load_logs(days_back=None, columns=['date'], habit_id=habit_id))
+    prev_streak = max(0, current_streak - 1)
+
+    xp = calculate_xp_gain(current_streak, prev_streak)
+
+    candidate_badges = []
+    curr_progress = get_user_progress()
+    existing_badges = curr_progress['unlocked_badges']
+
+    if current_streak == 7: candidate_badges.append('week_warrior')
+    if current_streak == 30: candidate_badges.append('month_master')
+    if curr_progress['total_xp'] == 0: candidate_badges.append('first_step')
+
+    # Hat Trick: completed logs that day up to this one (per-date id list)
+    day = str(to_date(date))
+    with _lock:
+        if log_id is None:
+            day_count = _completed_on[day]
+        else:
+            ids = _date_logs.get(day, [])[:bisect.bisect_right(_date_logs.get(day, []), int(log_id))]
+            day_count = sum(1 for i in ids if _is_completed(_tables["logs"][i]))
+    if day_count == 3: candidate_badges.append('hat_trick')
+
+    new_badges = [b for b in candidate_badges if b not in existing_badges]
+
+    new_xp_total, _ = update_user_progress(xp, new_badges)
+
+    curr_lvl, _ = get_level_info(new_xp_total)
+    prev_lvl, _ = get_level_info(new_xp_total - xp)
+
+    return {
+        "xp_earned": xp,
+        "level_up": curr_lvl['level'] > prev_lvl['level'],
+        "current_level": curr_lvl,
+        "new_badges": new_badges
+    }
+
+def log_habit_completion(habit_id, date, status="Completed", notes="", value=1):
+    """Log a completion and process rewards synchronously. Returns (success, reward_info)."""
+    habit = get_habit(habit_id)
+    if habit is None:
+        return False, {}
+    log_id = record_completion(habit, date, status, notes, value)
+    if log_id is None:
+        return False, {}
+    try:
+        return True, process_completion_rewards(habit.id, date, log_id)
+    except Exception as e:
+        report_error(f"Error processing rewards: {e}")
+        return True, {"xp_earned": 0}
+
+# --- MEASURABLE PROGRESS ---
+def log_progress(habit, date, amount=1, notes=""):
+    """
+    Add `amount` to the habit's value for `date`.
+    Returns {'log_id', 'value', 'status', 'completed_now'}.
+    """
+    habit = Habit.from_row(habit)
+    day = str(to_date(date))
+    target = habit.target_value or 1
+    with _lock:
+        log_id = _log_ids.get((habit.id, day))
+        if log_id is None:
+            row = {
+                "id": _new_id("logs"), "habit_id": habit.id, "date": day, "value": amount,
+                "status": 'Completed' if amount >= target else 'Partial', "notes": notes, "timestamp": _now(),
+            }
+        else:
+            old = _tables["logs"][log_id]
+            value = (old['value'] or 0) + amount
+            row = {**old, "value": value,
+                   "status": 'Completed' if old['status'] == 'Completed' or value >= target else 'Partial'}
+        # Only the write that flips the day to Completed (not a later +1 on a Done day)
+        completed_now = row['status'] == 'Completed' and (log_id is None or old['status'] != 'Completed')
+        ops = [["put", "logs", row]]
+        today = datetime.now().date()
+        habit_row = _tables["habits"].get(habit.id)
+        if completed_now and day == str(today) and habit_row is not None:
+            ops.append(["put", "habits", {**habit_row, "next_due_date": habit.next_due_date(today, done_today=True)}])
+        _commit(*ops)
+        if completed_now and bitmaps.ENABLED:
+            mark_completion_bit(habit.id, day)
+    return {"log_id": row['id'], "value": row['value'], "status": row['status'], "completed_now": completed_now}
+
+def get_day_values(date):
+    """{habit_id: value} logged on `date` (Today view progress bars)."""
+    return {r['habit_id']: r['value'] or 0 for r in _log_rows(date=str(to_date(date)), include_partial=True)}
+
+def _bucket(day, bucket):
+    if bucket == "day":
+        return day
+    if bucket == "month":
+        return day[:8] + "01"
+    d = datetime.strptime(day, "%Y-%m-%d").date()
+    return str(d - timedelta(days=d.weekday()))
+
+def load_value_series(days_back=30, bucket="day", habit_id=None, include_partial=True):
+    """
+    Per-habit value totals grouped by day/week/month (weeks start Monday).
+    Returns a DataFrame: habit_id, date, value, days_logged.
+    """
+    if bucket not in ("day", "week", "month"):
+        raise ValueError(f"Unknown bucket: {bucket}")
+    totals = {}
+    for r in _log_rows(days_back, _norm_id(habit_id), include_partial):
+        key = (r['habit_id'], _bucket(r['date'], bucket))
+        value, days = totals.get(key, (0, 0))
+        totals[key] = (value + (r['value'] if r['value'] is not None else 1), days + 1)
+    if not totals:
+        return pd.DataFrame(columns=['habit_id', 'date', 'value', 'days_logged'])
+    df = pd.DataFrame(
+        [(hid, day, v, n) for (hid, day), (v, n) in sorted(totals.items())],
+        columns=['habit_id', 'date', 'value', 'days_logged']
+    )
+    df['date'] = pd.to_datetime(df['date'])
+    return df
+
+def get_data_generation():
+    """Changes whenever any log is written."""
+    return _generation
+
+# --- COMPLETION BITMAPS ---
+# Derived from logs at startup, so they are not persisted.
+
+def mark_completion_bit(habit_id, day):
+    year, idx = bitmaps.day_index(to_date(day))
+    with _lock:
+        years = _bitmaps.setdefault(int(habit_id), {})
+        years[year] = years.get(year, 0) | (1 << idx)
+
+def get_completion_bitmaps(habit_id):
+    """Return {year: int} completion bitmaps for a habit."""
+    return dict(_bitmaps.get(int(habit_id), {}))
+
+def rebuild_completion_bitmaps(habit_id=None):
+    """Rebuild bitmaps from logs (all habits, or one). Returns the number of habit-years built."""
+    with _lock:
+        habit_ids = [int(habit_id)] if habit_id is not None else list(_habit_dates)
+        if habit_id is None:
+            _bitmaps.clear()
+        built = 0
+        for hid in habit_ids:
+            dates = [to_date(d) for d in _habit_dates.get(hid, []) if _is_completed(_tables["logs"][_log_ids[(hid, d)]])]
+            _bitmaps[hid] = bitmaps.build_year_bitmaps(dates)
+            built += len(_bitmaps[hid])
+    return built
+
+def get_habit_bitmap_stats(habit, today=None, window_days=30):
+    """Current/longest streak and recent completion rate from the bitmap store."""
+    habit = Habit.from_row(habit)
+    today = today or datetime.now().date()
+    completions = get_completion_bitmaps(habit.id)
+    stats = bitmaps.streak_stats(habit, completions, today)
+    stats["rate"], _ = bitmaps.completion_rate(habit, completions, today - timedelta(days=window_days - 1), today)
+    return stats
+
+def bulk_insert_logs(habit_id, dates, status="Completed", value=1):
+    """Insert logs for `dates` that don't have one yet (no rewards); day markers are replaced. Returns rows written."""
+    habit_id = int(habit_id)
+    dates = sorted({str(to_date(d)) for d in dates})
+    logs = _tables["logs"]
+    with _lock:
+        ops = []
+        for d in dates:
+            log_id = _log_ids.get((habit_id, d))
+            if log_id is not None and not _is_marker(logs[log_id]):
+                continue
+            ops.append(["put", "logs", {
+                "id": log_id or _new_id("logs"), "habit_id": habit_id, "date": d, "value": value,
+                "status": status, "notes": logs[log_id]['notes'] if log_id else None, "timestamp": _now(),
+            }])
+        if ops:
+            _commit(*ops)
+            rebuild_completion_bitmaps(habit_id)
+            update_next_due_date(habit_id)
+    return len(ops)
+
+# --- STREAKS ---
+def _streak_bitmaps(habit_id):
+    """
+    Completion bitmaps for one habit: the _bitmaps index while bitmaps.ENABLED
+    (writes keep it current), else built from the logs once per _generation.
+    Call with _lock held.
+    """
+    global _built_generation
+    if bitmaps.ENABLED:
+        return _bitmaps.get(habit_id, {})
+    if _built_generation != _generation:
+        _built_bitmaps.clear()
+        _built_generation = _generation
+    if habit_id not in _built_bitmaps:
+        logs = _tables["logs"]
+        dates = [to_date(d) for d in _habit_dates.get(habit_id, []) if _is_completed(logs[_log_ids[(habit_id, d)]])]
+        _built_bitmaps[habit_id] = bitmaps.build_year_bitmaps(dates)
+    return _built_bitmaps[habit_id]
+
+def get_streaks(today=None):
+    """
+    Current and longest streak for every daily / every-N-days habit.
+    Returns a DataFrame: habit_id, current, longest (other frequencies are absent).
+    """
+    today = today or datetime.now().date()
+    rows = []
+    with _lock:
+        for row in sorted(_tables["habits"].values(), key=lambda r: r['id']):
+            habit = Habit.from_row(row)
+            if not habit.freq.fixed_interval or habit.created_at is None:
+                continue
+            stats = bitmaps.streak_stats(habit, _streak_bitmaps(habit.id), today)
+            rows.append((habit.id, stats["current"], stats["longest"]))
+    return pd.DataFrame(rows, columns=['habit_id', 'current', 'longest'])
+
+# --- MISSED DAYS ---
+def skip_habit(habit, date, notes=""):
+    """
+    Mark `date` as deliberately skipped (not counted as a miss).
+    Returns the marker's log id, or None if the day is already logged.
+    """
+    habit = Habit.from_row(habit)
+    day = str(to_date(date))
+    with _lock:
+        log_id = _log_ids.get((habit.id, day))
+        if log_id is not None and _tables["logs"][log_id]['status'] != 'Missed':
+            return None
+        if log_id is None:
+            row = {"id": _new_id("logs"), "habit_id": habit.id, "date": day, "value": 0, "timestamp": _now()}
+        else:
+            row = dict(_tables["logs"][log_id])
+        ops = [["put", "logs", {**row, "status": 'Skipped', "notes": notes}]]
+        today = datetime.now().date()
+        habit_row = _tables["habits"].get(habit.id)
+        if day == str(today) and habit_row is not None:
+            ops.append(["put", "habits", {**habit_row, "next_due_date": habit.next_due_date(today, done_today=True)}])
+        _commit(*ops)
+    return ops[0][2]['id']
+
+def materialize_missed_days(start=None, end=None):
+    """
+    Write a 'Missed' marker for every due day in [start, end] that an active habit
+    left unlogged (default: the last MISSED_LOOKBACK_DAYS days; never today or later).
+    Idempotent. Returns the number of markers written.
+    """
+    yesterday = datetime.now().date() - timedelta(days=1)
+    end = min(to_date(end), yesterday) if end else yesterday
+    start = to_date(start) if start else end - timedelta(days=MISSED_LOOKBACK_DAYS - 1)
+    if start > end:
+        return 0
+    with _lock:
+        ops = [
+            ["put", "logs", {
+                "id": _new_id("logs"), "habit_id": row['id'], "date": str(day), "value": 0,
+                "status": 'Missed', "notes": None, "timestamp": _now(),
+            }]
+            for row in list(_tables["habits"].values()) if row['is_active'] == 1
+            for day in bitmaps.due_days(get_habit(row['id']), start, end)
+            if (row['id'], str(day)) not in _log_ids
+        ]
+        if ops:
+            _commit(*ops)
+    return len(ops)
+
+_days_closed = None
+
+def get_miss_stats(days=30, today=None):
+    """
+    Missed and skipped due days per habit over the `days` days before today.
+    Returns a DataFrame: habit_id, missed, skipped (a Partial day counts as missed).
+    """
+    global _days_closed
+    today = today or datetime.now().date()
+    start = today - timedelta(days=days)
+    if _days_closed is None or _days_closed[0] != today or start < _days_closed[1]:
+        materialize_missed_days(start, today - timedelta(days=1))
+        _days_closed = (today, start)
+    counts = {}
+    logs = _tables["logs"]
+    with _lock:
+        day = start
+        while day < today:
+            for i in _date_logs.get(str(day), []):
+                status = logs[i]['status']
+                if status in ('Missed', 'Partial', 'Skipped'):
+                    missed, skipped = counts.get(logs[i]['habit_id'], (0, 0))
+                    counts[logs[i]['habit_id']] = (missed + (status != 'Skipped'), skipped + (status == 'Skipped'))
+            day += timedelta(days=1)
+    if not counts:
+        return pd.DataFrame(columns=['habit_id', 'missed', 'skipped'])
+    return pd.DataFrame([(hid, m, sk) for hid, (m, sk) in sorted(counts.items())], columns=['habit_id', 'missed', 'skipped'])
+
+# --- MAINTENANCE ---
+def check_schema():
+    """Return index/table inconsistencies; empty if healthy."""
+    problems = []
+    with _lock:
+        logs = _tables["logs"]
+        if len(_log_ids) != len(logs):
+            problems.append(f"log index has {len(_log_ids)} keys for {len(logs)} logs (duplicate habit/date?)")
+        if sum(len(d) for d in _habit_dates.values()) != len(logs):
+            problems.append("per-habit date index out of sync")
+        if sum(len(ids) for ids in _date_logs.values()) != len(logs):
+            problems.append("per-date index out of sync")
+        for t in TABLES:
+            if _tables[t] and max(_tables[t]) >= _next_id[t]:
+                problems.append(f"id counter for {t} behind its rows")
+    return problems
+
+def vacuum_db():
+    """Fold the append log into a fresh snapshot. Returns sizes in bytes."""
+    before = sum(os.path.getsize(p) for p in (SNAPSHOT_PATH, LOG_PATH) if os.path.exists(p))
+    snapshot()
+    return {"size_before": before, "size_after": os.path.getsize(SNAPSHOT_PATH)}
+
+def get_habit_stats(habit_id):
+    """Get simple stats for a habit: {'count', 'last_log'}."""
+    habit_id = _norm_id(habit_id)
+    logs = _tables["logs"]
+    with _lock:
+        dates = [d for d in _habit_dates.get(habit_id, []) if not _is_marker(logs[_log_ids[(habit_id, d)]])]
+    return {"count": len(dates), "last_log": dates[-1] if dates else None}
+
+# --- SEARCH ---
+_SEARCH_FIELDS = {
+    "habit": ("habits", ("name", "category")),
+    "log": ("logs", ("notes",)),
+    "reminder": ("reminders", ("text",)),
+    "project": ("projects", ("text", "description")),
+}
+
+def _snippet(text, terms, width=60):
+    """Short excerpt around the first matching term, with matches in **bold**."""
+    lower = text.lower()
+    hits = [lower.find(t.lower()) for t in terms if t.lower() in lower]
+    start = max(0, min(hits) - width // 2) if hits else 0
+    excerpt = text[start:start + width]
+    for t in terms:
+        idx = excerpt.lower().find(t.lower())
+        if idx >= 0:
+            excerpt = excerpt[:idx] + "**" + excerpt[idx:idx + len(t)] + "**" + excerpt[idx + len(t):]
+    return ("…" if start > 0 else "") + excerpt + ("…" if start + width < len(text) else "")
+
+def search_entities(terms, entity_types, limit, offset):
+    """Substring search (every term must match) ranked by number of term hits."""
+    terms_lower = [t.lower() for t in terms]
+    hits = []
+    with _lock:
+        for entity in entity_types:
+            table, fields = _SEARCH_FIELDS[entity]
+            for row in _tables[table].values():
+                if entity == "habit" and row['is_active'] != 1:
+                    continue
+                text = " ".join(str(row.get(f) or "") for f in fields)
+                lower = text.lower()
+                if not all(t in lower for t in terms_lower):
+                    continue
+                if entity == "log":
+                    habit = _tables["habits"].get(row['habit_id'])
+                    title = f"{habit['name'] if habit else 'Habit'} · {row['date']}"
+                else:
+                    title = row[fields[0]]
+                hits.append({
+                    "entity": entity, "id": row['id'], "title": title,
+                    "snippet": _snippet(text, terms), "score": float(sum(lower.count(t) for t in terms_lower)),
+                })
+    hits.sort(key=lambda h: h["score"], reverse=True)
+    return pd.DataFrame(hits[offset:offset + limit], columns=['entity', 'id', 'title', 'snippet', 'score'])
+
+# --- REMINDERS & PROJECTS ---
+def _add(table, row):
+    with _lock:
+        _commit(["put", table, {"id": _new_id(table), **row, "created_at": _now(), "is_completed": 0}])
+    return True
+
+def _list(table, columns, pending_only):
+    with _lock:
+        rows = [r for r in _tables[table].values() if not pending_only or r['is_completed'] == 0]
+    rows.sort(key=lambda r: (r['created_at'], r['id']), reverse=True)
+    return pd.DataFrame(rows, columns=columns)
+
+def _keyset_page(table, columns, pending_only, cursor, limit):
+    """
+    One page ordered newest first by (created_at, id).
+    Returns (df, next_cursor); pass next_cursor back to get the following page.
+    """
+    df = _list(table, columns, pending_only)
+    if cursor is not None:
+        keys = list(zip(df['created_at'], df['id']))
+        df = df[[k < tuple(cursor) for k in keys]]
+    if len(df) <= limit:
+        return df.reset_index(drop=True), None
+    df = df.iloc[:limit].reset_index(drop=True)
+    last = df.iloc[-1]
+    return df, (last['created_at'], int(last['id']))
+
+def _set_completed(table, row_id, is_completed):
+    with _lock:
+        row = _tables[table].get(int(row_id))
+        if row is None:
+            return False
+        _commit(["put", table, {**row, "is_completed": 1 if is_completed else 0}])
+    return True
+
+def _delete(table, row_id):
+    with _lock:
+        if int(row_id) not in _tables[table]:
+            return False
+        _commit(["del", table, int(row_id)])
+    return True
+
+def add_reminder(text, priority='low', due_at=None, recurrence=None):
+    """`due_at` (datetime or ISO string) schedules a notification; `recurrence` is one of RECURRENCES."""
+    return _add("reminders", {
+        "text": text, "priority": priority, "due_at": to_timestamp(due_at),
+        "recurrence": recurrence if due_at else None, "notified_at": None,
+    })
+
+def get_reminders(pending_only=True):
+    return _list("reminders", REMINDER_COLUMNS, pending_only)
+
+def get_reminders_page(pending_only=True, cursor=None, limit=20):
+    return _keyset_page("reminders", REMINDER_COLUMNS, pending_only, cursor, limit)
+
+def update_reminder_status(reminder_id, is_completed=True):
+    return _set_completed("reminders", reminder_id, is_completed)
+
+def delete_reminder(reminder_id):
+    return _delete("reminders", reminder_id)
+
+# --- REMINDER NOTIFICATIONS ---
+
+def get_due_reminders(until, limit=500):
+    """Pending, not yet notified reminders with due_at <= `until`, soonest first (due_at as datetime)."""
+    with _lock:
+        end = bisect.bisect_right(_reminder_due, (to_timestamp(until), float("inf")))
+        rows = [_tables["reminders"][i] for _, i in _reminder_due[:min(end, limit)]]
+    return [
+        {"id": r['id'], "text": r['text'], "priority": r['priority'],
+         "due_at": datetime.fromisoformat(r['due_at']), "recurrence": r.get('recurrence')}
+        for r in rows
+    ]
+
+def claim_reminder(reminder_id, due_at, next_due_at=None):
+    """
+    Mark the occurrence at `due_at` delivered: a one-off reminder gets notified_at,
+    a recurring one moves on to `next_due_at`. Returns True if claimed here.
+    """
+    with _lock:
+        row = _tables["reminders"].get(int(reminder_id))
+        if row is None or _due_key(row) != (to_timestamp(due_at), row['id']):
+            return False
+        if next_due_at is None:
+            _commit(["put", "reminders", {**row, "notified_at": _now()}])
+        else:
+            _commit(["put", "reminders", {**row, "due_at": to_timestamp(next_due_at)}])
+    return True
+
+def add_project(text, description, priority='low'):
+    return _add("projects", {"text": text, "description": description, "priority": priority})
+
+def get_projects(pending_only=True):
+    return _list("projects", PROJECT_COLUMNS, pending_only)
+
+def get_projects_page(pending_only=True, cursor=None, limit=20):
+    return _keyset_page("projects", PROJECT_COLUMNS, pending_only, cursor, limit)
+
+def update_project_status(project_id, is_completed=True):
+    return _set_completed("projects", project_id, is_completed)
+
+def delete_project(project_id):
+    return _delete("projects", project_id)
+
+# Load persisted state on import (after everything the replay needs is defined)
+init_db()
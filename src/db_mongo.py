@@ -1,12 +1,16 @@
-import streamlit as st
 import pandas as pd
-from datetime import datetime
+from datetime import datetime, timedelta
 import os
 import json
 from dotenv import load_dotenv
-from pymongo import MongoClient
+from pymongo import MongoClient, UpdateOne, DeleteOne, ReturnDocument
+from pymongo.errors import DuplicateKeyError, ConnectionFailure
+from bson.binary import Binary
 from bson.objectid import ObjectId
 from src.gamification import calculate_xp_gain, get_level_info
+from src import bitmaps, write_buffer
+from src.models import Habit, habits_from_df
+from src.utils import HABIT_COLUMNS, LOG_COLUMNS, LOG_ALL_COLUMNS, compact_habits, compact_logs, to_date, to_timestamp, report_error, DAY_MARKERS, MISSED_LOOKBACK_DAYS, HISTORY_COLUMNS
 
 load_dotenv()
 
@@ -14,6 +18,11 @@ load_dotenv()
 CLIENT = None
 DB = None
 
+# Fail fast when the cluster is unreachable; request-path writes go through the
+# local write buffer (src/write_buffer.py) unless MONGO_WRITE_BUFFER=false.
+TIMEOUT_MS = int(os.getenv("MONGO_TIMEOUT_MS", 3000))
+BUFFER_WRITES = os.getenv("MONGO_WRITE_BUFFER", "true").lower() == "true"
+
 import certifi
 
 def get_db():
@@ -21,11 +30,11 @@ def get_db():
     if DB is None:
         uri = os.getenv("MONGO_URI")
         if not uri:
-            st.error("MONGO_URI not found in .env")
+            report_error("MONGO_URI not found in .env")
             return None
         try:
             # Added tlsCAFile for Windows SSL handshake issues
-            CLIENT = MongoClient(uri, tlsCAFile=certifi.where())
+            CLIENT = MongoClient(uri, tlsCAFile=certifi.where(), serverSelectionTimeoutMS=TIMEOUT_MS)
             # Default DB name or from URI
             # Safe way to get DB name from cluster URI
             db_name = "habit_tracker" # Default
@@ -33,104 +42,309 @@ def get_db():
                 db_name = uri.split("/")[-1].split("?")[0] or "habit_tracker"
             DB = CLIENT[db_name]
         except Exception as e:
-            st.error(f"Failed to connect to MongoDB: {e}")
+            report_error(f"Failed to connect to MongoDB: {e}")
             return None
     return DB
 
 # --- INIT ---
+# entity -> (collection, text fields, extra filter); each collection has one text index
+_SEARCH_COLLECTIONS = {
+    "habit": ("habits", ("name", "category"), {"is_active": 1}),
+    "log": ("logs", ("notes",), {}),
+    "reminder": ("reminders", ("text",), {}),
+    "project": ("projects", ("text", "description"), {}),
+}
+
 def init_db():
     """Mongo initializes on write, but we can verify connection."""
     if get_db() is not None:
         return True
     return False
 
-def init_gamification_db():
-    """Ensure user_progress doc exists."""
-    db = get_db()
-    if db is None: return
-    
-    # Check for user_progress (singleton with _id=1 to match sqlite logic)
-    # Using _id=1 for simplicity
-    if not db.user_progress.find_one({"_id": 1}):
-        db.user_progress.insert_one({
-            "_id": 1,
-            "total_xp": 0,
-            "unlocked_badges": []
-        })
+# --- OFFLINE READS ---
+# Last good result per read. While the write buffer reports Mongo unreachable,
+# reads are served from here (plus pending writes) instead of waiting on a timeout.
+READ_CACHE_SIZE = 32
+_last_reads = {}
+
+def _read(key, fetch):
+    if BUFFER_WRITES and not write_buffer.is_online() and key in _last_reads:
+        return _last_reads[key]
+    try:
+        result = fetch()
+    except ConnectionFailure as e:
+        if not BUFFER_WRITES:
+            raise
+        write_buffer.mark_offline(e)
+        if key not in _last_reads:
+            raise
+        return _last_reads[key]
+    _last_reads.pop(key, None)
+    _last_reads[key] = result
+    if len(_last_reads) > READ_CACHE_SIZE:
+        _last_reads.pop(next(iter(_last_reads)))
+    return result
+
+def _pending_logs():
+    """{(habit_id, date): [buffered log writes, oldest first]}"""
+    pending = {}
+    if BUFFER_WRITES:
+        for p in write_buffer.pending("record_completion", "log_progress", "skip_habit"):
+            pending.setdefault((p["habit_id"], p["date"]), []).append(p)
+    return pending
+
+def _replay(state, ops):
+    """(value, status) of a day's log after buffered writes; state is the stored pair or None."""
+    for p in ops:
+        if p["op"] == "record_completion":
+            # Upsert: only creates the log if the day had none (or a day marker)
+            if state is None or state[1] in DAY_MARKERS:
+                state = (p["value"], p["status"])
+        elif p["op"] == "skip_habit":
+            if state is None or state[1] == "Missed":
+                state = (0, "Skipped")
+        else:
+            value = ((state[0] if state else 0) or 0) + p["amount"]
+            done = (state is not None and state[1] == "Completed") or value >= p["target"]
+            state = (value, "Completed" if done else "Partial")
+    return state
 
 # --- GAMIFICATION ---
 def get_user_progress():
     db = get_db()
-    res = db.user_progress.find_one({"_id": 1})
+    res = _read(("user_progress",), lambda: db.user_progress.find_one({"_id": 1}))
     if res:
         return {"total_xp": res.get("total_xp", 0), "unlocked_badges": res.get("unlocked_badges", [])}
     return {"total_xp": 0, "unlocked_badges": []}
 
 def update_user_progress(xp_delta, new_badges=None):
-    db = get_db()
-    curr = get_user_progress()
-    new_xp = curr['total_xp'] + xp_delta
-    badges = curr['unlocked_badges']
-    
-    if new_badges:
-        for b in new_badges:
-            if b not in badges:
-                badges.append(b)
-    
-    db.user_progress.update_one(
+    """Add XP ($inc) and save new badges ($addToSet) atomically; returns the new totals."""
+    doc = get_db().user_progress.find_one_and_update(
         {"_id": 1},
-        {"$set": {"total_xp": new_xp, "unlocked_badges": badges}},
-        upsert=True
+        {"$inc": {"total_xp": xp_delta}, "$addToSet": {"unlocked_badges": {"$each": list(new_badges or [])}}},
+        upsert=True, return_document=ReturnDocument.AFTER
     )
-    return new_xp, badges
+    return doc.get("total_xp", 0), doc.get("unlocked_badges", [])
 
-# Automatically init when imported
+# Automatically init when imported (migrations run after the bitmap helpers below)
 init_db()
-init_gamification_db()
+
+# --- MODEL STATE ---
+def load_model_state(name):
+    """Return the persisted state dict for an ml_logic model, or None."""
+    doc = get_db().model_state.find_one({"_id": name})
+    return doc["state"] if doc else None
+
+def save_model_state(name, state):
+    get_db().model_state.update_one(
+        {"_id": name},
+        {"$set": {"state": state, "updated_at": datetime.now()}},
+        upsert=True
+    )
 
 # --- HABITS ---
-def load_habits(active_only=True):
+def _projection(columns, default, allowed):
+    """Validate a requested column list and build the Mongo projection for it."""
+    columns = list(columns or default)
+    unknown = [c for c in columns if c not in allowed]
+    if unknown:
+        raise ValueError(f"Unknown columns: {unknown}")
+    return columns, {c: 1 for c in columns if c != 'id'}
+
+def load_habits(active_only=True, columns=None, due_on=None):
     db = get_db()
+    columns, projection = _projection(columns, HABIT_COLUMNS, HABIT_COLUMNS)
     query = {"is_active": 1} if active_only else {}
+    if due_on is not None:
+        query["next_due_date"] = str(due_on)
     
-    cursor = db.habits.find(query).sort("created_at", -1)
-    df = pd.DataFrame(list(cursor))
+    key = ("habits", active_only, tuple(columns), str(due_on))
+    docs = _read(key, lambda: list(db.habits.find(query, projection).sort("created_at", -1)))
+    df = pd.DataFrame(docs)
     
     if df.empty:
-        return pd.DataFrame(columns=['id', 'name', 'category', 'frequency_type', 'frequency_value', 'target_value', 'target_unit', 'created_at', 'is_active'])
+        return pd.DataFrame(columns=columns)
     
     # Map _id to id (string)
     df['id'] = df['_id'].astype(str)
-    return df
+    if 'target_unit' in columns:
+        # Docs written before target_unit existed get SQLite's column default
+        df['target_unit'] = df['target_unit'].fillna('times') if 'target_unit' in df else 'times'
+    return compact_habits(df, columns)
+
+# Partial days (measurable habits below target) are progress, not completions;
+# day markers are neither ($nin also matches legacy docs without a status)
+COMPLETED_FILTER = {"status": {"$nin": ["Partial", *DAY_MARKERS]}}
+LOGGED_FILTER = {"status": {"$nin": list(DAY_MARKERS)}}
+# Completed or skipped: nothing left to do that day
+CLOSED_FILTER = {"status": {"$nin": ["Partial", "Missed"]}}
 
-def load_logs(days_back=30):
+def load_logs(days_back=30, columns=None, habit_id=None, include_partial=False):
     db = get_db()
-    # Simple date filter? Mongo dates are objects or strings.
-    # We store dates as strings "YYYY-MM-DD".
-    # Filter: >= date string.
-    start_date = (pd.Timestamp.now() - pd.Timedelta(days=days_back)).strftime("%Y-%m-%d")
+    columns, projection = _projection(columns, LOG_COLUMNS, LOG_ALL_COLUMNS)
+    # We store dates as strings "YYYY-MM-DD", so a string range filter works.
+    query = dict(LOGGED_FILTER if include_partial else COMPLETED_FILTER)
+    start_date = None
+    if days_back is not None:
+        start_date = (pd.Timestamp.now() - pd.Timedelta(days=days_back)).strftime("%Y-%m-%d")
+        query["date"] = {"$gte": start_date}
+    if habit_id is not None:
+        query["habit_id"] = str(habit_id)
     
-    cursor = db.logs.find({"date": {"$gte": start_date}}).sort("date", -1)
-    df = pd.DataFrame(list(cursor))
+    key = ("logs", days_back, tuple(columns), str(habit_id), include_partial)
+    docs = _read(key, lambda: list(db.logs.find(query, projection).sort("date", -1)))
+    docs = _merge_pending_logs(docs, start_date, habit_id, include_partial)
+    df = pd.DataFrame(docs)
     
     if df.empty:
-        return pd.DataFrame(columns=['id', 'habit_id', 'date', 'value', 'status', 'notes', 'timestamp'])
+        return pd.DataFrame(columns=columns)
     
     df['id'] = df['_id'].astype(str)
+    return compact_logs(df, columns)
+
+def _merge_pending_logs(docs, start_date=None, habit_id=None, include_partial=False):
+    """Overlay buffered log writes on loaded log docs so reads see their own writes."""
+    pending = _pending_logs()
+    if not pending:
+        return docs
+    docs = [dict(d) for d in docs]
+    by_key = {(d.get("habit_id"), d.get("date")): d for d in docs}
+    for (hid, day), ops in pending.items():
+        if (start_date and day < start_date) or (habit_id is not None and hid != str(habit_id)):
+            continue
+        doc = by_key.get((hid, day))
+        value, status = _replay((doc.get("value"), doc.get("status")) if doc else None, ops)
+        if doc is not None:
+            doc.update(value=value, status=status)
+        elif status not in DAY_MARKERS and (include_partial or status != "Partial"):
+            docs.append({
+                "_id": ops[0].get("log_id") or ops[0]["op_id"], "habit_id": hid, "date": day,
+                "value": value, "status": status, "notes": ops[0]["notes"], "timestamp": ops[0]["timestamp"],
+            })
+    docs.sort(key=lambda d: d.get("date") or "", reverse=True)
+    return docs
+
+def load_log_notes(log_ids):
+    """Lazily fetch notes for the given log ids. Returns {log_id: notes}."""
+    if not log_ids:
+        return {}
+    cursor = get_db().logs.find(
+        {"_id": {"$in": [ObjectId(i) for i in log_ids]}, "notes": {"$nin": [None, ""]}},
+        {"notes": 1}
+    )
+    return {str(d['_id']): d['notes'] for d in cursor}
+
+def get_habit_logs_page(habit_id, cursor=None, limit=30):
+    """
+    One page of a habit's history (day markers included), newest first.
+    Keyset on the unique (habit_id, date) index; buffered writes are overlaid.
+    Returns (df, next_cursor).
+    """
+    habit_id = str(habit_id)
+    query = {"habit_id": habit_id}
+    if cursor is not None:
+        query["date"] = {"$lt": cursor}
+    projection = {c: 1 for c in HISTORY_COLUMNS if c != 'id'}
+    docs = list(get_db().logs.find(query, projection).sort("date", -1).limit(limit + 1))
+    docs = _merge_pending_logs(docs, habit_id=habit_id, include_partial=True)
+    docs = [d for d in docs if cursor is None or d["date"] < cursor][:limit + 1]
+    next_cursor = None
+    if len(docs) > limit:
+        docs = docs[:limit]
+        next_cursor = docs[-1]["date"]
+    df = pd.DataFrame(docs)
+    if df.empty:
+        return pd.DataFrame(columns=HISTORY_COLUMNS), None
+    df['id'] = df['_id'].astype(str)
+    return df.reindex(columns=HISTORY_COLUMNS), next_cursor
+
+def get_habit(habit_id):
+    """Return a single habit as a Habit record, or None."""
+    try:
+        doc = get_db().habits.find_one({"_id": ObjectId(habit_id)})
+    except Exception:
+        return None
+    return Habit.from_row(doc) if doc else None
+
+# --- NEXT DUE DATE ---
+# Mirrors db_sqlite: next_due_date is maintained on write and rolled forward lazily.
+
+def update_next_due_date(habit_id, today=None, habit=None):
+    """Recompute next_due_date for a single habit."""
+    db = get_db()
+    today = today or datetime.now().date()
+    if habit is None:
+        habit = db.habits.find_one({"_id": ObjectId(habit_id)})
+        if not habit:
+            return None
+    done_today = db.logs.find_one({"habit_id": str(habit_id), "date": str(today), **CLOSED_FILTER}, {"_id": 1}) is not None
+    next_due = Habit.from_row(habit).next_due_date(today, done_today)
+    db.habits.update_one({"_id": ObjectId(habit_id)}, {"$set": {"next_due_date": next_due}})
+    return next_due
+
+def refresh_next_due_dates(today=None, force=False):
+    """
+    Roll forward stale next_due_date values (missed days, legacy docs). Returns docs updated.
+    `force` recomputes every active habit (maintenance / after bulk edits).
+    """
+    db = get_db()
+    today = today or datetime.now().date()
+    query = {"is_active": 1}
+    if not force:
+        query["$or"] = [{"next_due_date": None}, {"next_due_date": {"$lt": str(today)}}]
+    stale = list(db.habits.find(query))
+    if not stale:
+        return 0
+    done_today = set(db.logs.distinct("habit_id", {"date": str(today), **CLOSED_FILTER}))
+    
+    ops = []
+    for doc in stale:
+        habit = Habit.from_row(doc)
+        ops.append(UpdateOne(
+            {"_id": doc["_id"]},
+            {"$set": {"next_due_date": habit.next_due_date(today, habit.id in done_today)}}
+        ))
+    db.habits.bulk_write(ops, ordered=False)
+    return len(ops)
+
+# Stale rows only appear when the day rolls over, so refresh once per day per process
+_next_due_refreshed_on = None
+
+def load_due_habits(today=None, columns=None):
+    """Pending habits for the Today view: due today and not yet completed."""
+    global _next_due_refreshed_on
+    today = today or datetime.now().date()
+    if _next_due_refreshed_on != today and (not BUFFER_WRITES or write_buffer.is_online()):
+        try:
+            refresh_next_due_dates(today)
+            _next_due_refreshed_on = today
+        except ConnectionFailure as e:
+            if not BUFFER_WRITES:
+                raise
+            write_buffer.mark_offline(e)
+    df = load_habits(active_only=True, columns=columns, due_on=today)
+    # Completions still in the write buffer haven't rolled next_due_date yet
+    if not df.empty and 'id' in df and any(day == str(today) for _, day in _pending_logs()):
+        done = {hid for hid, (_, status) in get_day_states(today).items() if status not in ("Partial", "Missed")}
+        df = df[~df['id'].astype(str).isin(done)].reset_index(drop=True)
     return df
 
 def add_habit(habit_data):
     db = get_db()
     habit_data['created_at'] = datetime.now()
+    habit_data['updated_at'] = habit_data['created_at']
     habit_data['is_active'] = 1
     # Ensure target_value default
     if 'target_value' not in habit_data: habit_data['target_value'] = 1
+    habit_data.setdefault('target_unit', 'times')
+    today = habit_data['created_at'].date()
+    habit_data['next_due_date'] = Habit.from_row(habit_data).next_due_date(today)
     
     try:
         db.habits.insert_one(habit_data)
         return True
     except Exception as e:
-        st.error(f"Mongo Error: {e}")
+        report_error(f"Mongo Error: {e}")
         return False
 
 def edit_habit(habit_id, updated_data):
@@ -138,11 +352,12 @@ def edit_habit(habit_id, updated_data):
     try:
         db.habits.update_one(
             {"_id": ObjectId(habit_id)},
-            {"$set": updated_data}
+            {"$set": {**updated_data, "updated_at": datetime.now()}}
         )
+        update_next_due_date(habit_id)
         return True
     except Exception as e:
-        st.error(f"Mongo Error: {e}")
+        report_error(f"Mongo Error: {e}")
         return False
 
 def delete_habit(habit_id):
@@ -150,140 +365,919 @@ def delete_habit(habit_id):
     try:
         db.habits.update_one(
             {"_id": ObjectId(habit_id)},
-            {"$set": {"is_active": 0}}
+            {"$set": {"is_active": 0, "updated_at": datetime.now()}}
         )
         return True
     except Exception as e:
-        st.error(f"Mongo Error: {e}")
+        report_error(f"Mongo Error: {e}")
         return False
 
-def log_habit_completion(habit_id_str, date, status="Completed", notes="", value=1):
+def _apply_completions(payloads):
+    """
+    Upsert a run of completions in one bulk write (the log id is chosen by the caller).
+    A day marker is deleted first so the upsert replaces it under the caller's id.
+    """
     db = get_db()
-    # Check duplicate
-    # Log stores habit_id as string to match
-    if db.logs.find_one({"habit_id": habit_id_str, "date": str(date)}):
-        return False, {}
-    
-    log_entry = {
-        "habit_id": habit_id_str,
-        "date": str(date),
-        "status": status,
-        "notes": notes,
-        "value": value,
-        "timestamp": datetime.now()
+    now = datetime.now()
+    ops = []
+    for p in payloads:
+        key = {"habit_id": p["habit_id"], "date": p["date"]}
+        ops.append(DeleteOne({**key, "status": {"$in": list(DAY_MARKERS)}}))
+        ops.append(UpdateOne(
+            key,
+            {"$setOnInsert": {
+                "_id": ObjectId(p["log_id"]), "status": p["status"], "notes": p["notes"], "value": p["value"],
+                "timestamp": datetime.fromisoformat(p["timestamp"]), "updated_at": now
+            }},
+            upsert=True
+        ))
+    res = db.logs.bulk_write(ops, ordered=True)
+    today = str(now.date())
+    for habit_id in {p["habit_id"] for p in payloads if p["date"] == today}:
+        update_next_due_date(habit_id)
+    if bitmaps.ENABLED:
+        # Set streak bits with the write (not in the reward job) for the upserts that inserted
+        inserted = set(res.upserted_ids.values())
+        for p in payloads:
+            if ObjectId(p["log_id"]) in inserted and p["status"] not in ('Partial',) + DAY_MARKERS:
+                mark_completion_bit(p["habit_id"], p["date"])
+    return res.upserted_count
+
+write_buffer.register("record_completion", _apply_completions, batched=True)
+
+def record_completion(habit, date, status="Completed", notes="", value=1):
+    """
+    Fast path for the Done button: upsert the log (no separate duplicate check)
+    and roll next_due_date forward. Rewards are processed afterwards (see src.rewards).
+    Returns the new log id, or None if the habit was already logged on `date`.
+    With the write buffer the upsert happens in the background; a day that turns
+    out to be logged already just earns no rewards.
+    """
+    habit = Habit.from_row(habit)
+    payload = {
+        "log_id": str(ObjectId()), "habit_id": str(habit.id), "date": str(to_date(date)),
+        "status": status, "notes": notes, "value": value, "timestamp": datetime.now().isoformat(),
     }
-    
+    if BUFFER_WRITES:
+        if (payload["habit_id"], payload["date"]) in _pending_logs():
+            return None
+        write_buffer.append("record_completion", payload)
+        return payload["log_id"]
     try:
-        db.logs.insert_one(log_entry)
-        
-        # --- GAMIFICATION ---
-        # Fetch habit needed for streaks
-        habit = db.habits.find_one({"_id": ObjectId(habit_id_str)})
-        if habit:
-            # Need DF for analytics
-            logs_cursor = db.logs.find({"habit_id": habit_id_str})
-            habit_logs_df = pd.DataFrame(list(logs_cursor))
-            if habit_logs_df.empty:
-                # Should not happen as we just inserted
-                habit_logs_df = pd.DataFrame([log_entry]) # minimal
-            
-            # Use analytics
-            from src.analytics import calculate_streaks
-            # calculate_streaks expects habit dict (ok) and logs DF (ok)
-            # Ensure DF columns match what analytics expects
-            # Analytics expects 'date' column.
-            current_streak = calculate_streaks(habit, habit_logs_df)
-            prev_streak = max(0, current_streak - 1)
-            
-            xp = calculate_xp_gain(current_streak, prev_streak)
-            
-            # Badges
-            candidate_badges = []
-            curr_progress = get_user_progress()
-            existing_badges = curr_progress['unlocked_badges']
-            
-            if current_streak == 7: candidate_badges.append('week_warrior')
-            if current_streak == 30: candidate_badges.append('month_master')
-            if curr_progress['total_xp'] == 0: candidate_badges.append('first_step')
-            
-            # Hat Trick
-            day_count = db.logs.count_documents({"date": str(date)})
-            if day_count == 3: candidate_badges.append('hat_trick')
-            
-            new_badges = [b for b in candidate_badges if b not in existing_badges]
-            
-            new_xp_total, _ = update_user_progress(xp, new_badges)
-            
-            curr_lvl, _ = get_level_info(new_xp_total)
-            prev_lvl, _ = get_level_info(new_xp_total - xp)
-            level_up = (curr_lvl['level'] > prev_lvl['level'])
-            
-            return True, {
-                "xp_earned": xp,
-                "level_up": level_up,
-                "current_level": curr_lvl,
-                "new_badges": new_badges
-            }
-            
-        return True, {"xp_earned": 0}
-        
+        return payload["log_id"] if _apply_completions([payload]) else None
     except Exception as e:
-        st.error(f"Mongo Error: {e}")
+        report_error(f"Mongo Error: {e}")
+        return None
+
+def process_completion_rewards(habit_id_str, date, log_id=None):
+    """
+    Streak, XP, badge and level processing for a recorded completion.
+    Returns RewardInfo: 'xp_earned', 'level_up', 'current_level', 'new_badges'.
+    """
+    db = get_db()
+    if BUFFER_WRITES:
+        # Raises NotDrained while the log is still buffered; the reward job waits
+        write_buffer.flush()
+        if log_id is not None and db.logs.find_one({"_id": ObjectId(log_id)}, {"_id": 1}) is None:
+            # The buffered upsert found the day already logged
+            return {"xp_earned": 0}
+    habit = get_habit(habit_id_str)
+    if habit is None:
+        return {"xp_earned": 0}
+
+    if bitmaps.ENABLED:
+        # Streak from the bitmap store (the bit was set with the log): no need to pull the habit's logs
+        current_streak = bitmaps.streak_stats(habit, get_completion_bitmaps(habit_id_str))["current"]
+    else:
+        habit_logs_df = load_logs(days_back=None, columns=['date'], habit_id=habit_id_str)
+        # Use analytics
+        from src.analytics import calculate_streaks
+        current_streak = calculate_streaks(habit, habit_logs_df)
+    prev_streak = max(0, current_streak - 1)
+
+    xp = calculate_xp_gain(current_streak, prev_streak)
+
+    # Badges
+    candidate_badges = []
+    curr_progress = get_user_progress()
+    existing_badges = curr_progress['unlocked_badges']
+
+    if current_streak == 7: candidate_badges.append('week_warrior')
+    if current_streak == 30: candidate_badges.append('month_master')
+    if curr_progress['total_xp'] == 0: candidate_badges.append('first_step')
+
+    # Hat Trick: count only logs up to this one (ObjectIds increase with insert time)
+    day_filter = {"date": str(date), **COMPLETED_FILTER}
+    if log_id is not None:
+        day_filter["_id"] = {"$lte": ObjectId(log_id)}
+    day_count = db.logs.count_documents(day_filter)
+    if day_count == 3: candidate_badges.append('hat_trick')
+
+    new_badges = [b for b in candidate_badges if b not in existing_badges]
+
+    new_xp_total, _ = update_user_progress(xp, new_badges)
+
+    curr_lvl, _ = get_level_info(new_xp_total)
+    prev_lvl, _ = get_level_info(new_xp_total - xp)
+    level_up = (curr_lvl['level'] > prev_lvl['level'])
+
+    return {
+        "xp_earned": xp,
+        "level_up": level_up,
+        "current_level": curr_lvl,
+        "new_badges": new_badges
+    }
+
+def log_habit_completion(habit_id_str, date, status="Completed", notes="", value=1):
+    """
+    Log a completion and process rewards synchronously (queued for the reward
+    worker while the log is still buffered). Returns (success, reward_info).
+    """
+    habit = get_habit(habit_id_str)
+    if habit is None:
         return False, {}
+    log_id = record_completion(habit, date, status, notes, value)
+    if log_id is None:
+        return False, {}
+    try:
+        return True, process_completion_rewards(str(habit.id), date, log_id)
+    except write_buffer.NotDrained:
+        # The log is still buffered: the reward worker processes it once it lands
+        from src import rewards
+        rewards.start_worker()
+        rewards.enqueue(str(habit.id), date, log_id)
+        return True, {}
+    except Exception as e:
+        report_error(f"Mongo Error: {e}")
+        return True, {"xp_earned": 0}
+
+# --- MEASURABLE PROGRESS ---
+# Mirrors db_sqlite: one log doc per habit and day (unique index); increments are
+# a single pipeline upsert that adds to value and sets status against the target.
+
+def _apply_progress(p):
+    """
+    One increment as a single pipeline upsert. last_op records the increment
+    applied last, so replaying the same buffered entry adds nothing.
+    Returns (doc, completed_now).
+    """
+    db = get_db()
+    target = p["target"]
+    old = {"$ifNull": ["$value", 0]}
+    value = {"$cond": [{"$eq": ["$last_op", p["op_id"]]}, old, {"$add": [old, p["amount"]]}]}
+    doc = db.logs.find_one_and_update(
+        {"habit_id": p["habit_id"], "date": p["date"]},
+        [
+            {"$set": {
+                "status": {"$cond": [
+                    {"$or": [{"$eq": ["$status", "Completed"]}, {"$gte": [value, target]}]},
+                    "Completed", "Partial"
+                ]},
+                "value": value,
+                "notes": {"$ifNull": ["$notes", p["notes"]]},
+                "timestamp": {"$ifNull": ["$timestamp", datetime.fromisoformat(p["timestamp"])]},
+                "updated_at": datetime.now(),
+                "last_op": p["op_id"],
+                # The increment that flipped the day to Completed (a $set stage reads
+                # the doc as it was before the stage, so $status is the prior status)
+                "completed_op": {"$cond": [
+                    {"$and": [{"$ne": ["$status", "Completed"]}, {"$gte": [value, target]}]},
+                    p["op_id"], {"$ifNull": ["$completed_op", None]}
+                ]},
+            }},
+        ],
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    completed_now = doc.get("completed_op") == p["op_id"]
+    if completed_now and p["date"] == str(datetime.now().date()):
+        update_next_due_date(p["habit_id"])
+    if completed_now and bitmaps.ENABLED:
+        mark_completion_bit(p["habit_id"], p["date"])
+    return doc, completed_now
+
+write_buffer.register("log_progress", _apply_progress)
+
+def log_progress(habit, date, amount=1, notes=""):
+    """
+    Add `amount` to the habit's value for `date` in one atomic upsert.
+    Returns {'log_id', 'value', 'status', 'completed_now'} or None on error.
+    With the write buffer the result is computed from the merged day state and
+    log_id is None (the doc may not exist yet).
+    """
+    habit = Habit.from_row(habit)
+    payload = {
+        "habit_id": str(habit.id), "date": str(to_date(date)), "amount": amount, "notes": notes,
+        "target": habit.target_value or 1, "timestamp": datetime.now().isoformat(),
+    }
+    if BUFFER_WRITES:
+        def merge():
+            before = get_day_states(payload["date"]).get(payload["habit_id"])
+            return before, _replay(before, [{**payload, "op": "log_progress"}])
+        # Read and append under the journal lock: a concurrent increment waits and
+        # sees this one, so only one of them reports completed_now
+        _, (before, (value, status)) = write_buffer.append_checked("log_progress", payload, merge)
+        completed_now = status == "Completed" and (before is None or before[1] != "Completed")
+        return {"log_id": None, "value": value, "status": status, "completed_now": completed_now}
+    try:
+        doc, completed_now = _apply_progress({**payload, "op_id": str(ObjectId())})
+        return {"log_id": str(doc["_id"]), "value": doc["value"], "status": doc["status"], "completed_now": completed_now}
+    except Exception as e:
+        report_error(f"Mongo Error: {e}")
+        return None
+
+def get_day_states(date):
+    """{habit_id: (value, status)} logged on `date`, including buffered writes."""
+    day = str(to_date(date))
+    docs = _read(("day", day), lambda: list(get_db().logs.find({"date": day}, {"habit_id": 1, "value": 1, "status": 1, "last_op": 1})))
+    states = {d["habit_id"]: (d.get("value"), d.get("status")) for d in docs}
+    last_ops = {d["habit_id"]: d.get("last_op") for d in docs}
+    for (hid, pending_day), ops in _pending_logs().items():
+        if pending_day == day:
+            # An increment already applied but not yet removed from the journal counts once
+            ops = [p for p in ops if p.get("op_id") is None or p["op_id"] != last_ops.get(hid)]
+            states[hid] = _replay(states.get(hid), ops)
+    return states
+
+def get_day_values(date):
+    """{habit_id: value} logged on `date` (Today view progress bars)."""
+    return {hid: value or 0 for hid, (value, status) in get_day_states(date).items() if status not in DAY_MARKERS}
+
+def _value_bucket(bucket):
+    """Aggregation expression for the bucket start (dates are stored as YYYY-MM-DD strings)."""
+    if bucket == "day":
+        return "$date"
+    if bucket == "month":
+        return {"$concat": [{"$substr": ["$date", 0, 7]}, "-01"]}
+    if bucket == "week":
+        # Monday of the ISO week
+        day = {"$dateFromString": {"dateString": "$date"}}
+        monday = {"$subtract": [day, {"$multiply": [{"$subtract": [{"$isoDayOfWeek": day}, 1]}, 86400000]}]}
+        return {"$dateToString": {"format": "%Y-%m-%d", "date": monday}}
+    raise ValueError(f"Unknown bucket: {bucket}")
+
+def load_value_series(days_back=30, bucket="day", habit_id=None, include_partial=True):
+    """
+    Per-habit value totals grouped by day/week/month in an aggregation pipeline.
+    Returns a DataFrame: habit_id, date, value, days_logged.
+    """
+    match = dict(LOGGED_FILTER if include_partial else COMPLETED_FILTER)
+    if days_back is not None:
+        match["date"] = {"$gte": (pd.Timestamp.now() - pd.Timedelta(days=days_back)).strftime("%Y-%m-%d")}
+    if habit_id is not None:
+        match["habit_id"] = str(habit_id)
+    rows = list(get_db().logs.aggregate([
+        {"$match": match},
+        {"$group": {
+            "_id": {"habit_id": "$habit_id", "date": _value_bucket(bucket)},
+            "value": {"$sum": {"$ifNull": ["$value", 1]}},
+            "days_logged": {"$sum": 1},
+        }},
+        {"$sort": {"_id.habit_id": 1, "_id.date": 1}},
+    ]))
+    if not rows:
+        return pd.DataFrame(columns=['habit_id', 'date', 'value', 'days_logged'])
+    df = pd.DataFrame([{**r["_id"], "value": r["value"], "days_logged": r["days_logged"]} for r in rows])
+    df['date'] = pd.to_datetime(df['date'])
+    return df
+
+def get_data_generation():
+    """
+    Changes whenever logs change: every log write stamps updated_at in the same
+    write, so (count, latest updated_at) needs no extra counter document.
+    """
+    logs = get_db().logs
+    latest = logs.find_one({}, {"updated_at": 1}, sort=[("updated_at", -1)])
+    stamp = latest.get("updated_at") if latest else None
+    return (logs.estimated_document_count(), str(stamp))
+
+# --- COMPLETION BITMAPS ---
+# habit_bitmaps docs: {_id: "<habit_id>:<year>", habit_id, year, bits: Binary(46 bytes)}
+
+def mark_completion_bit(habit_id, day, retries=5):
+    """Set the completion bit for `day` (compare-and-set on the stored bytes)."""
+    db = get_db()
+    day = to_date(day)
+    year, _ = bitmaps.day_index(day)
+    key = f"{habit_id}:{year}"
+    for _ in range(retries):
+        doc = db.habit_bitmaps.find_one({"_id": key})
+        if doc is None:
+            try:
+                db.habit_bitmaps.insert_one({"_id": key, "habit_id": str(habit_id), "year": year, "bits": Binary(bitmaps.set_day(None, day))})
+                return True
+            except DuplicateKeyError:
+                continue
+        res = db.habit_bitmaps.update_one(
+            {"_id": key, "bits": doc["bits"]},
+            {"$set": {"bits": Binary(bitmaps.set_day(bytes(doc["bits"]), day))}}
+        )
+        if res.matched_count:
+            return True
+    return False
+
+def get_completion_bitmaps(habit_id):
+    """Return {year: int} completion bitmaps for a habit."""
+    cursor = get_db().habit_bitmaps.find({"habit_id": str(habit_id)}, {"year": 1, "bits": 1})
+    return {d["year"]: bitmaps.to_int(bytes(d["bits"])) for d in cursor}
+
+def rebuild_completion_bitmaps(habit_id=None):
+    """Rebuild bitmaps from logs (all habits, or one). Returns the number of docs written."""
+    db = get_db()
+    query = {} if habit_id is None else {"habit_id": str(habit_id)}
+    dates_by_habit = {}
+    for d in db.logs.find({**query, **COMPLETED_FILTER}, {"habit_id": 1, "date": 1}):
+        dates_by_habit.setdefault(d["habit_id"], []).append(to_date(d["date"]))
+    docs = [
+        {"_id": f"{hid}:{year}", "habit_id": hid, "year": year, "bits": Binary(bitmaps.to_blob(bits))}
+        for hid, dates in dates_by_habit.items()
+        for year, bits in bitmaps.build_year_bitmaps(dates).items()
+    ]
+    db.habit_bitmaps.delete_many(query)
+    if docs:
+        db.habit_bitmaps.insert_many(docs)
+    return len(docs)
+
+# --- MIGRATIONS ---
+# Mirrors database.MIGRATIONS: numbered steps, with the applied version kept in
+# the metadata collection ({_id: "schema_version", version, history}). Steps are
+# idempotent and the version advances by compare-and-set, so concurrent starts
+# are safe without multi-document transactions (not available on standalone servers).
+
+def _m001_indexes(db):
+    # Today view reads habits by next_due_date
+    db.habits.create_index([("is_active", 1), ("next_due_date", 1)])
+    db.logs.create_index([("habit_id", 1), ("date", 1)])
+    db.habit_bitmaps.create_index([("habit_id", 1)])
+    # Full-text search (one text index per collection)
+    for entity, (coll, fields, _) in _SEARCH_COLLECTIONS.items():
+        db[coll].create_index([(f, "text") for f in fields], name=f"{coll}_text")
+    # Keyset pagination for reminders/projects: (created_at, _id), optionally by status
+    for coll in (db.reminders, db.projects):
+        coll.create_index([("is_completed", 1), ("created_at", -1), ("_id", -1)])
+        coll.create_index([("created_at", -1), ("_id", -1)])
+
+def _m002_user_progress(db):
+    # Singleton with _id=1 to match sqlite logic
+    db.user_progress.update_one(
+        {"_id": 1},
+        {"$setOnInsert": {"total_xp": 0, "unlocked_badges": []}, "$unset": {"current_level": "", "last_login": ""}},
+        upsert=True
+    )
+
+def _m003_backfill_bitmaps(db):
+    if db.habit_bitmaps.find_one({}, {"_id": 1}) is None:
+        rebuild_completion_bitmaps()
+
+def _m004_unique_daily_logs(db):
+    # One log doc per habit and day; fold duplicates into the oldest first
+    dups = db.logs.aggregate([
+        {"$sort": {"_id": 1}},
+        {"$group": {
+            "_id": {"habit_id": "$habit_id", "date": "$date"},
+            "ids": {"$push": "$_id"},
+            "value": {"$sum": {"$ifNull": ["$value", 1]}},
+            "count": {"$sum": 1},
+        }},
+        {"$match": {"count": {"$gt": 1}}},
+    ])
+    for dup in dups:
+        keep, *extra = dup["ids"]
+        db.logs.update_one({"_id": keep}, {"$set": {"value": dup["value"]}})
+        db.logs.delete_many({"_id": {"$in": extra}})
+    if "habit_id_1_date_1" in db.logs.index_information():
+        db.logs.drop_index("habit_id_1_date_1")
+    db.logs.create_index([("habit_id", 1), ("date", 1)], unique=True)
+
+def _m005_logs_updated_at(db):
+    # get_data_generation reads the newest updated_at
+    db.logs.create_index([("updated_at", -1)])
+
+SYNC_COLLECTIONS = ("habits", "logs", "reminders", "projects")
+
+def _m006_change_tracking(db):
+    # Every synced write stamps updated_at; pulls read changes in that order
+    now = datetime.now()
+    for coll in SYNC_COLLECTIONS:
+        db[coll].update_many({"updated_at": {"$exists": False}}, {"$set": {"updated_at": now}})
+        if coll != "logs":  # logs already has one from step 5
+            db[coll].create_index([("updated_at", 1)])
+    db.tombstones.create_index([("deleted_at", 1)])
+
+def _m007_logs_status_index(db):
+    # Miss analytics count 'Missed'/'Skipped' markers in a date range
+    db.logs.create_index([("status", 1), ("date", 1)])
+
+def _m008_reminder_due_times(db):
+    # The notifier reads pending reminders in due_at order
+    db.reminders.create_index([("is_completed", 1), ("notified_at", 1), ("due_at", 1)])
+
+MIGRATIONS = [
+    (1, "baseline indexes", _m001_indexes),
+    (2, "unify user_progress", _m002_user_progress),
+    (3, "backfill completion bitmaps", _m003_backfill_bitmaps),
+    (4, "unique daily logs", _m004_unique_daily_logs),
+    (5, "logs updated_at index", _m005_logs_updated_at),
+    (6, "change tracking", _m006_change_tracking),
+    (7, "logs status index", _m007_logs_status_index),
+    (8, "reminder due times", _m008_reminder_due_times),
+]
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+def get_schema_version():
+    doc = get_db().metadata.find_one({"_id": "schema_version"})
+    return doc["version"] if doc else 0
+
+def migrate():
+    """Apply pending migrations. Returns the schema version."""
+    db = get_db()
+    if db is None: return 0
+    version = get_schema_version()
+    for number, name, step in MIGRATIONS:
+        if number <= version:
+            continue
+        step(db)
+        try:
+            res = db.metadata.update_one(
+                {"_id": "schema_version", "version": version},
+                {"$set": {"version": number}, "$push": {"history": {"version": number, "name": name, "applied_at": datetime.now()}}},
+                upsert=(version == 0)
+            )
+        except DuplicateKeyError:
+            res = None
+        if res is None or (res.matched_count == 0 and res.upserted_id is None):
+            # Another process advanced the version; continue from its state
+            return migrate()
+        version = number
+    return version
+
+try:
+    migrate()
+except ConnectionFailure as e:
+    if not BUFFER_WRITES:
+        raise
+    # Unreachable at startup: stay on Mongo (writes are buffered), migrate once it answers
+    print(f"⚠️ MongoDB unreachable ({e}); migrations deferred.")
+    write_buffer.mark_offline(e)
+    write_buffer.on_reconnect(migrate)
+
+def get_habit_bitmap_stats(habit, today=None, window_days=30):
+    """Current/longest streak and recent completion rate from the bitmap store."""
+    habit = Habit.from_row(habit)
+    today = today or datetime.now().date()
+    completions = get_completion_bitmaps(habit.id)
+    stats = bitmaps.streak_stats(habit, completions, today)
+    stats["rate"], _ = bitmaps.completion_rate(habit, completions, today - timedelta(days=window_days - 1), today)
+    return stats
+
+def bulk_insert_logs(habit_id, dates, status="Completed", value=1):
+    """
+    Insert logs for `dates` that don't have one yet (no rewards processed); day
+    markers are replaced. Keeps bitmaps and next_due_date in sync. Returns the number of docs written.
+    """
+    db = get_db()
+    habit_id = str(habit_id)
+    dates = sorted({str(to_date(d)) for d in dates})
+    have = {d["date"]: d.get("status") for d in db.logs.find({"habit_id": habit_id}, {"date": 1, "status": 1})}
+    now = datetime.now()
+    replaced = [d for d in dates if have.get(d, "") in DAY_MARKERS]
+    docs = [
+        {"habit_id": habit_id, "date": d, "status": status, "notes": None, "value": value, "timestamp": now, "updated_at": now}
+        for d in dates if d not in have
+    ]
+    if replaced:
+        db.logs.update_many(
+            {"habit_id": habit_id, "date": {"$in": replaced}, "status": {"$in": list(DAY_MARKERS)}},
+            {"$set": {"status": status, "value": value, "updated_at": now}}
+        )
+    if docs:
+        db.logs.insert_many(docs, ordered=False)
+    if docs or replaced:
+        rebuild_completion_bitmaps(habit_id)
+        update_next_due_date(habit_id)
+    return len(docs) + len(replaced)
+
+# --- STREAKS ---
+# Mirrors db_sqlite's gaps-and-islands query with $setWindowFields (MongoDB 5.0+).
+# Per-habit creation day and step are passed as parallel arrays indexed by the
+# habit's position, so only one small document per habit comes back.
+
+DAY_MS = 86400000
+_EPOCH = datetime(1970, 1, 1).date()
+
+def get_streaks(today=None):
+    """
+    Current and longest streak for every daily / every-N-days habit in one aggregation.
+    Returns a DataFrame: habit_id, current, longest (other frequencies are absent).
+    """
+    today = today or datetime.now().date()
+    habits = [h for h in habits_from_df(load_habits(active_only=False, columns=['id', 'frequency_type', 'frequency_value', 'created_at']))
+              if h.freq.fixed_interval and h.created_at is not None]
+    habits.sort(key=lambda h: str(h.id))
+    if not habits:
+        return pd.DataFrame(columns=['habit_id', 'current', 'longest'])
+    ids = [str(h.id) for h in habits]
+    anchors = [(h.created_at - _EPOCH).days for h in habits]
+    steps = [h.freq.fixed_interval for h in habits]
+    ages = [(today - h.created_at).days for h in habits]
+    # A run is current if it reaches the last due slot, or the one before while today is still open
+    last_slot = [age // step for age, step in zip(ages, steps)]
+    open_slot = [age // step - (age % step == 0) for age, step in zip(ages, steps)]
+
+    idx = {"$indexOfArray": [ids, "$habit_id"]}
+    day = {"$toLong": {"$divide": [{"$toLong": {"$toDate": "$date"}}, DAY_MS]}}
+    at = lambda values, i: {"$arrayElemAt": [values, i]}
+    rows = list(get_db().logs.aggregate([
+        {"$match": {"habit_id": {"$in": ids}, "date": {"$lte": str(today)}, **COMPLETED_FILTER}},
+        {"$project": {"_id": 0, "i": idx, "offset": {"$subtract": [day, at(anchors, idx)]}, "step": at(steps, idx)}},
+        {"$match": {"$expr": {"$and": [{"$gte": ["$offset", 0]}, {"$eq": [{"$mod": ["$offset", "$step"]}, 0]}]}}},
+        {"$group": {"_id": {"i": "$i", "slot": {"$toLong": {"$divide": ["$offset", "$step"]}}}}},
+        {"$setWindowFields": {"partitionBy": "$_id.i", "sortBy": {"_id.slot": 1},
+                              "output": {"n": {"$documentNumber": {}}}}},
+        {"$group": {"_id": {"i": "$_id.i", "island": {"$subtract": ["$_id.slot", "$n"]}},
+                    "last": {"$max": "$_id.slot"}, "length": {"$sum": 1}}},
+        {"$group": {"_id": "$_id.i", "longest": {"$max": "$length"}, "current": {"$max": {"$cond": [
+            {"$in": ["$last", [at(last_slot, "$_id.i"), at(open_slot, "$_id.i")]]}, "$length", 0]}}}},
+    ]))
+    found = {r["_id"]: r for r in rows}
+    return pd.DataFrame(
+        [(hid, found.get(i, {}).get("current", 0), found.get(i, {}).get("longest", 0)) for i, hid in enumerate(ids)],
+        columns=['habit_id', 'current', 'longest'],
+    )
+
+# --- MISSED DAYS ---
+# Mirrors db_sqlite: 'Missed' markers close due days left unlogged, so miss
+# rates are one aggregation over the (status, date) index.
+
+def _apply_skip(p):
+    """Write a Skipped marker (or turn a Missed one into it). Returns the marker id, or None if the day is logged."""
+    db = get_db()
+    now = datetime.now()
+    key = {"habit_id": p["habit_id"], "date": p["date"]}
+    doc = db.logs.find_one_and_update(
+        {**key, "status": "Missed"},
+        {"$set": {"status": "Skipped", "notes": p["notes"], "updated_at": now}},
+        projection={"_id": 1}
+    )
+    if doc is not None:
+        log_id = str(doc["_id"])
+    else:
+        res = db.logs.update_one(key, {"$setOnInsert": {
+            "_id": ObjectId(p["log_id"]), "status": "Skipped", "notes": p["notes"], "value": 0,
+            "timestamp": datetime.fromisoformat(p["timestamp"]), "updated_at": now
+        }}, upsert=True)
+        if res.upserted_id is None:
+            return None
+        log_id = p["log_id"]
+    if p["date"] == str(now.date()):
+        update_next_due_date(p["habit_id"])
+    return log_id
+
+write_buffer.register("skip_habit", _apply_skip)
+
+def skip_habit(habit, date, notes=""):
+    """
+    Mark `date` as deliberately skipped (not counted as a miss).
+    Returns the marker's log id, or None if the day is already logged.
+    """
+    habit = Habit.from_row(habit)
+    payload = {
+        "log_id": str(ObjectId()), "habit_id": str(habit.id), "date": str(to_date(date)),
+        "notes": notes, "timestamp": datetime.now().isoformat(),
+    }
+    if BUFFER_WRITES:
+        state = get_day_states(payload["date"]).get(payload["habit_id"])
+        if state is not None and state[1] != "Missed":
+            return None
+        write_buffer.append("skip_habit", payload)
+        return payload["log_id"]
+    try:
+        return _apply_skip(payload)
+    except Exception as e:
+        report_error(f"Mongo Error: {e}")
+        return None
+
+def materialize_missed_days(start=None, end=None):
+    """
+    Write a 'Missed' marker for every due day in [start, end] that an active habit
+    left unlogged (default: the last MISSED_LOOKBACK_DAYS days; never today or later).
+    Idempotent. Returns the number of markers written.
+    """
+    yesterday = datetime.now().date() - timedelta(days=1)
+    end = min(to_date(end), yesterday) if end else yesterday
+    start = to_date(start) if start else end - timedelta(days=MISSED_LOOKBACK_DAYS - 1)
+    if start > end:
+        return 0
+    db = get_db()
+    have = {(d["habit_id"], d["date"]) for d in db.logs.find(
+        {"date": {"$gte": str(start), "$lte": str(end)}}, {"habit_id": 1, "date": 1}
+    )}
+    have |= set(_pending_logs())
+    now = datetime.now()
+    ops = [
+        UpdateOne(
+            {"habit_id": str(habit.id), "date": str(day)},
+            {"$setOnInsert": {"status": "Missed", "notes": None, "value": 0, "timestamp": now, "updated_at": now}},
+            upsert=True
+        )
+        for habit in habits_from_df(load_habits(active_only=True))
+        for day in bitmaps.due_days(habit, start, end)
+        if (str(habit.id), str(day)) not in have
+    ]
+    if not ops:
+        return 0
+    return db.logs.bulk_write(ops, ordered=False).upserted_count
+
+# (day, earliest day closed) for the lazy close in get_miss_stats
+_days_closed = None
+
+def get_miss_stats(days=30, today=None):
+    """
+    Missed and skipped due days per habit over the `days` days before today.
+    Returns a DataFrame: habit_id, missed, skipped (a Partial day counts as missed).
+    """
+    global _days_closed
+    today = today or datetime.now().date()
+    start = today - timedelta(days=days)
+    if _days_closed is None or _days_closed[0] != today or start < _days_closed[1]:
+        materialize_missed_days(start, today - timedelta(days=1))
+        _days_closed = (today, start)
+    skipped = {"$cond": [{"$eq": ["$status", "Skipped"]}, 1, 0]}
+    rows = list(get_db().logs.aggregate([
+        {"$match": {"status": {"$in": ["Missed", "Skipped", "Partial"]}, "date": {"$gte": str(start), "$lt": str(today)}}},
+        {"$group": {"_id": "$habit_id", "missed": {"$sum": {"$subtract": [1, skipped]}}, "skipped": {"$sum": skipped}}},
+        {"$sort": {"_id": 1}},
+    ]))
+    if not rows:
+        return pd.DataFrame(columns=['habit_id', 'missed', 'skipped'])
+    return pd.DataFrame([{"habit_id": r["_id"], "missed": r["missed"], "skipped": r["skipped"]} for r in rows])
+
+# --- MAINTENANCE ---
+
+EXPECTED_INDEXES = {
+    "habits": ["is_active_1_next_due_date_1", "habits_text"],
+    "logs": ["habit_id_1_date_1", "status_1_date_1", "logs_text"],
+    "reminders": ["is_completed_1_created_at_-1__id_-1", "is_completed_1_notified_at_1_due_at_1", "reminders_text"],
+    "projects": ["is_completed_1_created_at_-1__id_-1", "projects_text"],
+    "habit_bitmaps": ["habit_id_1"],
+}
+
+def check_schema():
+    """Return a list of schema problems (version, missing progress doc or indexes); empty if healthy."""
+    db = get_db()
+    problems = []
+    version = get_schema_version()
+    if version < LATEST_VERSION:
+        problems.append(f"schema version {version}, expected {LATEST_VERSION}")
+    if not db.user_progress.find_one({"_id": 1}):
+        problems.append("missing user_progress document")
+    for coll, names in EXPECTED_INDEXES.items():
+        present = set(db[coll].index_information())
+        problems += [f"missing index {coll}.{n}" for n in names if n not in present]
+    return problems
+
+def vacuum_db():
+    """Compact collections (needs the compact privilege; skipped where not allowed)."""
+    db = get_db()
+    result = {}
+    for coll in ("habits", "logs", "reminders", "projects", "habit_bitmaps"):
+        try:
+            db.command({"compact": coll})
+            result[coll] = "compacted"
+        except Exception as e:
+            result[coll] = f"skipped ({e})"
+    return result
 
 def get_habit_stats(habit_id):
+    """Get simple stats for a habit: {'count', 'last_log'}."""
     db = get_db()
-    logs = list(db.logs.find({"habit_id": habit_id}))
-    if not logs: return None
+    habit_id = str(habit_id)
+    query = {"habit_id": habit_id, **LOGGED_FILTER}
+    last = db.logs.find_one(query, {"date": 1}, sort=[("date", -1)])
+    if last is None:
+        return {"count": 0, "last_log": None}
+    return {"count": db.logs.count_documents(query), "last_log": last["date"]}
+
+# --- SEARCH ---
+def _snippet(text, terms, width=60):
+    """Short excerpt around the first matching term, with matches in **bold**."""
+    text = text or ""
+    lower = text.lower()
+    hits = [lower.find(t.lower()) for t in terms if t.lower() in lower]
+    start = max(0, min(hits) - width // 2) if hits else 0
+    excerpt = text[start:start + width]
+    for t in terms:
+        idx = excerpt.lower().find(t.lower())
+        if idx >= 0:
+            excerpt = excerpt[:idx] + "**" + excerpt[idx:idx + len(t)] + "**" + excerpt[idx + len(t):]
+    return ("…" if start > 0 else "") + excerpt + ("…" if start + width < len(text) else "")
+
+def search_entities(terms, entity_types, limit, offset):
+    """Ranked $text search across entity types, merged by textScore."""
+    db = get_db()
+    hits = []
+    for entity in entity_types:
+        coll, fields, extra = _SEARCH_COLLECTIONS[entity]
+        projection = {"score": {"$meta": "textScore"}, "habit_id": 1, "date": 1, **{f: 1 for f in fields}}
+        cursor = (
+            db[coll].find({"$text": {"$search": " ".join(terms)}, **extra}, projection)
+            .sort([("score", {"$meta": "textScore"})])
+            .limit(offset + limit)
+        )
+        for doc in cursor:
+            text = " ".join(str(doc.get(f) or "") for f in fields)
+            hits.append({
+                "entity": entity,
+                "id": str(doc["_id"]),
+                "title": doc.get(fields[0]) if entity != "log" else doc.get("habit_id"),
+                "snippet": _snippet(text, terms),
+                "score": doc["score"],
+                "date": doc.get("date"),
+            })
+    
+    hits.sort(key=lambda h: h["score"], reverse=True)
+    hits = hits[offset:offset + limit]
+    # Log titles: "<habit name> · <date>", resolved in one lookup
+    habit_ids = {h["title"] for h in hits if h["entity"] == "log" and h["title"]}
+    if habit_ids:
+        names = {str(d["_id"]): d["name"] for d in db.habits.find({"_id": {"$in": [ObjectId(i) for i in habit_ids]}}, {"name": 1})}
+        for h in hits:
+            if h["entity"] == "log":
+                h["title"] = f"{names.get(h['title'], 'Habit')} · {h['date']}"
     
-    count = len(logs)
-    last_log = max(l['date'] for l in logs)
-    return {"count": count, "last_log": last_log}
+    df = pd.DataFrame(hits, columns=['entity', 'id', 'title', 'snippet', 'score', 'date'])
+    return df.drop(columns=['date'])
 
 # --- REMINDERS & PROJECTS ---
-def add_reminder(text, priority='low'):
-    get_db().reminders.insert_one({
-        "text": text, "priority": priority, "is_completed": 0, "created_at": datetime.now()
-    })
+def _record_tombstone(collection, doc_id):
+    """Remember a hard delete so src/sync.py can replay it on SQLite."""
+    get_db().tombstones.insert_one({"collection": collection, "doc_id": str(doc_id), "deleted_at": datetime.now()})
+
+# Buffered writes for reminders and projects: generic insert/set/delete by _id
+def _doc_times(doc):
+    """Buffered docs carry ISO strings; store created_at/due_at as datetimes."""
+    due_at = doc.get("due_at")
+    return {
+        **doc, "created_at": datetime.fromisoformat(doc["created_at"]),
+        **({"due_at": datetime.fromisoformat(due_at)} if due_at else {}),
+    }
+
+def _apply_insert(p):
+    doc = {**_doc_times(p["doc"]), "updated_at": datetime.now()}
+    get_db()[p["collection"]].update_one({"_id": ObjectId(p["id"])}, {"$setOnInsert": doc}, upsert=True)
     return True
 
+def _apply_set(p):
+    res = get_db()[p["collection"]].update_one(
+        {"_id": ObjectId(p["id"])}, {"$set": {**p["fields"], "updated_at": datetime.now()}}
+    )
+    return res.modified_count > 0
+
+def _apply_delete(p):
+    res = get_db()[p["collection"]].delete_one({"_id": ObjectId(p["id"])})
+    if res.deleted_count:
+        _record_tombstone(p["collection"], p["id"])
+    return res.deleted_count > 0
+
+write_buffer.register("insert", _apply_insert)
+write_buffer.register("set", _apply_set)
+write_buffer.register("delete", _apply_delete)
+
+def _write(op, payload):
+    """Buffer the write, or apply it now when buffering is off."""
+    if BUFFER_WRITES:
+        write_buffer.append(op, payload)
+        return True
+    return {"insert": _apply_insert, "set": _apply_set, "delete": _apply_delete}[op](payload)
+
+def _merge_pending_docs(collection, docs, pending_only):
+    """Overlay buffered inserts/updates/deletes on a loaded reminder or project list."""
+    ops = [p for p in write_buffer.pending("insert", "set", "delete") if p["collection"] == collection] if BUFFER_WRITES else []
+    if not ops:
+        return docs
+    by_id = {str(d["_id"]): dict(d) for d in docs}
+    for p in ops:
+        if p["op"] == "insert":
+            by_id[p["id"]] = {**_doc_times(p["doc"]), "_id": p["id"]}
+        elif p["op"] == "set" and p["id"] in by_id:
+            by_id[p["id"]].update(p["fields"])
+        elif p["op"] == "delete":
+            by_id.pop(p["id"], None)
+    docs = [d for d in by_id.values() if not pending_only or not d.get("is_completed")]
+    return sorted(docs, key=lambda d: d["created_at"], reverse=True)
+
+def add_reminder(text, priority='low', due_at=None, recurrence=None):
+    """`due_at` (datetime or ISO string) schedules a notification; `recurrence` is one of RECURRENCES."""
+    doc = {
+        "text": text, "priority": priority, "is_completed": 0, "created_at": datetime.now().isoformat(),
+        "due_at": to_timestamp(due_at), "recurrence": recurrence if due_at else None, "notified_at": None,
+    }
+    return _write("insert", {"collection": "reminders", "id": str(ObjectId()), "doc": doc})
+
 def get_reminders(pending_only=True):
     query = {"is_completed": 0} if pending_only else {}
-    cursor = get_db().reminders.find(query).sort("created_at", -1)
-    df = pd.DataFrame(list(cursor))
-    if df.empty: return pd.DataFrame(columns=['id', 'text', 'priority', 'is_completed', 'created_at'])
+    docs = _read(("reminders", pending_only), lambda: list(get_db().reminders.find(query).sort("created_at", -1)))
+    df = pd.DataFrame(_merge_pending_docs("reminders", docs, pending_only))
+    if df.empty: return pd.DataFrame(columns=['id', 'text', 'priority', 'is_completed', 'created_at', 'due_at', 'recurrence'])
     df['id'] = df['_id'].astype(str)
-    return df
+    return df.drop(columns=['_id'])
+
+def _keyset_page(collection, pending_only, cursor, limit, columns):
+    """
+    One page ordered newest first by (created_at, _id).
+    Returns (df, next_cursor); pass next_cursor back to get the following page.
+    """
+    query = {"is_completed": 0} if pending_only else {}
+    if cursor is not None:
+        created_at, last_id = cursor
+        query["$or"] = [
+            {"created_at": {"$lt": created_at}},
+            {"created_at": created_at, "_id": {"$lt": ObjectId(last_id)}},
+        ]
+    docs = list(
+        get_db()[collection].find(query)
+        .sort([("created_at", -1), ("_id", -1)])
+        .limit(limit + 1)
+    )
+    next_cursor = None
+    if len(docs) > limit:
+        docs = docs[:limit]
+        next_cursor = (docs[-1]["created_at"], str(docs[-1]["_id"]))
+    df = pd.DataFrame(docs)
+    if df.empty: return pd.DataFrame(columns=columns), None
+    df['id'] = df['_id'].astype(str)
+    return df.drop(columns=['_id']), next_cursor
+
+def get_reminders_page(pending_only=True, cursor=None, limit=20):
+    return _keyset_page("reminders", pending_only, cursor, limit, ['id', 'text', 'priority', 'is_completed', 'created_at', 'due_at', 'recurrence'])
 
 def update_reminder_status(rid, is_completed=True):
     val = 1 if is_completed else 0
-    res = get_db().reminders.update_one({"_id": ObjectId(rid)}, {"$set": {"is_completed": val}})
-    return res.modified_count > 0
+    return _write("set", {"collection": "reminders", "id": str(rid), "fields": {"is_completed": val}})
 
 def delete_reminder(rid):
-    res = get_db().reminders.delete_one({"_id": ObjectId(rid)})
-    return res.deleted_count > 0
+    return _write("delete", {"collection": "reminders", "id": str(rid)})
+
+# --- REMINDER NOTIFICATIONS ---
+
+def get_due_reminders(until, limit=500):
+    """Pending, not yet notified reminders with due_at <= `until`, soonest first (buffered adds included)."""
+    until = pd.Timestamp(until).to_pydatetime()
+    docs = list(
+        get_db().reminders.find({"is_completed": 0, "notified_at": None, "due_at": {"$lte": until}})
+        .sort("due_at", 1).limit(limit)
+    )
+    docs = [
+        d for d in _merge_pending_docs("reminders", docs, True)
+        if d.get("due_at") and not d.get("notified_at") and d["due_at"] <= until
+    ]
+    docs.sort(key=lambda d: d["due_at"])
+    return [
+        {"id": str(d["_id"]), "text": d["text"], "priority": d["priority"],
+         "due_at": d["due_at"], "recurrence": d.get("recurrence")}
+        for d in docs[:limit]
+    ]
+
+def claim_reminder(rid, due_at, next_due_at=None):
+    """
+    Mark the occurrence at `due_at` delivered: a one-off reminder gets notified_at,
+    a recurring one moves on to `next_due_at`. Conditional on the stored due_at,
+    so with several processes only one fires each occurrence. Returns True if claimed here.
+    Written directly (not buffered): the claim is the lock.
+    """
+    now = datetime.now()
+    fields = {"notified_at": now} if next_due_at is None else {"due_at": pd.Timestamp(next_due_at).to_pydatetime()}
+    res = get_db().reminders.update_one(
+        {"_id": ObjectId(rid), "due_at": pd.Timestamp(due_at).to_pydatetime(), "is_completed": 0, "notified_at": None},
+        {"$set": {**fields, "updated_at": now}}
+    )
+    return res.modified_count == 1
 
 def add_project(text, description, priority='low'):
-    get_db().projects.insert_one({
-        "text": text, "description": description, "priority": priority, 
-        "is_completed": 0, "created_at": datetime.now()
-    })
-    return True
+    doc = {
+        "text": text, "description": description, "priority": priority,
+        "is_completed": 0, "created_at": datetime.now().isoformat()
+    }
+    return _write("insert", {"collection": "projects", "id": str(ObjectId()), "doc": doc})
 
 def get_projects(pending_only=True):
     query = {"is_completed": 0} if pending_only else {}
-    cursor = get_db().projects.find(query).sort("created_at", -1)
-    df = pd.DataFrame(list(cursor))
+    docs = _read(("projects", pending_only), lambda: list(get_db().projects.find(query).sort("created_at", -1)))
+    df = pd.DataFrame(_merge_pending_docs("projects", docs, pending_only))
     if df.empty: return pd.DataFrame()
     df['id'] = df['_id'].astype(str)
-    return df
+    return df.drop(columns=['_id'])
+
+def get_projects_page(pending_only=True, cursor=None, limit=20):
+    return _keyset_page("projects", pending_only, cursor, limit, ['id', 'text', 'description', 'priority', 'is_completed', 'created_at'])
 
 def update_project_status(pid, is_completed=True):
     val = 1 if is_completed else 0
-    res = get_db().projects.update_one({"_id": ObjectId(pid)}, {"$set": {"is_completed": val}})
-    return res.modified_count > 0
+    return _write("set", {"collection": "projects", "id": str(pid), "fields": {"is_completed": val}})
 
 def delete_project(pid):
-    res = get_db().projects.delete_one({"_id": ObjectId(pid)})
-    return res.deleted_count > 0
+    return _write("delete", {"collection": "projects", "id": str(pid)})
+
+# Appliers are all registered now: drain writes journaled by an earlier run
+if BUFFER_WRITES:
+    write_buffer.start_worker()
@@ -1,42 +1,16 @@
-import streamlit as st
 import pandas as pd
-from datetime import datetime
+from datetime import datetime, timedelta
 import json
-from src.database import run_query, init_db
+from src.database import run_query, init_db, get_db_connection, get_schema_version, LATEST_VERSION
 from src.gamification import calculate_xp_gain, get_level_info, BADGES
+from src import bitmaps
+from src.models import Habit, habits_from_df
+from src.utils import HABIT_COLUMNS, LOG_COLUMNS, LOG_ALL_COLUMNS, compact_habits, compact_logs, to_date, to_timestamp, report_error, MISSED_LOOKBACK_DAYS, HISTORY_COLUMNS, REMINDER_COLUMNS, PROJECT_COLUMNS
 
-# --- GAMIFICATION DB ---
-def init_gamification_db():
-    """Ensure user_progress table exists with correct schema."""
-    # 1. Create table with minimal schema if it doesn't exist
-    query = """
-        CREATE TABLE IF NOT EXISTS user_progress (
-            id INTEGER PRIMARY KEY,
-            total_xp INTEGER DEFAULT 0
-        )
-    """
-    run_query(query)
-    
-    # 2. Check schema using PRAGMA (Robust Migration)
-    res = run_query("PRAGMA table_info(user_progress)")
-    existing_columns = [row['name'] for row in res] if res else []
-    
-    if "unlocked_badges" not in existing_columns:
-        try:
-            run_query("ALTER TABLE user_progress ADD COLUMN unlocked_badges TEXT DEFAULT '[]'")
-        except Exception as e:
-            st.error(f"Migration failed: {e}")
-
-    # 3. Ensure raw row exists
-    check = run_query("SELECT id FROM user_progress WHERE id = 1")
-    if not check:
-        # Safe insert now that column exists
-        run_query("INSERT INTO user_progress (id, total_xp, unlocked_badges) VALUES (1, 0, '[]')")
-
-# Initialize DBs
+# Initialize DB (one schema_version read once migrated)
 init_db()
-init_gamification_db()
 
+# --- GAMIFICATION ---
 def get_user_progress():
     """Fetch current user progress."""
     res = run_query("SELECT total_xp, unlocked_badges FROM user_progress WHERE id = 1")
@@ -46,62 +20,222 @@ def get_user_progress():
     return {"total_xp": 0, "unlocked_badges": []}
 
 def update_user_progress(xp_delta, new_badges=None):
-    """Add XP and save new badges."""
-    curr = get_user_progress()
-    new_xp = curr['total_xp'] + xp_delta
-    badges = curr['unlocked_badges']
-    
-    if new_badges:
-        for b in new_badges:
-            if b not in badges:
-                badges.append(b)
-    
+    """
+    Add XP and save new badges in one statement, so concurrent completions
+    (api.py threads, the reward worker) never overwrite each other's XP.
+    """
+    res = run_query(
+        """
+        UPDATE user_progress SET
+            total_xp = total_xp + ?,
+            unlocked_badges = (
+                SELECT json_group_array(value) FROM (
+                    SELECT value FROM json_each(user_progress.unlocked_badges)
+                    UNION ALL
+                    SELECT value FROM json_each(?)
+                    WHERE value NOT IN (SELECT value FROM json_each(user_progress.unlocked_badges))
+                )
+            )
+        WHERE id = 1
+        RETURNING total_xp, unlocked_badges
+        """,
+        (xp_delta, json.dumps(list(dict.fromkeys(new_badges or []))))
+    )
+    if not res:
+        curr = get_user_progress()
+        return curr['total_xp'], curr['unlocked_badges']
+    return res[0]['total_xp'], json.loads(res[0]['unlocked_badges'])
+
+# --- MODEL STATE ---
+
+def load_model_state(name):
+    """Return the persisted state dict for an ml_logic model, or None."""
+    res = run_query("SELECT state FROM model_state WHERE name = ?", (name,))
+    return json.loads(res[0]['state']) if res else None
+
+def save_model_state(name, state):
     run_query(
-        "UPDATE user_progress SET total_xp = ?, unlocked_badges = ? WHERE id = 1",
-        (new_xp, json.dumps(badges))
+        "INSERT INTO model_state (name, state, updated_at) VALUES (?, ?, CURRENT_TIMESTAMP) "
+        "ON CONFLICT(name) DO UPDATE SET state = excluded.state, updated_at = excluded.updated_at",
+        (name, json.dumps(state))
     )
-    return new_xp, badges
 
 # --- HABITS ---
 
-def load_habits(active_only=True):
-    """Load all habits from SQLite."""
-    query = "SELECT * FROM habits"
+def _projection(columns, default, allowed):
+    """Validate a requested column list before it is spliced into SQL."""
+    columns = list(columns or default)
+    unknown = [c for c in columns if c not in allowed]
+    if unknown:
+        raise ValueError(f"Unknown columns: {unknown}")
+    return columns
+
+def load_habits(active_only=True, columns=None, due_on=None):
+    """
+    Load habits from SQLite, projecting only the requested columns.
+    `due_on` (YYYY-MM-DD) restricts to habits whose next_due_date is that day.
+    """
+    columns = _projection(columns, HABIT_COLUMNS, HABIT_COLUMNS)
+    clauses, params = [], []
     if active_only:
-        query += " WHERE is_active = 1"
+        clauses.append("is_active = 1")
+    if due_on is not None:
+        clauses.append("next_due_date = ?")
+        params.append(str(due_on))
+    
+    query = f"SELECT {', '.join(columns)} FROM habits"
+    if clauses:
+        query += " WHERE " + " AND ".join(clauses)
     query += " ORDER BY created_at DESC"
     
-    df = run_query(query, return_df=True)
-    if df.empty:
+    df = run_query(query, tuple(params), return_df=True)
+    if df is None or df.empty:
         # Return empty df with expected columns
-        return pd.DataFrame(columns=['id', 'name', 'category', 'frequency_type', 'frequency_value', 'target_value', 'target_unit', 'created_at', 'is_active'])
-    return df
+        return pd.DataFrame(columns=columns)
+    return compact_habits(df, columns)
 
-def load_logs(days_back=30):
-    """Load logs for recent history."""
-    # Limit to recent logs for performance, unless needed otherwise
-    query = f"""
-        SELECT * FROM logs 
-        WHERE date >= date('now', '-{days_back} days')
-        ORDER BY date DESC
+# Partial days (measurable habits below target) are progress, not completions;
+# day markers (see DAY_MARKERS) are neither. Skipped days still close the day.
+MARKERS_SQL = "('Missed', 'Skipped')"
+COMPLETED_SQL = "(status IS NULL OR status NOT IN ('Partial', 'Missed', 'Skipped'))"
+LOGGED_SQL = f"(status IS NULL OR status NOT IN {MARKERS_SQL})"
+CLOSED_SQL = "(status IS NULL OR status NOT IN ('Partial', 'Missed'))"
+
+def load_logs(days_back=30, columns=None, habit_id=None, include_partial=False):
     """
-    df = run_query(query, return_df=True)
-    if df.empty:
-        return pd.DataFrame(columns=['id', 'habit_id', 'date', 'value', 'status', 'notes', 'timestamp'])
-    return df
+    Load logs for recent history with compact dtypes.
+    `days_back=None` loads the full history; notes are only read via load_log_notes.
+    Partial days are skipped unless `include_partial`; day markers always are.
+    """
+    columns = _projection(columns, LOG_COLUMNS, LOG_ALL_COLUMNS)
+    clauses, params = [LOGGED_SQL if include_partial else COMPLETED_SQL], []
+    if days_back is not None:
+        clauses.append("date >= date('now', ?)")
+        params.append(f"-{int(days_back)} days")
+    if habit_id is not None:
+        clauses.append("habit_id = ?")
+        params.append(habit_id)
+    
+    query = f"SELECT {', '.join(columns)} FROM logs"
+    if clauses:
+        query += " WHERE " + " AND ".join(clauses)
+    query += " ORDER BY date DESC"
+    
+    df = run_query(query, tuple(params), return_df=True)
+    if df is None or df.empty:
+        return pd.DataFrame(columns=columns)
+    return compact_logs(df, columns)
+
+def load_log_notes(log_ids):
+    """Lazily fetch notes for the given log ids. Returns {log_id: notes}."""
+    if not log_ids:
+        return {}
+    ids = [int(i) for i in log_ids]
+    placeholders = ",".join("?" * len(ids))
+    res = run_query(f"SELECT id, notes FROM logs WHERE id IN ({placeholders}) AND notes IS NOT NULL AND notes != ''", tuple(ids))
+    return {row['id']: row['notes'] for row in res} if res else {}
+
+def get_habit_logs_page(habit_id, cursor=None, limit=30):
+    """
+    One page of a habit's history (day markers included), newest first.
+    Keyset on the unique (habit_id, date) index, so page N costs the same as page 1.
+    Returns (df, next_cursor); pass next_cursor back to get the following page.
+    """
+    query = f"SELECT {', '.join(HISTORY_COLUMNS)} FROM logs WHERE habit_id = ?"
+    params = [habit_id]
+    if cursor is not None:
+        query += " AND date < ?"
+        params.append(cursor)
+    query += " ORDER BY date DESC LIMIT ?"
+    params.append(limit + 1)
+    df = run_query(query, tuple(params), return_df=True)
+    if df is None or df.empty:
+        return pd.DataFrame(columns=HISTORY_COLUMNS), None
+    if len(df) <= limit:
+        return df, None
+    df = df.iloc[:limit]
+    return df, df['date'].iloc[-1]
+
+def get_habit(habit_id):
+    """Return a single habit as a Habit record, or None."""
+    res = run_query("SELECT * FROM habits WHERE id = ?", (habit_id,))
+    return Habit.from_row(dict(res[0])) if res else None
+
+# --- NEXT DUE DATE ---
+# habits.next_due_date holds the first day >= today on which a habit is due and
+# not yet done. It is maintained on create/edit/completion, and rows left behind
+# by a missed day are rolled forward lazily, so the Today view is one indexed query.
+
+def _is_logged_on(habit_id, day):
+    return bool(run_query(f"SELECT 1 FROM logs WHERE habit_id = ? AND date = ? AND {CLOSED_SQL} LIMIT 1", (habit_id, str(day))))
+
+def update_next_due_date(habit_id, today=None, habit=None):
+    """Recompute next_due_date for a single habit."""
+    today = today or datetime.now().date()
+    if habit is None:
+        res = run_query("SELECT * FROM habits WHERE id = ?", (habit_id,), return_df=True)
+        if res is None or res.empty:
+            return None
+        habit = res.iloc[0]
+    next_due = Habit.from_row(habit).next_due_date(today, _is_logged_on(habit_id, today))
+    run_query("UPDATE habits SET next_due_date = ? WHERE id = ?", (next_due, habit_id))
+    return next_due
+
+def refresh_next_due_dates(today=None, force=False):
+    """
+    Roll forward stale next_due_date values (missed days, legacy rows). Returns rows updated.
+    `force` recomputes every active habit (maintenance / after bulk edits).
+    """
+    today = today or datetime.now().date()
+    query = "SELECT * FROM habits WHERE is_active = 1"
+    params = ()
+    if not force:
+        query += " AND (next_due_date IS NULL OR next_due_date < ?)"
+        params = (str(today),)
+    stale = run_query(query, params, return_df=True)
+    if stale is None or stale.empty:
+        return 0
+    done_res = run_query(f"SELECT DISTINCT habit_id FROM logs WHERE date = ? AND {CLOSED_SQL}", (str(today),))
+    done_today = {row[0] for row in done_res} if done_res else set()
+    
+    updates = [
+        (habit.next_due_date(today, habit.id in done_today), habit.id)
+        for habit in habits_from_df(stale)
+    ]
+    conn = get_db_connection()
+    try:
+        conn.executemany("UPDATE habits SET next_due_date = ? WHERE id = ?", updates)
+        conn.commit()
+    finally:
+        conn.close()
+    return len(updates)
+
+# Stale rows only appear when the day rolls over, so refresh once per day per process
+_next_due_refreshed_on = None
+
+def load_due_habits(today=None, columns=None):
+    """Pending habits for the Today view: due today and not yet completed."""
+    global _next_due_refreshed_on
+    today = today or datetime.now().date()
+    if _next_due_refreshed_on != today:
+        refresh_next_due_dates(today)
+        _next_due_refreshed_on = today
+    return load_habits(active_only=True, columns=columns, due_on=today)
 
 def add_habit(habit_data):
     """Add a new habit to the database."""
+    today = datetime.now().date()
     query = """
-        INSERT INTO habits (name, category, frequency_type, frequency_value, target_value)
-        VALUES (?, ?, ?, ?, ?)
+        INSERT INTO habits (name, category, frequency_type, frequency_value, target_value, next_due_date)
+        VALUES (?, ?, ?, ?, ?, ?)
     """
     params = (
         habit_data['name'], 
         habit_data['category'], 
         habit_data['frequency_type'], 
         habit_data['frequency_value'],
-        habit_data.get('target_value', 1)
+        habit_data.get('target_value', 1),
+        Habit.from_row({**habit_data, 'created_at': today}).next_due_date(today)
     )
     
     try:
@@ -109,7 +243,7 @@ def add_habit(habit_data):
         # Clear cache logic if we were using st.cache_data, but with SQL we just requery
         return True
     except Exception as e:
-        st.error(f"Error adding habit: {e}")
+        report_error(f"Error adding habit: {e}")
         return False
 
 def edit_habit(habit_id, updated_data):
@@ -129,9 +263,10 @@ def edit_habit(habit_id, updated_data):
     )
     try:
         run_query(query, params)
+        update_next_due_date(habit_id)
         return True
     except Exception as e:
-        st.error(f"Error updating habit: {e}")
+        report_error(f"Error updating habit: {e}")
         return False
 
 def delete_habit(habit_id):
@@ -141,127 +276,654 @@ def delete_habit(habit_id):
         run_query(query, (habit_id,))
         return True
     except Exception as e:
-        st.error(f"Error deleting habit: {e}")
+        report_error(f"Error deleting habit: {e}")
         return False
 
+def record_completion(habit, date, status="Completed", notes="", value=1):
+    """
+    Fast path for the Done button: insert the log and roll next_due_date forward
+    in a single transaction. Rewards are processed afterwards (see src.rewards).
+    Returns the log id, or None if the habit was already logged on `date`
+    (a Missed/Skipped marker for that day is replaced).
+    """
+    habit = Habit.from_row(habit)
+    day = str(to_date(date))
+    conn = get_db_connection()
+    try:
+        row = conn.execute(
+            f"""
+            INSERT INTO logs (habit_id, date, status, notes, value) VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (habit_id, date) DO UPDATE SET
+                status = excluded.status, notes = excluded.notes, value = excluded.value,
+                timestamp = CURRENT_TIMESTAMP
+            WHERE logs.status IN {MARKERS_SQL}
+            RETURNING id
+            """,
+            (habit.id, day, status, notes, value)
+        ).fetchone()
+        if row is None:
+            conn.rollback()
+            return None
+        log_id = row['id']
+        today = datetime.now().date()
+        if day == str(today):
+            conn.execute(
+                "UPDATE habits SET next_due_date = ? WHERE id = ?",
+                (habit.next_due_date(today, done_today=True), habit.id)
+            )
+        if bitmaps.ENABLED and status not in ('Partial', 'Missed', 'Skipped'):
+            # Same transaction as the log, so a streak never misses a recorded day
+            _set_completion_bit(conn, habit.id, day)
+        conn.commit()
+        return log_id
+    except Exception as e:
+        conn.rollback()
+        report_error(f"Error logging habit: {e}")
+        return None
+    finally:
+        conn.close()
+
+def process_completion_rewards(habit_id, date, log_id=None):
+    """
+    Streak, XP, badge and level processing for a recorded completion.
+    Returns RewardInfo: 'xp_earned', 'level_up', 'current_level', 'new_badges'.
+    """
+    habit = get_habit(habit_id)
+    if habit is None:
+        return {"xp_earned": 0}
+
+    if bitmaps.ENABLED:
+        # Streak from the bitmap store (the bit was set with the log): no need to pull the habit's logs
+        current_streak = bitmaps.streak_stats(habit, get_completion_bitmaps(habit_id))["current"]
+    else:
+        # Fetch all logs for this habit
+        l_res = load_logs(days_back=None, columns=['date'], habit_id=habit_id)
+
+        # Use analytics (imported locally to avoid circular deps)
+        from src.analytics import calculate_streaks
+        current_streak = calculate_streaks(habit, l_res)
+    # Previous streak was current - 1 (since we just logged)
+    prev_streak = max(0, current_streak - 1)
+
+    xp = calculate_xp_gain(current_streak, prev_streak)
+
+    # --- BADGE CHECKS ---
+    candidate_badges = []
+    curr_progress = get_user_progress()
+    existing_badges = curr_progress['unlocked_badges']
+
+    # 1. Streak Badges
+    if current_streak == 7: candidate_badges.append('week_warrior')
+    if current_streak == 30: candidate_badges.append('month_master')
+
+    # 2. First Step (If XP is 0, this is the first completion)
+    if curr_progress['total_xp'] == 0:
+        candidate_badges.append('first_step')
+
+    # 3. Hat Trick (3rd completion that day)
+    # Count only logs up to this one, so later completions processed in the
+    # same batch don't hide it.
+    count_query = f"SELECT COUNT(*) FROM logs WHERE date = ? AND {COMPLETED_SQL}"
+    count_params = (str(date),)
+    if log_id is not None:
+        count_query += " AND id <= ?"
+        count_params += (log_id,)
+    day_count_res = run_query(count_query, count_params)
+    if day_count_res and day_count_res[0][0] == 3:
+        candidate_badges.append('hat_trick')
+
+    # Filter only truly new badges
+    new_badges_unlocked = [b for b in candidate_badges if b not in existing_badges]
+
+    # Update User
+    new_xp_total, _ = update_user_progress(xp, new_badges_unlocked)
+
+    # Check Level Up
+    curr_lvl, next_lvl = get_level_info(new_xp_total)
+    prev_lvl, _ = get_level_info(new_xp_total - xp)
+
+    level_up = (curr_lvl['level'] > prev_lvl['level'])
+
+    return {
+        "xp_earned": xp,
+        "level_up": level_up,
+        "current_level": curr_lvl,
+        "new_badges": new_badges_unlocked
+    }
+
 def log_habit_completion(habit_id, date, status="Completed", notes="", value=1):
     """
-    Log a habit completion and process Gamification rewards.
+    Log a habit completion and process Gamification rewards synchronously.
     Returns: (bool, dict) -> (Success, RewardInfo)
     RewardInfo keys: 'xp_earned', 'new_level', 'new_badges'
     """
-    
-    # Check for existing log for this habit and date
-    check_query = "SELECT id FROM logs WHERE habit_id = ? AND date = ?"
-    existing = run_query(check_query, (habit_id, str(date)))
-    
-    if existing:
+    habit = get_habit(habit_id)
+    if habit is None:
+        return False, {}
+    log_id = record_completion(habit, date, status, notes, value)
+    if log_id is None:
         return False, {}
-        
-    query = """
-        INSERT INTO logs (habit_id, date, status, notes, value)
-        VALUES (?, ?, ?, ?, ?)
-    """
     try:
-        run_query(query, (habit_id, str(date), status, notes, value))
-        
-        # --- GAMIFICATION LOGIC ---
-        # 1. Calculate Streak (Approximate for speed, or fetch logs)
-        # To be accurate, we really need the logs.
-        # But we can assume if they logged today, we just need to know the PREVIOUS streak.
-        # Let's verify via full calc or just assume +1 for now to keep it snappy?
-        # No, user wants rewards for streaks. We need to calculate it.
-        # We'll do a quick query for this habit's logs.
-        
-        # We need the HABIT object to calculate streak (for frequency).
-        # Fetch habit
-        h_res = run_query("SELECT * FROM habits WHERE id = ?", (habit_id,), return_df=True)
-        if not h_res.empty:
-            habit = h_res.iloc[0]
-            # Fetch all logs for this habit
-            l_res = run_query("SELECT * FROM logs WHERE habit_id = ?", (habit_id,), return_df=True)
-            
-            # Use analytics (imported locally to avoid circular deps)
-            from src.analytics import calculate_streaks
-            current_streak = calculate_streaks(habit, l_res)
-            # Previous streak was current - 1 (since we just logged)
-            prev_streak = max(0, current_streak - 1)
-            
-            xp = calculate_xp_gain(current_streak, prev_streak)
-            
-            # --- BADGE CHECKS ---
-            candidate_badges = []
-            curr_progress = get_user_progress()
-            existing_badges = curr_progress['unlocked_badges']
-            
-            # 1. Streak Badges
-            if current_streak == 7: candidate_badges.append('week_warrior')
-            if current_streak == 30: candidate_badges.append('month_master')
-            
-            # 2. First Step (If XP is 0, this is the first completion)
-            if curr_progress['total_xp'] == 0:
-                candidate_badges.append('first_step')
-                
-            # 3. Hat Trick (3rd completion today)
-            # We just inserted the log, so count should include it.
-            day_count_res = run_query("SELECT COUNT(*) FROM logs WHERE date = ?", (str(date),))
-            if day_count_res and day_count_res[0][0] == 3:
-                candidate_badges.append('hat_trick')
-                
-            # Filter only truly new badges
-            new_badges_unlocked = [b for b in candidate_badges if b not in existing_badges]
-            
-            # Update User
-            new_xp_total, _ = update_user_progress(xp, new_badges_unlocked)
-            
-            # Check Level Up
-            curr_lvl, next_lvl = get_level_info(new_xp_total)
-            prev_lvl, _ = get_level_info(new_xp_total - xp)
-            
-            level_up = (curr_lvl['level'] > prev_lvl['level'])
-            
-            return True, {
-                "xp_earned": xp,
-                "level_up": level_up,
-                "current_level": curr_lvl,
-                "new_badges": new_badges_unlocked
-            }
-            
+        return True, process_completion_rewards(habit.id, date, log_id)
+    except Exception as e:
+        report_error(f"Error processing rewards: {e}")
         return True, {"xp_earned": 0}
-        
+
+# --- MEASURABLE PROGRESS ---
+# Measurable habits ("drink 8 glasses") keep one log row per day whose value
+# grows with each increment; the unique (habit_id, date) index makes that a
+# single upsert, and status flips to 'Completed' once value reaches target_value.
+
+def log_progress(habit, date, amount=1, notes=""):
+    """
+    Add `amount` to the habit's value for `date` in one atomic upsert.
+    Returns {'log_id', 'value', 'status', 'completed_now'} or None on error;
+    `completed_now` is True only for the increment that reached the target.
+    """
+    habit = Habit.from_row(habit)
+    day = str(to_date(date))
+    target = habit.target_value or 1
+    conn = get_db_connection()
+    try:
+        # Write lock first, so the prior status read below is the one this upsert replaces
+        conn.execute("BEGIN IMMEDIATE")
+        prior = conn.execute("SELECT status FROM logs WHERE habit_id = ? AND date = ?", (habit.id, day)).fetchone()
+        row = conn.execute(
+            """
+            INSERT INTO logs (habit_id, date, value, status, notes)
+            VALUES (?, ?, ?, CASE WHEN ? >= ? THEN 'Completed' ELSE 'Partial' END, ?)
+            ON CONFLICT (habit_id, date) DO UPDATE SET
+                value = logs.value + excluded.value,
+                status = CASE WHEN logs.status = 'Completed' OR logs.value + excluded.value >= ?
+                              THEN 'Completed' ELSE 'Partial' END
+            RETURNING id, value, status
+            """,
+            (habit.id, day, amount, amount, target, notes, target)
+        ).fetchone()
+        # Only the write that flips the day to Completed (not a later +1 on a Done day)
+        completed_now = row['status'] == 'Completed' and (prior is None or prior['status'] != 'Completed')
+        today = datetime.now().date()
+        if completed_now and day == str(today):
+            conn.execute(
+                "UPDATE habits SET next_due_date = ? WHERE id = ?",
+                (habit.next_due_date(today, done_today=True), habit.id)
+            )
+        if completed_now and bitmaps.ENABLED:
+            _set_completion_bit(conn, habit.id, day)
+        conn.commit()
+        return {"log_id": row['id'], "value": row['value'], "status": row['status'], "completed_now": completed_now}
     except Exception as e:
-        st.error(f"Error logging habit: {e}")
-        return False, {}
+        conn.rollback()
+        report_error(f"Error logging progress: {e}")
+        return None
+    finally:
+        conn.close()
+
+def get_day_values(date):
+    """{habit_id: value} logged on `date` (Today view progress bars)."""
+    res = run_query(f"SELECT habit_id, value FROM logs WHERE date = ? AND {LOGGED_SQL}", (str(to_date(date)),)) or []
+    return {row['habit_id']: row['value'] or 0 for row in res}
+
+# Bucket start for each grouping (dates are stored as YYYY-MM-DD)
+_VALUE_BUCKETS = {
+    "day": "date",
+    "week": "date(date, '-' || ((CAST(strftime('%w', date) AS INTEGER) + 6) % 7) || ' days')",
+    "month": "strftime('%Y-%m-01', date)",
+}
+
+def load_value_series(days_back=30, bucket="day", habit_id=None, include_partial=True):
+    """
+    Per-habit value totals grouped by day/week/month in SQL (weeks start Monday).
+    Returns a DataFrame: habit_id, date, value, days_logged.
+    """
+    if bucket not in _VALUE_BUCKETS:
+        raise ValueError(f"Unknown bucket: {bucket}")
+    key = _VALUE_BUCKETS[bucket]
+    clauses, params = [LOGGED_SQL if include_partial else COMPLETED_SQL], []
+    if days_back is not None:
+        clauses.append("date >= date('now', ?)")
+        params.append(f"-{int(days_back)} days")
+    if habit_id is not None:
+        clauses.append("habit_id = ?")
+        params.append(habit_id)
+    query = f"SELECT habit_id, {key} AS bucket, SUM(COALESCE(value, 1)) AS value, COUNT(*) AS days_logged FROM logs"
+    if clauses:
+        query += " WHERE " + " AND ".join(clauses)
+    query += " GROUP BY habit_id, bucket ORDER BY habit_id, bucket"
+    df = run_query(query, tuple(params), return_df=True)
+    if df is None or df.empty:
+        return pd.DataFrame(columns=['habit_id', 'date', 'value', 'days_logged'])
+    df = df.rename(columns={'bucket': 'date'})
+    df['date'] = pd.to_datetime(df['date'])
+    return df
+
+def get_data_generation():
+    """Changes whenever any log is written (trigger-maintained counter)."""
+    res = run_query("SELECT value FROM data_generation WHERE name = 'logs'")
+    return res[0][0] if res else 0
+
+# --- COMPLETION BITMAPS ---
+
+def _set_completion_bit(conn, habit_id, day):
+    # Read-modify-write on `conn`; the caller holds the write lock and commits
+    day = to_date(day)
+    year, _ = bitmaps.day_index(day)
+    row = conn.execute("SELECT bits FROM habit_bitmaps WHERE habit_id = ? AND year = ?", (habit_id, year)).fetchone()
+    conn.execute(
+        "INSERT OR REPLACE INTO habit_bitmaps (habit_id, year, bits) VALUES (?, ?, ?)",
+        (habit_id, year, bitmaps.set_day(row['bits'] if row else None, day))
+    )
+
+def mark_completion_bit(habit_id, day):
+    """Set the completion bit for `day` in the habit's yearly bitmap."""
+    conn = get_db_connection()
+    try:
+        # IMMEDIATE takes the write lock up front so the read-modify-write is atomic
+        conn.execute("BEGIN IMMEDIATE")
+        _set_completion_bit(conn, habit_id, day)
+        conn.commit()
+    finally:
+        conn.close()
+
+def get_completion_bitmaps(habit_id):
+    """Return {year: int} completion bitmaps for a habit."""
+    res = run_query("SELECT year, bits FROM habit_bitmaps WHERE habit_id = ?", (habit_id,))
+    return {row['year']: bitmaps.to_int(row['bits']) for row in res} if res else {}
+
+def rebuild_completion_bitmaps(habit_id=None):
+    """Rebuild bitmaps from logs (all habits, or one). Returns the number of rows written."""
+    query = f"SELECT habit_id, date FROM logs WHERE {COMPLETED_SQL}"
+    params = ()
+    if habit_id is not None:
+        query += " AND habit_id = ?"
+        params = (habit_id,)
+    res = run_query(query, params) or []
+    
+    dates_by_habit = {}
+    for row in res:
+        dates_by_habit.setdefault(row['habit_id'], []).append(to_date(row['date']))
+    rows = [
+        (hid, year, bitmaps.to_blob(bits))
+        for hid, dates in dates_by_habit.items()
+        for year, bits in bitmaps.build_year_bitmaps(dates).items()
+    ]
+    conn = get_db_connection()
+    try:
+        if habit_id is None:
+            conn.execute("DELETE FROM habit_bitmaps")
+        else:
+            conn.execute("DELETE FROM habit_bitmaps WHERE habit_id = ?", (habit_id,))
+        conn.executemany("INSERT INTO habit_bitmaps (habit_id, year, bits) VALUES (?, ?, ?)", rows)
+        conn.commit()
+    finally:
+        conn.close()
+    return len(rows)
+
+def get_habit_bitmap_stats(habit, today=None, window_days=30):
+    """Current/longest streak and recent completion rate from the bitmap store."""
+    habit = Habit.from_row(habit)
+    today = today or datetime.now().date()
+    completions = get_completion_bitmaps(habit.id)
+    stats = bitmaps.streak_stats(habit, completions, today)
+    stats["rate"], _ = bitmaps.completion_rate(habit, completions, today - timedelta(days=window_days - 1), today)
+    return stats
+
+def bulk_insert_logs(habit_id, dates, status="Completed", value=1):
+    """
+    Insert logs for `dates` that don't have one yet (no rewards processed); day
+    markers are replaced. Keeps bitmaps and next_due_date in sync. Returns the number of rows written.
+    """
+    dates = sorted({str(to_date(d)) for d in dates})
+    if not dates:
+        return 0
+    existing = run_query(f"SELECT date FROM logs WHERE habit_id = ? AND {LOGGED_SQL}", (habit_id,)) or []
+    have = {row['date'] for row in existing}
+    rows = [(habit_id, d, status, value) for d in dates if d not in have]
+    conn = get_db_connection()
+    try:
+        conn.executemany(
+            f"""
+            INSERT INTO logs (habit_id, date, status, value) VALUES (?, ?, ?, ?)
+            ON CONFLICT (habit_id, date) DO UPDATE SET status = excluded.status, value = excluded.value
+            WHERE logs.status IN {MARKERS_SQL}
+            """,
+            rows
+        )
+        conn.commit()
+    finally:
+        conn.close()
+    if rows:
+        rebuild_completion_bitmaps(habit_id)
+        update_next_due_date(habit_id)
+    return len(rows)
+
+# --- STREAKS ---
+# Daily and every-N-days habits are due on every step-th day from creation, so
+# a completed due day has a slot number (days since creation / step). Runs of
+# consecutive slots are islands: slot - ROW_NUMBER() is constant within one.
+# Other frequencies go through the Python path (bitmaps / calculate_streaks).
+
+STREAKS_SQL = f"""
+WITH h AS (
+    SELECT id,
+           date(created_at) AS anchor,
+           CAST(julianday(:today) - julianday(date(created_at)) AS INTEGER) AS age,
+           CASE WHEN frequency_type = 'custom' AND trim(frequency_value) <> ''
+                     AND trim(frequency_value) NOT GLOB '*[^0-9]*'
+                THEN MAX(1, CAST(trim(frequency_value) AS INTEGER)) ELSE 1 END AS step
+    FROM habits
+    WHERE COALESCE(NULLIF(frequency_type, ''), 'daily') IN ('daily', 'custom') AND created_at IS NOT NULL
+),
+slots AS (
+    SELECT DISTINCT h.id AS habit_id,
+           CAST(julianday(l.date) - julianday(h.anchor) AS INTEGER) / h.step AS slot
+    FROM logs l JOIN h ON h.id = l.habit_id
+    WHERE {COMPLETED_SQL} AND l.date >= h.anchor AND l.date <= :today
+      AND CAST(julianday(l.date) - julianday(h.anchor) AS INTEGER) % h.step = 0
+),
+islands AS (
+    SELECT habit_id, MAX(slot) AS last_slot, COUNT(*) AS length
+    FROM (SELECT habit_id, slot, slot - ROW_NUMBER() OVER (PARTITION BY habit_id ORDER BY slot) AS island FROM slots)
+    GROUP BY habit_id, island
+)
+SELECT h.id AS habit_id,
+       COALESCE(MAX(CASE WHEN i.last_slot = h.age / h.step
+                           OR (h.age % h.step = 0 AND i.last_slot = h.age / h.step - 1)
+                         THEN i.length END), 0) AS current,
+       COALESCE(MAX(i.length), 0) AS longest
+FROM h LEFT JOIN islands i ON i.habit_id = h.id
+GROUP BY h.id
+ORDER BY h.id
+"""
+
+def get_streaks(today=None):
+    """
+    Current and longest streak for every daily / every-N-days habit in one query.
+    Same rule as bitmaps.streak_stats: today only breaks the streak once it is over.
+    Returns a DataFrame: habit_id, current, longest (other frequencies are absent).
+    """
+    today = today or datetime.now().date()
+    df = run_query(STREAKS_SQL, {"today": str(today)}, return_df=True)
+    if df is None or df.empty:
+        return pd.DataFrame(columns=['habit_id', 'current', 'longest'])
+    return df
+
+# --- MISSED DAYS ---
+# Due days left unlogged are closed with a 'Missed' marker (nightly, and lazily
+# before miss analytics), so miss rates are a COUNT ... GROUP BY on the
+# logs (status, date) index instead of a walk over every habit's calendar.
+
+def skip_habit(habit, date, notes=""):
+    """
+    Mark `date` as deliberately skipped: it leaves the Today view and is not counted
+    as a miss. Returns the marker's log id, or None if the day is already logged.
+    """
+    habit = Habit.from_row(habit)
+    day = str(to_date(date))
+    conn = get_db_connection()
+    try:
+        row = conn.execute(
+            """
+            INSERT INTO logs (habit_id, date, status, notes, value) VALUES (?, ?, 'Skipped', ?, 0)
+            ON CONFLICT (habit_id, date) DO UPDATE SET status = 'Skipped', notes = excluded.notes
+            WHERE logs.status = 'Missed'
+            RETURNING id
+            """,
+            (habit.id, day, notes)
+        ).fetchone()
+        if row is None:
+            conn.rollback()
+            return None
+        today = datetime.now().date()
+        if day == str(today):
+            conn.execute(
+                "UPDATE habits SET next_due_date = ? WHERE id = ?",
+                (habit.next_due_date(today, done_today=True), habit.id)
+            )
+        conn.commit()
+        return row['id']
+    except Exception as e:
+        conn.rollback()
+        report_error(f"Error skipping habit: {e}")
+        return None
+    finally:
+        conn.close()
+
+def materialize_missed_days(start=None, end=None):
+    """
+    Write a 'Missed' marker for every due day in [start, end] that an active habit
+    left unlogged (default: the last MISSED_LOOKBACK_DAYS days; never today or later).
+    Idempotent, so it doubles as a backfill. Returns the number of markers written.
+    """
+    yesterday = datetime.now().date() - timedelta(days=1)
+    end = min(to_date(end), yesterday) if end else yesterday
+    start = to_date(start) if start else end - timedelta(days=MISSED_LOOKBACK_DAYS - 1)
+    if start > end:
+        return 0
+    res = run_query("SELECT habit_id, date FROM logs WHERE date BETWEEN ? AND ?", (str(start), str(end))) or []
+    have = {(row['habit_id'], row['date']) for row in res}
+    rows = [
+        (habit.id, str(day))
+        for habit in habits_from_df(load_habits(active_only=True))
+        for day in bitmaps.due_days(habit, start, end)
+        if (habit.id, str(day)) not in have
+    ]
+    conn = get_db_connection()
+    try:
+        conn.executemany(
+            """
+            INSERT INTO logs (habit_id, date, status, value) VALUES (?, ?, 'Missed', 0)
+            ON CONFLICT (habit_id, date) DO NOTHING
+            """,
+            rows
+        )
+        conn.commit()
+    finally:
+        conn.close()
+    return len(rows)
+
+# (day, earliest day closed) for the lazy close in get_miss_stats
+_days_closed = None
+
+def get_miss_stats(days=30, today=None):
+    """
+    Missed and skipped due days per habit over the `days` days before today.
+    Returns a DataFrame: habit_id, missed, skipped (a Partial day counts as missed).
+    """
+    global _days_closed
+    today = today or datetime.now().date()
+    start = today - timedelta(days=days)
+    if _days_closed is None or _days_closed[0] != today or start < _days_closed[1]:
+        materialize_missed_days(start, today - timedelta(days=1))
+        _days_closed = (today, start)
+    df = run_query(
+        """
+        SELECT habit_id,
+               SUM(status IN ('Missed', 'Partial')) AS missed,
+               SUM(status = 'Skipped') AS skipped
+        FROM logs
+        WHERE status IN ('Missed', 'Skipped', 'Partial') AND date >= ? AND date < ?
+        GROUP BY habit_id
+        """,
+        (str(start), str(today)), return_df=True
+    )
+    if df is None or df.empty:
+        return pd.DataFrame(columns=['habit_id', 'missed', 'skipped'])
+    return df
+
+# --- MAINTENANCE ---
+
+EXPECTED_SCHEMA = {
+    "habits": HABIT_COLUMNS,
+    "logs": LOG_ALL_COLUMNS,
+    "reminders": REMINDER_COLUMNS,
+    "projects": ['id', 'text', 'description', 'priority', 'created_at', 'is_completed'],
+    "user_progress": ['id', 'total_xp', 'unlocked_badges'],
+    "habit_bitmaps": ['habit_id', 'year', 'bits'],
+    "model_state": ['name', 'state', 'updated_at'],
+    "schema_version": ['version', 'name', 'applied_at'],
+    "data_generation": ['name', 'value'],
+    "sync_state": ['key', 'value'],
+    "sync_ids": ['table_name', 'local_id', 'remote_id'],
+    "changes": ['table_name', 'row_id', 'seq', 'deleted'],
+}
+EXPECTED_INDEXES = [
+    "idx_habits_next_due", "idx_logs_habit_date", "idx_logs_status_date",
+    "idx_reminders_status_created", "idx_projects_status_created", "idx_reminders_due",
+    "idx_changes_seq", "idx_sync_ids_remote",
+]
+
+def check_schema():
+    """Return a list of schema problems (missing tables, columns, indexes); empty if healthy."""
+    problems = []
+    conn = get_db_connection()
+    try:
+        version = get_schema_version(conn)
+    finally:
+        conn.close()
+    if version < LATEST_VERSION:
+        problems.append(f"schema version {version}, expected {LATEST_VERSION}")
+    for table, columns in EXPECTED_SCHEMA.items():
+        res = run_query(f"PRAGMA table_info({table})")
+        if not res:
+            problems.append(f"missing table {table}")
+            continue
+        present = {row['name'] for row in res}
+        problems += [f"missing column {table}.{c}" for c in columns if c not in present]
+    indexes = {row['name'] for row in run_query("SELECT name FROM sqlite_master WHERE type IN ('index', 'table')") or []}
+    problems += [f"missing index {i}" for i in EXPECTED_INDEXES if i not in indexes]
+    problems += [f"missing search index {t}_fts" for t in ("habits", "logs", "reminders", "projects") if f"{t}_fts" not in indexes]
+    integrity = run_query("PRAGMA quick_check")
+    if integrity and integrity[0][0] != "ok":
+        problems.append(f"integrity: {integrity[0][0]}")
+    return problems
+
+def vacuum_db():
+    """Refresh planner statistics and compact the database file. Returns size before/after in bytes."""
+    import os
+    from src.database import DB_PATH
+    before = os.path.getsize(DB_PATH)
+    conn = get_db_connection()
+    try:
+        conn.execute("ANALYZE")
+        for table in ("habits", "logs", "reminders", "projects"):
+            conn.execute(f"INSERT INTO {table}_fts ({table}_fts) VALUES ('optimize')")
+        conn.commit()
+        conn.execute("VACUUM")
+    finally:
+        conn.close()
+    return {"size_before": before, "size_after": os.path.getsize(DB_PATH)}
 
 def get_habit_stats(habit_id):
-    """Get simple stats for a habit."""
-    query = """
+    """Get simple stats for a habit: {'count', 'last_log'}."""
+    query = f"""
         SELECT COUNT(*) as count, MAX(date) as last_log 
         FROM logs 
-        WHERE habit_id = ?
+        WHERE habit_id = ? AND {LOGGED_SQL}
     """
     res = run_query(query, (habit_id,))
     if res:
-        return res[0]
-    return None
+        return dict(res[0])
+    return {"count": 0, "last_log": None}
+
+# --- SEARCH ---
+
+_SEARCH_SQL = {
+    "habit": """
+        SELECT 'habit' AS entity, h.id AS id, h.name AS title,
+               snippet(habits_fts, -1, '**', '**', '…', 12) AS snippet, -bm25(habits_fts) AS score
+        FROM habits_fts JOIN habits h ON h.id = habits_fts.rowid
+        WHERE habits_fts MATCH ? AND h.is_active = 1
+    """,
+    "log": """
+        SELECT 'log' AS entity, l.id AS id, COALESCE(h.name, 'Habit') || ' · ' || l.date AS title,
+               snippet(logs_fts, 0, '**', '**', '…', 12) AS snippet, -bm25(logs_fts) AS score
+        FROM logs_fts JOIN logs l ON l.id = logs_fts.rowid LEFT JOIN habits h ON h.id = l.habit_id
+        WHERE logs_fts MATCH ?
+    """,
+    "reminder": """
+        SELECT 'reminder' AS entity, r.id AS id, r.text AS title,
+               snippet(reminders_fts, 0, '**', '**', '…', 12) AS snippet, -bm25(reminders_fts) AS score
+        FROM reminders_fts JOIN reminders r ON r.id = reminders_fts.rowid
+        WHERE reminders_fts MATCH ?
+    """,
+    "project": """
+        SELECT 'project' AS entity, p.id AS id, p.text AS title,
+               snippet(projects_fts, -1, '**', '**', '…', 12) AS snippet, -bm25(projects_fts) AS score
+        FROM projects_fts JOIN projects p ON p.id = projects_fts.rowid
+        WHERE projects_fts MATCH ?
+    """,
+}
+
+def search_entities(terms, entity_types, limit, offset):
+    """
+    Ranked FTS5 search across entity types.
+    `terms` are plain words; the last one is prefix-matched (search-as-you-type).
+    """
+    quoted = ['"' + t.replace('"', '""') + '"' for t in terms]
+    quoted[-1] += "*"
+    match = " ".join(quoted)
+    
+    parts = [_SEARCH_SQL[e] for e in entity_types]
+    query = " UNION ALL ".join(parts) + " ORDER BY score DESC LIMIT ? OFFSET ?"
+    params = (match,) * len(parts) + (limit, offset)
+    df = run_query(query, params, return_df=True)
+    if df is None:
+        return pd.DataFrame(columns=['entity', 'id', 'title', 'snippet', 'score'])
+    return df
 
 # --- Reminder System ---
 
-def add_reminder(text, priority='low'):
-    query = "INSERT INTO reminders (text, priority) VALUES (?, ?)"
+def add_reminder(text, priority='low', due_at=None, recurrence=None):
+    """`due_at` (datetime or ISO string) schedules a notification; `recurrence` is one of RECURRENCES."""
+    query = "INSERT INTO reminders (text, priority, due_at, recurrence) VALUES (?, ?, ?, ?)"
     try:
-        run_query(query, (text, priority))
+        run_query(query, (text, priority, to_timestamp(due_at), recurrence if due_at else None))
         return True
     except Exception as e:
-        st.error(f"Error adding reminder: {e}")
+        report_error(f"Error adding reminder: {e}")
         return False
 
-def get_reminders(pending_only=True):
-    query = "SELECT * FROM reminders"
+def _list(table, columns, pending_only):
+    query = f"SELECT * FROM {table}"
     if pending_only:
         query += " WHERE is_completed = 0"
     query += " ORDER BY created_at DESC"
-    return run_query(query, return_df=True)
+    df = run_query(query, return_df=True)
+    # A failed query comes back as None; callers always get a frame
+    return df if df is not None else pd.DataFrame(columns=columns)
+
+def get_reminders(pending_only=True):
+    return _list("reminders", REMINDER_COLUMNS, pending_only)
+
+def _keyset_page(table, columns, pending_only, cursor, limit):
+    """
+    One page of `table` ordered newest first by (created_at, id).
+    Returns (df, next_cursor); pass next_cursor back to get the following page.
+    """
+    clauses, params = [], []
+    if pending_only:
+        clauses.append("is_completed = 0")
+    if cursor is not None:
+        clauses.append("(created_at, id) < (?, ?)")
+        params.extend(cursor)
+    query = f"SELECT * FROM {table}"
+    if clauses:
+        query += " WHERE " + " AND ".join(clauses)
+    query += " ORDER BY created_at DESC, id DESC LIMIT ?"
+    params.append(limit + 1)
+    
+    df = run_query(query, tuple(params), return_df=True)
+    if df is None:
+        return pd.DataFrame(columns=columns), None
+    if len(df) <= limit:
+        return df, None
+    df = df.iloc[:limit]
+    last = df.iloc[-1]
+    return df, (last['created_at'], int(last['id']))
+
+def get_reminders_page(pending_only=True, cursor=None, limit=20):
+    return _keyset_page("reminders", REMINDER_COLUMNS, pending_only, cursor, limit)
 
 def update_reminder_status(reminder_id, is_completed=True):
     # Using 1/0 for boolean in SQLite
@@ -280,6 +942,43 @@ def delete_reminder(reminder_id):
         return True
     except:
         return False
+
+# --- REMINDER NOTIFICATIONS ---
+# The notifier (src/notifications.py) loads the next window of due reminders
+# with one range read on idx_reminders_due and claims each one as it fires.
+
+def get_due_reminders(until, limit=500):
+    """Pending, not yet notified reminders with due_at <= `until`, soonest first (due_at as datetime)."""
+    rows = run_query(
+        """
+        SELECT id, text, priority, due_at, recurrence FROM reminders
+        WHERE is_completed = 0 AND notified_at IS NULL AND due_at <= ?
+        ORDER BY due_at LIMIT ?
+        """,
+        (to_timestamp(until), limit)
+    ) or []
+    return [{**dict(r), "due_at": datetime.fromisoformat(r['due_at'])} for r in rows]
+
+def claim_reminder(reminder_id, due_at, next_due_at=None):
+    """
+    Mark the occurrence at `due_at` delivered: a one-off reminder gets notified_at,
+    a recurring one moves on to `next_due_at`. Conditional on the stored due_at,
+    so with several processes only one fires each occurrence. Returns True if claimed here.
+    """
+    if next_due_at is None:
+        query, params = "UPDATE reminders SET notified_at = ?", [to_timestamp(datetime.now())]
+    else:
+        query, params = "UPDATE reminders SET due_at = ?", [to_timestamp(next_due_at)]
+    conn = get_db_connection()
+    try:
+        cur = conn.execute(
+            query + " WHERE id = ? AND due_at = ? AND is_completed = 0 AND notified_at IS NULL",
+            params + [reminder_id, to_timestamp(due_at)]
+        )
+        conn.commit()
+        return cur.rowcount == 1
+    finally:
+        conn.close()
     
 # --- Project Reminder System ---
 
@@ -289,15 +988,14 @@ def add_project(text, description, priority='low'):
         run_query(query, (text, description, priority))
         return True
     except Exception as e:
-        st.error(f"Error adding project: {e}")
+        report_error(f"Error adding project: {e}")
         return False
 
 def get_projects(pending_only=True):
-    query = "SELECT * FROM projects"
-    if pending_only:
-        query += " WHERE is_completed = 0"
-    query += " ORDER BY created_at DESC"
-    return run_query(query, return_df=True)
+    return _list("projects", PROJECT_COLUMNS, pending_only)
+
+def get_projects_page(pending_only=True, cursor=None, limit=20):
+    return _keyset_page("projects", PROJECT_COLUMNS, pending_only, cursor, limit)
 
 def update_project_status(project_id, is_completed=True):
     # Using 1/0 for boolean in SQLite
@@ -58,6 +58,34 @@ def calculate_xp_gain(streak_current, streak_before):
         
     return xp
 
+def replay_total_xp(habits, dates_by_habit, today=None):
+    """
+    Recompute lifetime XP by replaying each habit's completions in date order.
+    habits: Habit records; dates_by_habit: {habit_id: set of datetime.date}.
+    Mirrors log_habit_completion: base XP per log plus streak milestone bonuses.
+    """
+    import datetime
+    today = today or datetime.date.today()
+    total = 0
+    for habit in habits:
+        logged = dates_by_habit.get(habit.id, set())
+        if not logged:
+            continue
+        streak = 0
+        day = min([habit.created_at or min(logged), min(logged)])
+        while day <= today:
+            if habit.is_due(day):
+                if day in logged:
+                    streak += 1
+                    total += calculate_xp_gain(streak, streak - 1)
+                elif day != today:
+                    streak = 0
+            elif day in logged:
+                # Logged on a non-due day: base XP, streak unchanged
+                total += XP_PER_COMPLETION
+            day += datetime.timedelta(days=1)
+    return total
+
 def check_new_badges(logs_df, habits_df, current_badges):
     """
     Check if any new badges are unlocked.
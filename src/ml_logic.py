@@ -1,5 +1,9 @@
+import datetime
+import numpy as np
 import pandas as pd
 import random
+from src.models import habits_from_df
+from src.utils import to_dates
 
 def get_motivational_message(streak):
     """Return a message based on streak length."""
@@ -28,6 +32,159 @@ def get_motivational_message(streak):
             "Incredible dedication. Use this energy for other goals too!"
         ])
 
+# --- MISS-RISK MODEL ---
+# Online logistic regression estimating P(habit is missed on a due day).
+# Features are computed from the 30 days before the scored day, so scoring today
+# needs only the default load_logs() window. Training replays up to 30 closed
+# days, each with its own 30-day feature window, so it loads those (up to 60)
+# days of logs itself. The model trains one day at a time (SGD) as days
+# close, and its weights are persisted via data_manager.save_model_state.
+
+MISS_RISK_MODEL = "miss_risk_v1"
+CATEGORIES = ["Health", "Productivity", "Learning", "Mindfulness", "Other"]
+HISTORY_DAYS = 30
+# bias + weekday one-hot + category one-hot + streak, recency, 7-day rate
+N_FEATURES = 1 + 7 + len(CATEGORIES) + 3
+# Don't surface predictions until the model has seen a few weeks of outcomes
+MIN_UPDATES = 50
+
+class MissRiskModel:
+    """NumPy-only logistic model trained by online SGD."""
+    __slots__ = ("weights", "trained_through", "n_updates", "lr", "l2")
+
+    def __init__(self, weights=None, trained_through=None, n_updates=0, lr=0.05, l2=1e-4):
+        self.weights = np.zeros(N_FEATURES) if weights is None else np.asarray(weights, dtype=float)
+        self.trained_through = trained_through
+        self.n_updates = n_updates
+        self.lr = lr
+        self.l2 = l2
+
+    @classmethod
+    def from_state(cls, state):
+        if not state or len(state.get("weights", [])) != N_FEATURES:
+            return cls()
+        trained = state.get("trained_through")
+        return cls(
+            weights=state["weights"],
+            trained_through=datetime.date.fromisoformat(trained) if trained else None,
+            n_updates=state.get("n_updates", 0),
+        )
+
+    def to_state(self):
+        return {
+            "weights": self.weights.tolist(),
+            "trained_through": str(self.trained_through) if self.trained_through else None,
+            "n_updates": self.n_updates,
+        }
+
+    def predict(self, X):
+        return 1.0 / (1.0 + np.exp(-np.clip(X @ self.weights, -30, 30)))
+
+    def partial_fit(self, X, y):
+        """One online SGD pass over the rows of X."""
+        for x, target in zip(X, y):
+            p = 1.0 / (1.0 + np.exp(-np.clip(x @ self.weights, -30, 30)))
+            self.weights -= self.lr * ((p - target) * x + self.l2 * self.weights)
+        self.n_updates += len(y)
+
+def _history_matrices(habits, logged_by_habit, day):
+    """
+    (due, done) boolean matrices of shape (n_habits, HISTORY_DAYS);
+    column 0 is the day before `day`, column HISTORY_DAYS-1 the oldest.
+    """
+    days = [day - datetime.timedelta(days=i) for i in range(1, HISTORY_DAYS + 1)]
+    due = np.array([[h.is_due(d) for d in days] for h in habits], dtype=bool).reshape(len(habits), HISTORY_DAYS)
+    done = np.array([[d in logged_by_habit.get(h.id, ()) for d in days] for h in habits], dtype=bool).reshape(len(habits), HISTORY_DAYS)
+    return due, done
+
+def build_miss_features(habits, logged_by_habit, day):
+    """Vectorised feature matrix (n_habits, N_FEATURES) for scoring `habits` on `day`."""
+    n = len(habits)
+    X = np.zeros((n, N_FEATURES))
+    if n == 0:
+        return X
+    X[:, 0] = 1.0
+    X[:, 1 + day.weekday()] = 1.0
+    cat_idx = [CATEGORIES.index(h.category) if h.category in CATEGORIES else len(CATEGORIES) - 1 for h in habits]
+    X[np.arange(n), 8 + np.array(cat_idx)] = 1.0
+
+    due, done = _history_matrices(habits, logged_by_habit, day)
+    # Streak: completed due days since the most recent missed due day
+    missed = due & ~done
+    first_miss = np.where(missed.any(axis=1), missed.argmax(axis=1), HISTORY_DAYS)
+    hits = due & done
+    streak = np.array([hits[i, :first_miss[i]].sum() for i in range(n)])
+    # Recency: days since the last completion (capped at the window)
+    recency = np.where(done.any(axis=1), done.argmax(axis=1) + 1, HISTORY_DAYS)
+    # Short-term completion rate over the last week
+    due7, hits7 = due[:, :7].sum(axis=1), hits[:, :7].sum(axis=1)
+    rate7 = np.divide(hits7, due7, out=np.ones(n), where=due7 > 0)
+
+    base = 8 + len(CATEGORIES)
+    X[:, base] = streak / HISTORY_DAYS
+    X[:, base + 1] = recency / HISTORY_DAYS
+    X[:, base + 2] = rate7
+    return X
+
+def _logged_by_habit(logs):
+    if logs.empty:
+        return {}
+    grouped = {}
+    for habit_id, d in zip(logs['habit_id'].tolist(), to_dates(logs['date'])):
+        grouped.setdefault(habit_id, set()).add(d)
+    return grouped
+
+def update_miss_risk_model(habits, today=None):
+    """
+    Train on every closed day since the last update (at most HISTORY_DAYS back) and persist.
+    Usually a no-op: the model is only stepped once per new day, and only then are
+    the logs loaded (back to the oldest training day's feature window).
+    """
+    from src.data_manager import load_model_state, save_model_state, load_logs
+    today = today or datetime.date.today()
+    model = MissRiskModel.from_state(load_model_state(MISS_RISK_MODEL))
+    habit_list = habits_from_df(habits) if isinstance(habits, pd.DataFrame) else list(habits)
+
+    start = today - datetime.timedelta(days=HISTORY_DAYS)
+    if model.trained_through is not None:
+        start = max(start, model.trained_through + datetime.timedelta(days=1))
+    if start >= today or not habit_list:
+        return model
+
+    # The first training day's features look back another HISTORY_DAYS
+    logs = load_logs(days_back=(datetime.date.today() - start).days + HISTORY_DAYS, columns=['habit_id', 'date'])
+    logged = _logged_by_habit(logs)
+    day = start
+    while day < today:
+        due_today = [h for h in habit_list if h.is_due(day)]
+        if due_today:
+            X = build_miss_features(due_today, logged, day)
+            y = np.array([0.0 if day in logged.get(h.id, ()) else 1.0 for h in due_today])
+            model.partial_fit(X, y)
+        day += datetime.timedelta(days=1)
+
+    model.trained_through = today - datetime.timedelta(days=1)
+    save_model_state(MISS_RISK_MODEL, model.to_state())
+    return model
+
+def predict_miss_risk(habits, logs, today=None, model=None):
+    """
+    Score all habits due today and not yet done in one batch.
+    Returns a DataFrame [id, name, risk] sorted by risk (highest first).
+    """
+    today = today or datetime.date.today()
+    if model is None:
+        model = update_miss_risk_model(habits, today)
+    habit_list = habits_from_df(habits) if isinstance(habits, pd.DataFrame) else list(habits)
+    logged = _logged_by_habit(logs)
+    pending = [h for h in habit_list if h.is_due(today) and today not in logged.get(h.id, ())]
+    if not pending:
+        return pd.DataFrame(columns=['id', 'name', 'risk'])
+
+    risk = model.predict(build_miss_features(pending, logged, today))
+    df = pd.DataFrame({'id': [h.id for h in pending], 'name': [h.name for h in pending], 'risk': risk})
+    return df.sort_values('risk', ascending=False, ignore_index=True)
+
 def get_smart_suggestions(habits, logs):
     """
     Analyze logs to find patterns and suggest improvements.
@@ -39,20 +196,27 @@ def get_smart_suggestions(habits, logs):
     
     # Analyze skipped days (simple heuristic)
     # Check if there is a specific day of week where completion is low
-    logs['date'] = pd.to_datetime(logs['date'])
-    logs['weekday'] = logs['date'].dt.day_name()
+    # Work on the typed date column without mutating the caller's frame
+    dates = logs['date'] if pd.api.types.is_datetime64_any_dtype(logs['date']) else pd.to_datetime(logs['date'])
+    weekday_counts = dates.dt.day_name().value_counts()
     
-    weekday_counts = logs['weekday'].value_counts()
+    # At-risk habit first, once the model has seen enough outcomes
+    model = update_miss_risk_model(habits)
+    if model.n_updates >= MIN_UPDATES:
+        risks = predict_miss_risk(habits, logs, model=model)
+        if not risks.empty and risks.iloc[0]['risk'] >= 0.5:
+            top = risks.iloc[0]
+            suggestions.append(f"⚠️ **{top['name']}** is at risk today ({top['risk']:.0%} chance of a miss). Do it early!")
     
     if not weekday_counts.empty:
         best_day = weekday_counts.idxmax()
         suggestions.append(f"💡 You happen to be most consistent on **{best_day}s**. Try to schedule your hardest tasks then!")
     
     # Streak check
-    for _, habit in habits.iterrows():
-        habit_logs = logs[logs['habit_id'] == habit['id']]
-        if habit_logs.empty:
-            suggestions.append(f"👀 You haven't started **{habit['name']}** yet. How about doing just 5 minutes today?")
+    logged_ids = set(logs['habit_id'].tolist())
+    for habit in habits_from_df(habits):
+        if habit.id not in logged_ids:
+            suggestions.append(f"👀 You haven't started **{habit.name}** yet. How about doing just 5 minutes today?")
     
     if not suggestions:
         suggestions.append("🌟 You are doing great! Keep tracking to unlock more insights.")
@@ -0,0 +1,194 @@
+import datetime
+from dataclasses import dataclass
+import pandas as pd
+
+WEEKDAYS = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+# Stored as next_due_date for habits whose frequency can never match
+NEVER_DUE = "9999-12-31"
+# Longest gap between two occurrences we search (bimonthly on the 31st)
+NEXT_DUE_HORIZON_DAYS = 800
+
+# --- FREQUENCY ---
+
+@dataclass(frozen=True, slots=True)
+class FrequencySpec:
+    """
+    Pre-parsed form of (frequency_type, frequency_value).
+    weekdays: set of weekday ints (Mon=0) for days_of_week/weekly/biweekly.
+    interval: weeks (biweekly), months (bimonthly) or days (custom) between occurrences.
+    day_of_month: target day for monthly/bimonthly.
+    valid: False when the stored value could not be parsed (habit is never due).
+    """
+    kind: str = "daily"
+    weekdays: frozenset = frozenset()
+    interval: int = 1
+    day_of_month: int = 0
+    valid: bool = True
+
+    @classmethod
+    def parse(cls, ftype, fvalue):
+        ftype = ftype or "daily"
+        fvalue = None if fvalue is None or (isinstance(fvalue, float) and pd.isna(fvalue)) else str(fvalue)
+
+        if ftype in ("days_of_week", "weekly", "biweekly"):
+            if not fvalue:
+                return cls(ftype, valid=False)
+            if ftype == "days_of_week":
+                # Stored as "Mon,Wed,Fri"
+                days = frozenset(i for i, d in enumerate(WEEKDAYS) if d in fvalue)
+            else:
+                days = frozenset([WEEKDAYS.index(fvalue)]) if fvalue in WEEKDAYS else frozenset()
+            return cls(ftype, weekdays=days, interval=2 if ftype == "biweekly" else 1)
+
+        if ftype in ("monthly", "bimonthly"):
+            try:
+                day = int(fvalue)
+            except (TypeError, ValueError):
+                return cls(ftype, valid=False)
+            return cls(ftype, day_of_month=day, interval=2 if ftype == "bimonthly" else 1)
+
+        if ftype == "custom":
+            # Every X days; an unreadable value behaves like daily
+            try:
+                interval = max(1, int(fvalue))
+            except (TypeError, ValueError):
+                interval = 1
+            return cls(ftype, interval=interval)
+
+        return cls(ftype)
+
+    @property
+    def fixed_interval(self):
+        """Days between occurrences for daily/custom habits (due every N days from creation), else None."""
+        return self.interval if self.valid and self.kind in ("daily", "custom") else None
+
+# --- HABIT ---
+
+def _to_date(value):
+    """Coerce a stored created_at (str, datetime, Timestamp) to a date, or None."""
+    if value is None:
+        return None
+    if isinstance(value, datetime.datetime):
+        return None if pd.isna(value) else value.date()
+    if isinstance(value, datetime.date):
+        return value
+    try:
+        ts = pd.to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return None if pd.isna(ts) else ts.date()
+
+def _norm_id(value):
+    """numpy ints become plain ints, ObjectIds become strings."""
+    if value is None or isinstance(value, (int, str)):
+        return value
+    if hasattr(value, 'item'):
+        return value.item()
+    return str(value)
+
+@dataclass(frozen=True, slots=True)
+class Habit:
+    """
+    Compact, immutable habit record used in hot loops instead of pandas rows.
+    Supports habit['name'] / habit.get('name') so existing call sites keep working.
+    """
+    id: object
+    name: str
+    category: str = "Other"
+    frequency_type: str = "daily"
+    frequency_value: object = None
+    target_value: int = 1
+    target_unit: str = "times"
+    created_at: datetime.date = None
+    is_active: int = 1
+    freq: FrequencySpec = FrequencySpec()
+
+    @classmethod
+    def from_row(cls, row):
+        """Build a Habit from a dict, pandas Series or Mongo document."""
+        if isinstance(row, Habit):
+            return row
+        get = row.get
+        habit_id = get('id', get('_id'))
+        ftype = get('frequency_type') or 'daily'
+        fvalue = get('frequency_value')
+        target = get('target_value', 1)
+        return cls(
+            id=_norm_id(habit_id),
+            name=get('name', ''),
+            category=get('category', 'Other'),
+            frequency_type=ftype,
+            frequency_value=fvalue,
+            target_value=int(target) if target is not None and not pd.isna(target) else 1,
+            target_unit=get('target_unit', 'times') or 'times',
+            created_at=_to_date(get('created_at')),
+            is_active=get('is_active', 1),
+            freq=FrequencySpec.parse(ftype, fvalue),
+        )
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key)
+
+    def get(self, key, default=None):
+        return getattr(self, key, default)
+
+    def is_due(self, day):
+        """Check if this habit is due on `day` (a datetime.date)."""
+        created = self.created_at or day
+        # If habit created after the check date, it wasn't due yet
+        if day < created:
+            return False
+
+        spec = self.freq
+        if not spec.valid:
+            return False
+        kind = spec.kind
+
+        if kind == "daily":
+            return True
+        if kind in ("days_of_week", "weekly"):
+            return day.weekday() in spec.weekdays
+        if kind == "biweekly":
+            if day.weekday() not in spec.weekdays:
+                return False
+            return ((day - created).days // 7) % 2 == 0
+        if kind == "monthly":
+            return day.day == spec.day_of_month
+        if kind == "bimonthly":
+            if day.day != spec.day_of_month:
+                return False
+            diff = (day.year * 12 + day.month) - (created.year * 12 + created.month)
+            return diff % 2 == 0
+        if kind == "custom":
+            return (day - created).days % spec.interval == 0
+        return True
+
+    def next_due(self, start):
+        """First date >= `start` (and >= created_at) on which the habit is due, or None."""
+        day = max(start, self.created_at) if self.created_at else start
+        for _ in range(NEXT_DUE_HORIZON_DAYS):
+            if self.is_due(day):
+                return day
+            day += datetime.timedelta(days=1)
+        return None
+
+    def next_due_date(self, today, done_today=False):
+        """Value for the habits.next_due_date column, as a YYYY-MM-DD string."""
+        start = today + datetime.timedelta(days=1) if done_today else today
+        day = self.next_due(start)
+        return str(day) if day else NEVER_DUE
+
+def habits_from_df(df):
+    """Convert a habits DataFrame to a list of Habit records (one pass, no iterrows)."""
+    if df is None or df.empty:
+        return []
+    return [Habit.from_row(rec) for rec in df.to_dict('records')]
+
+def habits_to_df(habits):
+    """Convert Habit records back to a DataFrame at the rendering edge."""
+    return pd.DataFrame(
+        [{f: getattr(h, f) for f in Habit.__dataclass_fields__ if f != 'freq'} for h in habits]
+    )
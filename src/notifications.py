@@ -0,0 +1,165 @@
+import os
+import sys
+import json
+import heapq
+import shutil
+import calendar
+import threading
+import subprocess
+import urllib.request
+from datetime import datetime, timedelta
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# --- REMINDER NOTIFICATIONS ---
+# Reminders with a due_at fire a desktop notification and/or a webhook POST.
+# The worker keeps the next NOTIFY_WINDOW_MINUTES of due reminders in a
+# min-heap ordered by due_at (one indexed range read per window) and sleeps
+# until the earliest one, instead of scanning every reminder on a timer.
+# Each occurrence is claimed in the store before it is sent (a conditional
+# update on its due_at), so several Streamlit workers or app + api.py never
+# notify twice; a recurring reminder's claim moves due_at to the next occurrence.
+
+ENABLED = os.getenv("NOTIFICATIONS_ENABLED", "true").lower() == "true"
+WINDOW_MINUTES = int(os.getenv("NOTIFY_WINDOW_MINUTES", 15))
+WEBHOOK_URL = os.getenv("NOTIFY_WEBHOOK_URL", "")
+DESKTOP = os.getenv("NOTIFY_DESKTOP", "true").lower() == "true"
+WINDOW_LIMIT = 500
+
+_heap = []              # [(due_at, str(id), reminder)]
+_window_end = None      # heap holds every pending reminder due before this
+_lock = threading.Lock()
+_wakeup = threading.Event()
+_worker = None
+_worker_lock = threading.Lock()
+
+# --- RECURRENCE ---
+
+def _add_months(moment, months):
+    month = moment.month - 1 + months
+    year, month = moment.year + month // 12, month % 12 + 1
+    return moment.replace(year=year, month=month, day=min(moment.day, calendar.monthrange(year, month)[1]))
+
+def _step(moment, recurrence):
+    if recurrence == "daily":
+        return moment + timedelta(days=1)
+    if recurrence == "weekdays":
+        moment += timedelta(days=1)
+        while moment.weekday() >= 5:
+            moment += timedelta(days=1)
+        return moment
+    if recurrence == "weekly":
+        return moment + timedelta(weeks=1)
+    if recurrence == "monthly":
+        return _add_months(moment, 1)
+    raise ValueError(f"Unknown recurrence: {recurrence}")
+
+def next_occurrence(due_at, recurrence, after):
+    """First occurrence of a recurring reminder later than `after` (occurrences missed while nothing ran are skipped)."""
+    moment = _step(due_at, recurrence)
+    while moment <= after:
+        moment = _step(moment, recurrence)
+    return moment
+
+# --- DELIVERY ---
+
+def _desktop(title, body):
+    if sys.platform == "darwin" and shutil.which("osascript"):
+        script = f"display notification {json.dumps(body)} with title {json.dumps(title)}"
+        subprocess.run(["osascript", "-e", script], timeout=10, check=False)
+    elif shutil.which("notify-send"):
+        subprocess.run(["notify-send", title, body], timeout=10, check=False)
+
+def _webhook(reminder):
+    payload = {
+        "id": str(reminder["id"]), "text": reminder["text"], "priority": reminder["priority"],
+        "due_at": reminder["due_at"].isoformat(sep=" "), "recurrence": reminder.get("recurrence"),
+    }
+    req = urllib.request.Request(
+        WEBHOOK_URL, data=json.dumps(payload).encode(), headers={"Content-Type": "application/json"}, method="POST"
+    )
+    urllib.request.urlopen(req, timeout=10).close()
+
+def notify(reminder):
+    """Deliver one reminder. Failures are logged, not raised (the occurrence is already claimed)."""
+    title = f"⏰ Reminder ({reminder['priority']})"
+    print(f"{title}: {reminder['text']} (due {reminder['due_at']:%Y-%m-%d %H:%M})")
+    try:
+        if DESKTOP:
+            _desktop(title, reminder["text"])
+        if WEBHOOK_URL:
+            _webhook(reminder)
+    except Exception as e:
+        print(f"Notification error: {e}")
+
+# --- SCHEDULING ---
+
+def _load_window(now):
+    """Replace the heap with the pending reminders due up to now + WINDOW_MINUTES."""
+    global _window_end
+    from src.data_manager import get_due_reminders
+    until = now + timedelta(minutes=WINDOW_MINUTES)
+    due = get_due_reminders(until, limit=WINDOW_LIMIT)
+    if len(due) == WINDOW_LIMIT:
+        # Only the soonest WINDOW_LIMIT fit; the rest are loaded once these are done.
+        # When they all share one due_at, keep the whole batch and reload just after it
+        last = due[-1]["due_at"]
+        earlier = [r for r in due if r["due_at"] < last]
+        if earlier:
+            due, until = earlier, last
+        else:
+            until = last + timedelta(microseconds=1)
+    _heap[:] = [(r["due_at"], str(r["id"]), r) for r in due]
+    heapq.heapify(_heap)
+    _window_end = until
+
+def run_pending(now=None):
+    """Claim and deliver every reminder due by `now`. Returns the seconds until the next check."""
+    from src.data_manager import claim_reminder
+    now = now or datetime.now()
+    with _lock:
+        if _window_end is None or now >= _window_end:
+            _load_window(now)
+        while _heap and _heap[0][0] <= now:
+            due_at, _, reminder = heapq.heappop(_heap)
+            recurrence = reminder.get("recurrence")
+            next_due = next_occurrence(due_at, recurrence, now) if recurrence else None
+            if not claim_reminder(reminder["id"], due_at, next_due):
+                continue  # completed, deleted, edited or sent by another process
+            notify(reminder)
+            if next_due is not None and next_due < _window_end:
+                heapq.heappush(_heap, (next_due, str(reminder["id"]), {**reminder, "due_at": next_due}))
+        wake_at = min(_heap[0][0], _window_end) if _heap else _window_end
+    return max(1, (wake_at - datetime.now()).total_seconds())
+
+def refresh():
+    """Drop the loaded window (a reminder was added or changed) and wake the worker."""
+    global _window_end
+    with _lock:
+        _window_end = None
+    _wakeup.set()
+
+# --- WORKER ---
+
+def _run_worker():
+    while True:
+        try:
+            wait = run_pending()
+        except Exception as e:
+            print(f"Notification worker error: {e}")
+            wait = 60
+        _wakeup.wait(wait)
+        _wakeup.clear()
+
+def start():
+    """Start the notification thread once per process (no-op when NOTIFICATIONS_ENABLED=false)."""
+    global _worker
+    if not ENABLED:
+        return None
+    with _worker_lock:
+        if _worker is not None and _worker.is_alive():
+            return _worker
+        _worker = threading.Thread(target=_run_worker, name="notifications", daemon=True)
+        _worker.start()
+        return _worker
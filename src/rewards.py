@@ -0,0 +1,223 @@
+import os
+import json
+import sqlite3
+import threading
+from dotenv import load_dotenv
+from src.write_buffer import NotDrained
+
+load_dotenv()
+
+# --- DEFERRED REWARDS ---
+# The Done button only records the log (src.data_manager.record_completion) and
+# appends a job here. A background worker replays the jobs in order through
+# process_completion_rewards (streak, XP, badges, level) and stores the result;
+# the app picks finished rewards up on its next run. The queue is a small local
+# SQLite file so jobs survive a restart whichever backend holds the habits.
+# Several processes (app workers, api.py, cli) may run workers on the same file:
+# each job is claimed with a conditional UPDATE before it runs, and a claim older
+# than CLAIM_LEASE_SECONDS (its process died) goes back to pending. Rewards are
+# delivered to the session that queued them.
+
+QUEUE_PATH = os.getenv(
+    "REWARD_QUEUE_PATH",
+    os.path.join(os.path.dirname(os.getenv("DATABASE_PATH", "data/habits.db")) or ".", "reward_queue.db")
+)
+POLL_SECONDS = 5
+MAX_ATTEMPTS = 5
+CLAIM_LEASE_SECONDS = 600
+
+_wakeup = threading.Event()
+_worker = None
+_worker_lock = threading.Lock()
+
+def _connect():
+    os.makedirs(os.path.dirname(QUEUE_PATH) or ".", exist_ok=True)
+    conn = sqlite3.connect(QUEUE_PATH, timeout=10)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+def init_queue():
+    conn = _connect()
+    try:
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS reward_jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                habit_id TEXT NOT NULL,
+                date TEXT NOT NULL,
+                log_id TEXT,
+                status TEXT DEFAULT 'pending',
+                attempts INTEGER DEFAULT 0,
+                result TEXT,
+                delivered INTEGER DEFAULT 0,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                session TEXT,
+                claimed_at TIMESTAMP
+            )
+        """)
+        # Queue files created before sessions and claims
+        columns = {row['name'] for row in conn.execute("PRAGMA table_info(reward_jobs)")}
+        for column, decl in (("session", "TEXT"), ("claimed_at", "TIMESTAMP")):
+            if column not in columns:
+                conn.execute(f"ALTER TABLE reward_jobs ADD COLUMN {column} {decl}")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_reward_jobs_status ON reward_jobs (status, id)")
+        conn.commit()
+    finally:
+        conn.close()
+
+def enqueue(habit_id, date, log_id=None, session=None):
+    """Queue reward processing for a recorded completion and wake the worker."""
+    conn = _connect()
+    try:
+        cur = conn.execute(
+            "INSERT INTO reward_jobs (habit_id, date, log_id, session) VALUES (?, ?, ?, ?)",
+            # ids keep their type (int for SQLite, str for Mongo) through JSON
+            (json.dumps(habit_id), str(date), json.dumps(log_id), session)
+        )
+        conn.commit()
+        job_id = cur.lastrowid
+    finally:
+        conn.close()
+    _wakeup.set()
+    return job_id
+
+def _claim(conn, job_id):
+    """Mark a pending job running; False if another worker claimed it first."""
+    cur = conn.execute(
+        "UPDATE reward_jobs SET status = 'running', claimed_at = CURRENT_TIMESTAMP WHERE id = ? AND status = 'pending'",
+        (job_id,)
+    )
+    conn.commit()
+    return cur.rowcount == 1
+
+def process_pending(limit=100):
+    """Claim and run pending jobs in order; stops at the first failure. Returns the number processed."""
+    from src.data_manager import process_completion_rewards
+
+    conn = _connect()
+    try:
+        # Release claims left by a worker that died mid-job
+        conn.execute(
+            "UPDATE reward_jobs SET status = 'pending' WHERE status = 'running' AND claimed_at < datetime('now', ?)",
+            (f"-{CLAIM_LEASE_SECONDS} seconds",)
+        )
+        conn.commit()
+        jobs = conn.execute(
+            "SELECT * FROM reward_jobs WHERE status = 'pending' ORDER BY id LIMIT ?", (limit,)
+        ).fetchall()
+        processed = 0
+        for job in jobs:
+            if not _claim(conn, job['id']):
+                continue
+            try:
+                reward = process_completion_rewards(
+                    json.loads(job['habit_id']), job['date'], json.loads(job['log_id'])
+                )
+                conn.execute(
+                    "UPDATE reward_jobs SET status = 'done', result = ? WHERE id = ?",
+                    (json.dumps(reward), job['id'])
+                )
+            except NotDrained:
+                # The log is still in the Mongo write buffer: not a failure, try later
+                conn.execute("UPDATE reward_jobs SET status = 'pending' WHERE id = ?", (job['id'],))
+                conn.commit()
+                break
+            except Exception as e:
+                # Keep the job for the next pass; give up after MAX_ATTEMPTS
+                attempts = job['attempts'] + 1
+                status = 'failed' if attempts >= MAX_ATTEMPTS else 'pending'
+                conn.execute(
+                    "UPDATE reward_jobs SET attempts = ?, status = ?, result = ? WHERE id = ?",
+                    (attempts, status, json.dumps({"error": str(e)}), job['id'])
+                )
+                conn.commit()
+                break
+            conn.commit()
+            processed += 1
+        return processed
+    finally:
+        conn.close()
+
+def pop_ready_rewards(session):
+    """Return the session's finished rewards not yet shown, oldest first, and mark them delivered."""
+    conn = _connect()
+    try:
+        # One UPDATE claims and returns the rows, so two reruns never show a reward twice
+        rows = conn.execute(
+            "UPDATE reward_jobs SET delivered = 1 WHERE session = ? AND status = 'done' AND delivered = 0 RETURNING id, result",
+            (session,)
+        ).fetchall()
+        conn.commit()
+        return [json.loads(r['result']) for r in sorted(rows, key=lambda r: r['id'])]
+    finally:
+        conn.close()
+
+def has_unfinished(session):
+    """True while the worker has yet to finish one of the session's jobs."""
+    conn = _connect()
+    try:
+        return conn.execute(
+            "SELECT 1 FROM reward_jobs WHERE session = ? AND status IN ('pending', 'running') LIMIT 1",
+            (session,)
+        ).fetchone() is not None
+    finally:
+        conn.close()
+
+def pending_count():
+    conn = _connect()
+    try:
+        return conn.execute("SELECT COUNT(*) FROM reward_jobs WHERE status = 'pending'").fetchone()[0]
+    finally:
+        conn.close()
+
+def _run_worker():
+    while True:
+        _wakeup.wait(POLL_SECONDS)
+        _wakeup.clear()
+        try:
+            while process_pending():
+                pass
+        except Exception as e:
+            print(f"Reward worker error: {e}")
+
+def start_worker():
+    """Start the background worker once per process (also drains jobs left by a restart)."""
+    global _worker
+    with _worker_lock:
+        if _worker is not None and _worker.is_alive():
+            return _worker
+        init_queue()
+        _worker = threading.Thread(target=_run_worker, name="reward-worker", daemon=True)
+        _worker.start()
+        _wakeup.set()
+        return _worker
+
+def complete_habit(habit, date, status="Completed", notes="", value=1, session=None):
+    """
+    Done-button handler: record the completion now, defer the rewards.
+    Returns (success, reward_info); reward_info is empty until the worker delivers
+    it to `session` (see pop_ready_rewards).
+    """
+    from src.data_manager import record_completion
+
+    log_id = record_completion(habit, date, status, notes, value)
+    if log_id is None:
+        return False, {}
+    start_worker()
+    enqueue(habit.id, date, log_id, session)
+    return True, {}
+
+def add_progress(habit, date, amount=1, notes="", session=None):
+    """
+    Increment handler for measurable habits: one upsert now; rewards are queued
+    only for the increment that reaches the target.
+    Returns the log_progress result dict, or None on error.
+    """
+    from src.data_manager import log_progress
+
+    result = log_progress(habit, date, amount, notes)
+    if result and result["completed_now"]:
+        start_worker()
+        enqueue(habit.id, date, result["log_id"], session)
+    return result
@@ -0,0 +1,434 @@
+import os
+import json
+import time
+import socket
+import sqlite3
+import threading
+import datetime
+from dataclasses import dataclass
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# --- BACKGROUND SCHEDULER ---
+# Maintenance and precomputation (rolling next due dates forward, retraining the
+# miss-risk model, rebuilding streak bitmaps, ANALYZE/VACUUM, warming chart
+# caches) runs here on cron schedules instead of on the first request of the day.
+# Job state lives in a small local SQLite file shared by every process on the
+# host: a run is claimed with one conditional UPDATE that also advances
+# next_run, so several Streamlit workers (or app + api.py) never duplicate it.
+# A claim is a lease; if its process dies mid-run the job is free again once
+# the lease expires. Runs missed while nothing was running are caught up once.
+
+STATE_PATH = os.getenv(
+    "SCHEDULER_PATH",
+    os.path.join(os.path.dirname(os.getenv("DATABASE_PATH", "data/habits.db")) or ".", "scheduler.db")
+)
+ENABLED = os.getenv("SCHEDULER_ENABLED", "true").lower() == "true"
+TICK_SECONDS = 30
+LEASE_SECONDS = 600
+HISTORY_PER_JOB = 50
+
+OWNER = f"{socket.gethostname()}:{os.getpid()}"
+
+# --- CRON ---
+
+ALIASES = {"@hourly": "0 * * * *", "@daily": "0 0 * * *", "@weekly": "0 0 * * 0", "@monthly": "0 0 1 * *"}
+
+def _parse_field(spec, low, high):
+    values = set()
+    for part in spec.split(","):
+        expr, _, step = part.partition("/")
+        step = int(step) if step else 1
+        if expr == "*":
+            start, end = low, high
+        elif "-" in expr:
+            start, end = (int(v) for v in expr.split("-", 1))
+        else:
+            start = int(expr)
+            end = high if step > 1 else start
+        if not (low <= start <= end <= high) or step < 1:
+            raise ValueError(f"cron field out of range: {part}")
+        values.update(range(start, end + 1, step))
+    return sorted(values)
+
+class Cron:
+    """
+    Five-field cron expression (minute hour day-of-month month day-of-week) in
+    local time, with lists, ranges and steps. Sunday is 0 (or 7). As in cron, a
+    day matches either day field when both are restricted.
+    """
+    __slots__ = ("expr", "minutes", "hours", "days", "months", "weekdays", "any_day", "any_weekday")
+
+    def __init__(self, expr):
+        self.expr = expr
+        fields = ALIASES.get(expr.strip(), expr).split()
+        if len(fields) != 5:
+            raise ValueError(f"cron expression needs 5 fields: {expr!r}")
+        self.minutes = _parse_field(fields[0], 0, 59)
+        self.hours = _parse_field(fields[1], 0, 23)
+        self.days = set(_parse_field(fields[2], 1, 31))
+        self.months = set(_parse_field(fields[3], 1, 12))
+        self.weekdays = {d % 7 for d in _parse_field(fields[4], 0, 7)}
+        self.any_day, self.any_weekday = fields[2] == "*", fields[4] == "*"
+
+    def matches_day(self, day):
+        if day.month not in self.months:
+            return False
+        dom, dow = day.day in self.days, (day.weekday() + 1) % 7 in self.weekdays
+        if self.any_day or self.any_weekday:
+            return dom and dow
+        return dom or dow
+
+    def next_after(self, moment):
+        """First minute strictly after `moment` that matches."""
+        start = moment.replace(second=0, microsecond=0) + datetime.timedelta(minutes=1)
+        day = start.date()
+        # Leap days can be four years apart
+        for _ in range(366 * 5):
+            if self.matches_day(day):
+                for hour in self.hours:
+                    for minute in self.minutes:
+                        candidate = datetime.datetime.combine(day, datetime.time(hour, minute))
+                        if candidate >= start:
+                            return candidate
+            day += datetime.timedelta(days=1)
+        raise ValueError(f"cron expression never fires: {self.expr!r}")
+
+# --- REGISTRY ---
+
+@dataclass
+class Job:
+    name: str
+    cron: Cron
+    func: object
+    exclusive: bool = True      # False: runs in every process (per-process caches)
+    timeout: int = LEASE_SECONDS
+
+_jobs = {}
+_synced = False
+# Per-process state of non-exclusive jobs: name -> state dict
+_local_state = {}
+_run_lock = threading.Lock()
+_wakeup = threading.Event()
+_worker = None
+_worker_lock = threading.Lock()
+
+def register(name, schedule, func, exclusive=True, timeout=LEASE_SECONDS):
+    """Run func() on `schedule` (cron expression). Its return value is kept as last_result."""
+    global _synced
+    _jobs[name] = Job(name, Cron(schedule), func, exclusive, timeout)
+    _synced = False
+    _wakeup.set()
+
+def job_names():
+    return list(_jobs)
+
+def _now():
+    return datetime.datetime.now().replace(microsecond=0)
+
+def _ts(moment):
+    return moment.isoformat(sep=" ")
+
+def _connect():
+    os.makedirs(os.path.dirname(STATE_PATH) or ".", exist_ok=True)
+    conn = sqlite3.connect(STATE_PATH, timeout=10)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+def init_state():
+    """Create the state tables and add rows for registered jobs (idempotent)."""
+    global _synced
+    conn = _connect()
+    try:
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                name TEXT PRIMARY KEY,
+                schedule TEXT NOT NULL,
+                next_run TIMESTAMP NOT NULL,
+                lease_owner TEXT,
+                lease_until TIMESTAMP,
+                last_started TIMESTAMP,
+                last_finished TIMESTAMP,
+                last_status TEXT,
+                last_result TEXT,
+                last_error TEXT,
+                last_duration REAL,
+                runs INTEGER DEFAULT 0,
+                failures INTEGER DEFAULT 0
+            );
+            CREATE TABLE IF NOT EXISTS job_runs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT NOT NULL,
+                owner TEXT,
+                started_at TIMESTAMP NOT NULL,
+                duration REAL,
+                status TEXT NOT NULL,
+                result TEXT,
+                error TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_job_runs_name ON job_runs (name, id);
+        """)
+        now = _now()
+        for job in _jobs.values():
+            if not job.exclusive:
+                continue
+            next_run = _ts(job.cron.next_after(now))
+            conn.execute(
+                "INSERT OR IGNORE INTO jobs (name, schedule, next_run) VALUES (?, ?, ?)",
+                (job.name, job.cron.expr, next_run)
+            )
+            # A changed schedule takes effect from now, not from the old next_run
+            conn.execute(
+                "UPDATE jobs SET schedule = ?, next_run = ? WHERE name = ? AND schedule != ?",
+                (job.cron.expr, next_run, job.name, job.cron.expr)
+            )
+        conn.commit()
+        _synced = True
+    finally:
+        conn.close()
+
+# --- RUNS ---
+
+def _claim(conn, job, now, force=False):
+    """Take the job's lease (and advance next_run) if it is due and not running elsewhere."""
+    cur = conn.execute(
+        f"""
+        UPDATE jobs SET lease_owner = ?, lease_until = ?, last_started = ?, last_status = 'running',
+                        next_run = CASE WHEN next_run <= ? THEN ? ELSE next_run END
+        WHERE name = ? AND (lease_until IS NULL OR lease_until < ?) {"" if force else "AND next_run <= ?"}
+        """,
+        (OWNER, _ts(now + datetime.timedelta(seconds=job.timeout)), _ts(now),
+         _ts(now), _ts(job.cron.next_after(now)), job.name, _ts(now)) + (() if force else (_ts(now),))
+    )
+    conn.commit()
+    return cur.rowcount == 1
+
+def _execute(job):
+    start = time.perf_counter()
+    try:
+        result, status, error = job.func(), "ok", None
+    except Exception as e:
+        result, status, error = None, "failed", f"{type(e).__name__}: {e}"
+        print(f"Scheduled job {job.name} failed: {error}")
+    result = None if result is None else json.dumps(result, default=str)
+    return result, status, error, time.perf_counter() - start
+
+def _finish(conn, job, started, outcome):
+    result, status, error, duration = outcome
+    conn.execute(
+        """
+        UPDATE jobs SET lease_owner = NULL, lease_until = NULL, last_finished = ?, last_status = ?,
+                        last_result = ?, last_error = ?, last_duration = ?, runs = runs + 1,
+                        failures = failures + ?
+        WHERE name = ? AND lease_owner = ?
+        """,
+        (_ts(_now()), status, result, error, duration, int(status == "failed"), job.name, OWNER)
+    )
+    _record_run(conn, job.name, started, outcome)
+
+def _record_run(conn, name, started, outcome):
+    result, status, error, duration = outcome
+    conn.execute(
+        "INSERT INTO job_runs (name, owner, started_at, duration, status, result, error) VALUES (?, ?, ?, ?, ?, ?, ?)",
+        (name, OWNER, _ts(started), duration, status, result, error)
+    )
+    conn.execute(
+        """
+        DELETE FROM job_runs WHERE name = ? AND id <= (
+            SELECT id FROM job_runs WHERE name = ? ORDER BY id DESC LIMIT 1 OFFSET ?
+        )
+        """,
+        (name, name, HISTORY_PER_JOB)
+    )
+    conn.commit()
+
+def _run_local(conn, job, now, force=False):
+    state = _local_state.setdefault(job.name, {"next_run": job.cron.next_after(now), "runs": 0, "failures": 0})
+    if not force and state["next_run"] > now:
+        return None
+    state.update(next_run=job.cron.next_after(now), last_started=now, last_status="running")
+    outcome = _execute(job)
+    result, status, error, duration = outcome
+    state.update(last_finished=_now(), last_status=status, last_result=result, last_error=error,
+                 last_duration=duration, runs=state["runs"] + 1, failures=state["failures"] + (status == "failed"))
+    _record_run(conn, f"{job.name}@{OWNER}", now, outcome)
+    return status
+
+def run_due(now=None):
+    """Run every job that is due, one at a time. Returns {name: status} for the jobs run here."""
+    now = now or _now()
+    if not _synced:
+        init_state()
+    ran = {}
+    with _run_lock:
+        conn = _connect()
+        try:
+            for job in list(_jobs.values()):
+                if not job.exclusive:
+                    status = _run_local(conn, job, now)
+                    if status:
+                        ran[job.name] = status
+                elif _claim(conn, job, now):
+                    outcome = _execute(job)
+                    _finish(conn, job, now, outcome)
+                    ran[job.name] = outcome[1]
+        finally:
+            conn.close()
+    return ran
+
+def run_now(name):
+    """Run one job immediately (keeps its schedule). Returns its status, or 'busy' if it is running elsewhere."""
+    job = _jobs[name]
+    init_state()
+    with _run_lock:
+        conn = _connect()
+        try:
+            now = _now()
+            if not job.exclusive:
+                return _run_local(conn, job, now, force=True)
+            if not _claim(conn, job, now, force=True):
+                return "busy"
+            outcome = _execute(job)
+            _finish(conn, job, now, outcome)
+            return outcome[1]
+        finally:
+            conn.close()
+
+# --- STATUS ---
+
+def status():
+    """One dict per registered job: schedule, next_run, last run status/timing/result, run counts."""
+    init_state()
+    conn = _connect()
+    try:
+        rows = {r['name']: dict(r) for r in conn.execute("SELECT * FROM jobs")}
+        averages = {
+            r['name']: r['avg'] for r in conn.execute(
+                "SELECT name, AVG(duration) AS avg FROM job_runs WHERE status = 'ok' GROUP BY name"
+            )
+        }
+    finally:
+        conn.close()
+    now = _ts(_now())
+    jobs = []
+    for job in _jobs.values():
+        if job.exclusive:
+            row = rows.get(job.name, {})
+            if row.get('last_status') == "running" and (row.get('lease_until') or "") < now:
+                row['last_status'] = "abandoned"
+            avg = averages.get(job.name)
+        else:
+            row = {k: (_ts(v) if isinstance(v, datetime.datetime) else v) for k, v in _local_state.get(job.name, {}).items()}
+            row['next_run'] = row.get('next_run') or _ts(job.cron.next_after(_now()))
+            avg = averages.get(f"{job.name}@{OWNER}")
+        jobs.append({
+            "name": job.name,
+            "schedule": job.cron.expr,
+            "scope": "host" if job.exclusive else "process",
+            "next_run": row.get('next_run'),
+            "last_started": row.get('last_started'),
+            "last_status": row.get('last_status'),
+            "last_duration": row.get('last_duration'),
+            "avg_duration": avg,
+            "last_result": row.get('last_result'),
+            "last_error": row.get('last_error'),
+            "runs": row.get('runs', 0),
+            "failures": row.get('failures', 0),
+        })
+    return jobs
+
+def history(name, limit=20):
+    """Most recent runs of a job, newest first."""
+    conn = _connect()
+    try:
+        rows = conn.execute(
+            "SELECT * FROM job_runs WHERE name = ? OR name LIKE ? ORDER BY id DESC LIMIT ?",
+            (name, f"{name}@%", limit)
+        ).fetchall()
+        return [dict(r) for r in rows]
+    finally:
+        conn.close()
+
+# --- WORKER ---
+
+def _seconds_until_next():
+    conn = _connect()
+    try:
+        upcoming = [datetime.datetime.fromisoformat(r[0]) for r in conn.execute("SELECT next_run FROM jobs")]
+    finally:
+        conn.close()
+    upcoming += [s["next_run"] for s in _local_state.values()]
+    if not upcoming:
+        return TICK_SECONDS
+    wait = (min(upcoming) - datetime.datetime.now()).total_seconds()
+    return min(TICK_SECONDS, max(1, wait))
+
+def _run_worker():
+    while True:
+        try:
+            run_due()
+            wait = _seconds_until_next()
+        except Exception as e:
+            print(f"Scheduler error: {e}")
+            wait = TICK_SECONDS
+        _wakeup.wait(wait)
+        _wakeup.clear()
+
+def start():
+    """Start the scheduler thread once per process (no-op when SCHEDULER_ENABLED=false)."""
+    global _worker
+    if not ENABLED:
+        return None
+    with _worker_lock:
+        if _worker is not None and _worker.is_alive():
+            return _worker
+        init_state()
+        _worker = threading.Thread(target=_run_worker, name="scheduler", daemon=True)
+        _worker.start()
+        return _worker
+
+# --- JOBS ---
+# Data-layer imports are deferred so importing the scheduler stays cheap.
+
+def _refresh_next_due():
+    # Roll yesterday's unfinished habits forward before anyone opens the Today view
+    from src.data_manager import refresh_next_due_dates
+    return refresh_next_due_dates()
+
+def _close_days():
+    # 'Missed' markers for yesterday (and any day missed while nothing ran)
+    from src.data_manager import materialize_missed_days
+    return materialize_missed_days()
+
+def _train_miss_risk():
+    from src.data_manager import load_habits
+    from src.ml_logic import update_miss_risk_model
+    model = update_miss_risk_model(load_habits())
+    return str(model.trained_through)
+
+def _rebuild_streaks():
+    from src import bitmaps
+    from src.data_manager import rebuild_completion_bitmaps
+    return rebuild_completion_bitmaps() if bitmaps.ENABLED else "bitmaps disabled"
+
+def _vacuum():
+    from src.data_manager import vacuum_db
+    return vacuum_db()
+
+def _warm_caches():
+    # Chart caches are per process and keyed by day, so each process fills its own
+    # (chart_data, not analytics: the CLI must not import streamlit/plotly)
+    from src.data_manager import load_due_habits
+    from src import chart_data
+    load_due_habits()
+    chart_data.warm_up()
+
+register("refresh-next-due", "1 0 * * *", _refresh_next_due)
+register("warm-caches", "5 0 * * *", _warm_caches, exclusive=False)
+register("close-days", "10 0 * * *", _close_days)
+register("train-miss-risk", "30 0 * * *", _train_miss_risk)
+register("rebuild-streaks", "15 3 * * *", _rebuild_streaks)
+register("vacuum", "45 3 * * 0", _vacuum, timeout=3600)
@@ -0,0 +1,381 @@
+"""
+Incremental replication between the local SQLite database and MongoDB.
+
+push: SQLite `changes` rows (latest change sequence per row, deleted = tombstone)
+      after the 'push_seq' checkpoint become batched bulk_write calls.
+pull: Mongo docs stamped after the per-collection updated_at checkpoint (minus
+      CLOCK_SKEW), plus the tombstones collection, are applied to SQLite in one
+      transaction per batch.
+
+Row ids differ between the stores (INTEGER vs ObjectId), so sync_ids maps them.
+A pull never overwrites (or deletes) a local row with unpushed changes: the local
+edit wins and goes out with the next push. Pushed rows keep the updated_at stamp
+they were sent with, so the next pull recognises and skips its own writes.
+"""
+from datetime import datetime, timedelta
+from bson.objectid import ObjectId
+from pymongo import UpdateOne, DeleteOne
+
+from src import database
+from src.database import SYNC_TABLES
+
+BATCH_SIZE = 500
+EPOCH = datetime(1970, 1, 1)
+# updated_at comes from each writer's clock and is taken before its write commits,
+# so a doc can land behind a pull checkpoint; pulls re-read this far back
+CLOCK_SKEW = timedelta(minutes=5)
+
+# --- STATE ---
+
+def _get_state(conn, key, default=None):
+    row = conn.execute("SELECT value FROM sync_state WHERE key = ?", (key,)).fetchone()
+    return row[0] if row else default
+
+def _set_state(conn, key, value):
+    conn.execute("INSERT OR REPLACE INTO sync_state (key, value) VALUES (?, ?)", (key, str(value)))
+
+def _remote_ids(conn, table, local_ids):
+    """{local_id: remote_id} for the given rows."""
+    local_ids = list(local_ids)
+    if not local_ids:
+        return {}
+    marks = ", ".join("?" * len(local_ids))
+    rows = conn.execute(
+        f"SELECT local_id, remote_id FROM sync_ids WHERE table_name = ? AND local_id IN ({marks})",
+        (table, *local_ids)
+    )
+    return {r[0]: r[1] for r in rows}
+
+def _local_ids(conn, table, remote_ids):
+    """{remote_id: local_id} for the given docs."""
+    remote_ids = list(remote_ids)
+    if not remote_ids:
+        return {}
+    marks = ", ".join("?" * len(remote_ids))
+    rows = conn.execute(
+        f"SELECT remote_id, local_id FROM sync_ids WHERE table_name = ? AND remote_id IN ({marks})",
+        (table, *remote_ids)
+    )
+    return {r[0]: r[1] for r in rows}
+
+def _map(conn, table, local_id, remote_id):
+    conn.execute(
+        "INSERT OR REPLACE INTO sync_ids (table_name, local_id, remote_id) VALUES (?, ?, ?)",
+        (table, local_id, str(remote_id))
+    )
+
+def _pending_ids(conn, table, local_ids):
+    """The given rows that have changes not pushed yet."""
+    local_ids = list(local_ids)
+    if not local_ids:
+        return set()
+    marks = ", ".join("?" * len(local_ids))
+    rows = conn.execute(
+        f"SELECT row_id FROM changes WHERE table_name = ? AND seq > ? AND row_id IN ({marks})",
+        (table, int(_get_state(conn, "push_seq", 0)), *local_ids)
+    )
+    return {r[0] for r in rows}
+
+def pending_changes():
+    """Number of local rows changed since the last push."""
+    conn = database.get_db_connection()
+    try:
+        seq = int(_get_state(conn, "push_seq", 0))
+        return conn.execute("SELECT COUNT(*) FROM changes WHERE seq > ?", (seq,)).fetchone()[0]
+    finally:
+        conn.close()
+
+# --- CONVERSION ---
+
+def _parse_ts(value):
+    if value is None or isinstance(value, datetime):
+        return value
+    try:
+        return datetime.fromisoformat(str(value))
+    except ValueError:
+        return None
+
+def _read_checkpoint(value):
+    """'<updated_at>|<_id>' of the last pulled doc -> (datetime, ObjectId)."""
+    if not value:
+        return EPOCH, ObjectId("0" * 24)
+    stamp, doc_id = value.split("|")
+    return _parse_ts(stamp), ObjectId(doc_id)
+
+def _format_ts(value):
+    if isinstance(value, datetime):
+        return value.strftime("%Y-%m-%d %H:%M:%S")
+    return value
+
+def _stamp(value):
+    """updated_at as stored locally for synced rows (Mongo keeps milliseconds)."""
+    return value.strftime("%Y-%m-%d %H:%M:%S.%f")[:-3] if isinstance(value, datetime) else value
+
+def _to_remote(table, row, habit_remote_ids, now):
+    doc = {col: row[col] for col in SYNC_TABLES[table]}
+    for col in ("created_at", "timestamp", "due_at"):
+        if col in doc:
+            doc[col] = _parse_ts(doc[col])
+    if table == "logs":
+        doc["habit_id"] = habit_remote_ids[row["habit_id"]]
+    doc["updated_at"] = now
+    return doc
+
+def _to_local(table, doc, habit_local_ids):
+    row = {col: doc.get(col) for col in SYNC_TABLES[table]}
+    for col in ("created_at", "timestamp", "due_at"):
+        if col in row:
+            row[col] = _format_ts(row[col])
+    if table == "logs":
+        row["habit_id"] = habit_local_ids.get(str(doc.get("habit_id")))
+    row["updated_at"] = _stamp(doc.get("updated_at"))
+    return row
+
+# --- PUSH ---
+
+def _push_table(conn, mdb, table, batch, now):
+    """Write one table's slice of a change batch to Mongo. Returns (ops, touched remote habit ids)."""
+    live_ids = [c["row_id"] for c in batch if not c["deleted"]]
+    rows = {}
+    if live_ids:
+        marks = ", ".join("?" * len(live_ids))
+        rows = {r["id"]: dict(r) for r in conn.execute(f"SELECT * FROM {table} WHERE id IN ({marks})", live_ids)}
+    remote = _remote_ids(conn, table, [c["row_id"] for c in batch])
+
+    habit_remote = {}
+    if table == "logs":
+        habit_ids = {r["habit_id"] for r in rows.values()}
+        habit_remote = _remote_ids(conn, "habits", habit_ids)
+        for hid in habit_ids - set(habit_remote):
+            # Habit not pushed yet: reserve its id now, its own change will fill the doc
+            habit_remote[hid] = str(ObjectId())
+            _map(conn, "habits", hid, habit_remote[hid])
+
+    ops, new_logs = [], []
+    for change in batch:
+        local_id = change["row_id"]
+        remote_id = remote.get(local_id)
+        if change["deleted"]:
+            if remote_id:
+                ops.append(DeleteOne({"_id": ObjectId(remote_id)}))
+            continue
+        row = rows.get(local_id)
+        if row is None:
+            # Deleted after this change was read; its tombstone follows
+            continue
+        doc = _to_remote(table, row, habit_remote, now)
+        if remote_id is None and table == "logs":
+            # Logs are unique per (habit_id, date): upsert on that key, learn the id afterwards
+            ops.append(UpdateOne({"habit_id": doc["habit_id"], "date": doc["date"]}, {"$set": doc}, upsert=True))
+            new_logs.append((local_id, doc["habit_id"], doc["date"]))
+            continue
+        if remote_id is None:
+            remote_id = str(ObjectId())
+            _map(conn, table, local_id, remote_id)
+        ops.append(UpdateOne({"_id": ObjectId(remote_id)}, {"$set": doc}, upsert=True))
+
+    # Persist reserved ids before writing so a retry reuses them (no duplicate docs)
+    conn.commit()
+    if ops:
+        mdb[table].bulk_write(ops, ordered=False)
+        # Same stamp locally: the next pull sees these docs as already applied.
+        # updated_at is not a tracked column, so this records no change.
+        pushed_ids = [c["row_id"] for c in batch if c["row_id"] in rows]
+        conn.execute(
+            f"UPDATE {table} SET updated_at = ? WHERE id IN ({', '.join('?' * len(pushed_ids))})",
+            (_stamp(now), *pushed_ids)
+        )
+    if new_logs:
+        found = mdb.logs.find(
+            {"habit_id": {"$in": list({h for _, h, _ in new_logs})}, "date": {"$in": list({d for _, _, d in new_logs})}},
+            {"habit_id": 1, "date": 1}
+        )
+        by_key = {(d["habit_id"], d["date"]): d["_id"] for d in found}
+        for local_id, habit_id, day in new_logs:
+            if (habit_id, day) in by_key:
+                _map(conn, "logs", local_id, by_key[(habit_id, day)])
+    touched = {habit_remote[r["habit_id"]] for r in rows.values()} if table == "logs" else set()
+    return len(ops), touched
+
+def push(batch_size=BATCH_SIZE):
+    """Send local changes since the last push to Mongo. Returns {table: operations}."""
+    from src import db_mongo
+
+    mdb = db_mongo.get_db()
+    conn = database.get_db_connection()
+    pushed, touched = {}, set()
+    try:
+        seq = int(_get_state(conn, "push_seq", 0))
+        while True:
+            changes = conn.execute(
+                "SELECT table_name, row_id, seq, deleted FROM changes WHERE seq > ? ORDER BY seq LIMIT ?",
+                (seq, batch_size)
+            ).fetchall()
+            if not changes:
+                break
+            now = datetime.now()
+            now = now.replace(microsecond=now.microsecond // 1000 * 1000)  # Mongo precision
+            # Habits first so their logs can reference them
+            for table in SYNC_TABLES:
+                batch = [c for c in changes if c["table_name"] == table]
+                if batch:
+                    count, habits = _push_table(conn, mdb, table, batch, now)
+                    pushed[table] = pushed.get(table, 0) + count
+                    touched |= habits
+            seq = changes[-1]["seq"]
+            _set_state(conn, "push_seq", seq)
+            conn.commit()
+    finally:
+        conn.close()
+
+    # Derived data on the Mongo side
+    for habit_id in touched:
+        db_mongo.rebuild_completion_bitmaps(habit_id)
+        db_mongo.update_next_due_date(habit_id)
+    return pushed
+
+# --- PULL ---
+
+def _apply_batch(conn, table, docs, touched):
+    """Upsert Mongo docs into SQLite without recording them as local changes."""
+    habit_local = {}
+    if table == "logs":
+        habit_local = _local_ids(conn, "habits", {str(d.get("habit_id")) for d in docs})
+    local = _local_ids(conn, table, [str(d["_id"]) for d in docs])
+    pending = _pending_ids(conn, table, local.values())
+    stamps = {}
+    if local:
+        marks = ", ".join("?" * len(local))
+        rows = conn.execute(f"SELECT id, updated_at FROM {table} WHERE id IN ({marks})", list(local.values()))
+        stamps = {r[0]: r[1] for r in rows}
+    cols = list(SYNC_TABLES[table]) + ["updated_at"]
+    applied = 0
+    for doc in docs:
+        row = _to_local(table, doc, habit_local)
+        if table == "logs" and row["habit_id"] is None:
+            # Habit never synced (e.g. deleted remotely); nothing to attach the log to
+            continue
+        values = [row[c] for c in cols]
+        local_id = local.get(str(doc["_id"]))
+        if local_id in pending or (local_id is not None and stamps.get(local_id) == row["updated_at"]):
+            # Unpushed local edit (it wins), or this client's own push coming back
+            continue
+        if local_id is None and table == "logs":
+            same_day = conn.execute(
+                "SELECT id FROM logs WHERE habit_id = ? AND date = ?", (row["habit_id"], row["date"])
+            ).fetchone()
+            if same_day and _pending_ids(conn, "logs", [same_day[0]]):
+                # The local log for that day is unpushed; its push will upsert and map it
+                continue
+        if local_id is None:
+            if table == "logs":
+                local_id = conn.execute(
+                    f"""
+                    INSERT INTO logs ({", ".join(cols)}) VALUES ({", ".join("?" * len(cols))})
+                    ON CONFLICT (habit_id, date) DO UPDATE SET
+                        {", ".join(f"{c} = excluded.{c}" for c in cols if c not in ("habit_id", "date"))}
+                    RETURNING id
+                    """,
+                    values
+                ).fetchone()[0]
+            else:
+                local_id = conn.execute(
+                    f"INSERT INTO {table} ({', '.join(cols)}) VALUES ({', '.join('?' * len(cols))})", values
+                ).lastrowid
+            _map(conn, table, local_id, doc["_id"])
+        else:
+            conn.execute(
+                f"UPDATE {table} SET {', '.join(f'{c} = ?' for c in cols)} WHERE id = ?", values + [local_id]
+            )
+        if table == "logs":
+            touched.add(row["habit_id"])
+        elif table == "habits":
+            touched.add(local_id)
+        applied += 1
+    return applied
+
+def _apply_tombstones(conn, tombstones):
+    deleted = 0
+    for tomb in tombstones:
+        table = tomb["collection"]
+        local = _local_ids(conn, table, [tomb["doc_id"]])
+        # A row edited locally since the last push is kept; the push recreates the doc
+        if tomb["doc_id"] in local and not _pending_ids(conn, table, [local[tomb["doc_id"]]]):
+            conn.execute(f"DELETE FROM {table} WHERE id = ?", (local[tomb["doc_id"]],))
+            conn.execute("DELETE FROM sync_ids WHERE table_name = ? AND remote_id = ?", (table, tomb["doc_id"]))
+            deleted += 1
+    return deleted
+
+def _in_apply_transaction(conn, apply):
+    """Run apply() in one write transaction with change tracking suppressed."""
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute("INSERT OR REPLACE INTO sync_state (key, value) VALUES ('applying', '1')")
+        result = apply()
+        conn.execute("DELETE FROM sync_state WHERE key = 'applying'")
+        conn.commit()
+        return result
+    except Exception:
+        conn.rollback()
+        raise
+
+def pull(batch_size=BATCH_SIZE):
+    """Apply Mongo changes since the last pull to SQLite. Returns {table: docs applied}."""
+    from src import db_mongo, db_sqlite
+
+    mdb = db_mongo.get_db()
+    conn = database.get_db_connection()
+    pulled, touched = {}, set()
+    try:
+        for table in SYNC_TABLES:
+            key = f"pull_since:{table}"
+            since, _ = _read_checkpoint(_get_state(conn, key))
+            # Overlapping window: docs applied before carry the same stamp locally and are skipped
+            query = {"updated_at": {"$gte": since - CLOCK_SKEW}}
+            cursor = mdb[table].find(query).sort([("updated_at", 1), ("_id", 1)]).batch_size(batch_size)
+            batch = []
+            for doc in cursor:
+                batch.append(doc)
+                if len(batch) >= batch_size:
+                    pulled[table] = pulled.get(table, 0) + _pull_batch(conn, table, key, batch, touched)
+                    batch = []
+            if batch:
+                pulled[table] = pulled.get(table, 0) + _pull_batch(conn, table, key, batch, touched)
+
+        key = "pull_since:tombstones"
+        since = _parse_ts(_get_state(conn, key)) or EPOCH
+        # Applying a tombstone twice finds no mapped row the second time
+        tombstones = list(mdb.tombstones.find({"deleted_at": {"$gt": since - CLOCK_SKEW}}).sort("deleted_at", 1))
+        if tombstones:
+            def apply():
+                count = _apply_tombstones(conn, tombstones)
+                _set_state(conn, key, max(since, tombstones[-1]["deleted_at"]).isoformat())
+                return count
+            pulled["deleted"] = _in_apply_transaction(conn, apply)
+    finally:
+        conn.close()
+
+    # Derived data on the SQLite side
+    for habit_id in touched:
+        db_sqlite.rebuild_completion_bitmaps(habit_id)
+        db_sqlite.update_next_due_date(habit_id)
+    return pulled
+
+def _pull_batch(conn, table, key, batch, touched):
+    def apply():
+        count = _apply_batch(conn, table, batch, touched)
+        last = batch[-1]
+        # The re-read window starts behind the checkpoint; never move it back
+        if (last['updated_at'], last['_id']) > _read_checkpoint(_get_state(conn, key)):
+            _set_state(conn, key, f"{last['updated_at'].isoformat()}|{last['_id']}")
+        return count
+    return _in_apply_transaction(conn, apply)
+
+def sync(direction="both", batch_size=BATCH_SIZE):
+    """Pull then push (the pull leaves rows with unpushed edits alone; the push sends them)."""
+    result = {}
+    if direction in ("pull", "both"):
+        result["pull"] = pull(batch_size)
+    if direction in ("push", "both"):
+        result["push"] = push(batch_size)
+    return result
@@ -1,5 +1,17 @@
 import streamlit as st
 import pandas as pd
+from src.models import Habit
+
+# A fragment reruns on its own when one of its widgets is used, instead of the
+# whole script (st.fragment, Streamlit 1.37+). Fragments use on_click callbacks
+# rather than st.rerun(), which would rerun the whole app (a habit card does so
+# only when a click queued a reward, to refresh the XP header).
+
+def fragment(func=None, *, run_every=None):
+    """Decorator: `@fragment`, or `@fragment(run_every=seconds)` to also refresh on a timer."""
+    if func is None:
+        return lambda f: fragment(f, run_every=run_every)
+    return st.fragment(func, run_every=run_every)
 
 def render_edit_habit_form(habit_id, current_data):
     """Render form to edit an existing habit (Interactive, no st.form)."""
@@ -150,46 +162,105 @@ def render_add_habit_form():
     return None
 
 
-def render_habit_card(habit, logs, on_complete):
+def _card_state(habit, today, progress, is_done):
+    """
+    Today's state for one habit card. Click callbacks update it, so a fragment
+    rerun redraws the card without querying; a full rerun that passes different
+    values (fresh from the database) replaces it.
+    """
+    key = f"habit_card_{habit.id}"
+    seed = (today, progress, is_done)
+    state = st.session_state.get(key)
+    if state is None or state["seed"] != seed:
+        state = st.session_state[key] = {"seed": seed, "progress": progress, "done": is_done, "skipped": False}
+    return state
+
+def _complete_card(state, habit, today, on_complete):
+    # on_complete is rewards.complete_habit bound to the session (returns success, reward_dict);
+    # the reward is usually empty here and delivered by the worker later
+    success, reward = on_complete(habit, today)
+    if success:
+        state["done"] = True
+        # A reward was queued: the card reruns the app so the XP header picks it up
+        st.session_state.reward_pending = True
+        if reward:
+            st.session_state.latest_reward = reward
+
+def _increment_card(state, habit, today, on_increment):
+    result = on_increment(habit, today)
+    if result:
+        state["progress"] = result["value"]
+        state["done"] = result["status"] == "Completed"
+        if result["completed_now"]:
+            st.session_state.reward_pending = True
+
+def _skip_card(state, habit, today, on_skip):
+    if on_skip(habit, today) is not None:
+        state["skipped"] = True
+
+@fragment
+def render_habit_card(habit, on_complete, is_done=False, progress=0, on_increment=None, on_skip=None):
     """
     Renders a card for a single habit using native Streamlit colored containers (Alerts).
+    `habit` is a Habit record (src.models); rows are converted once if a Series is passed.
+    `is_done` comes from the caller (the Today view only lists pending habits),
+    so the card never scans the logs frame itself.
+    Measurable habits (target_value > 1) show today's `progress` and a +1 button
+    wired to `on_increment(habit, date)` instead of Done. `on_skip(habit, date)`
+    adds a Skip button (a rest day: not counted as a miss).
+    Each card is a fragment: a click reruns only this card, or the whole app
+    when it queued a reward (so the XP header updates).
     """
+    if st.session_state.pop("reward_pending", False):
+        # The XP header lives outside this fragment
+        st.rerun()
+    habit = Habit.from_row(habit)
     today = pd.Timestamp.now().strftime("%Y-%m-%d")
-    is_done = False
-    # Check if habit is done for today
-    if not logs.empty:
-        if not logs[
-            (logs['habit_id'] == habit['id']) & 
-            (logs['date'] == today)
-        ].empty:
-            is_done = True
-            
+    state = _card_state(habit, today, progress, is_done)
+
     # Layout: Bordered Container (Targeted by CSS :has for color)
     with st.container(border=True):
         c1, c2 = st.columns([6, 1])
         
         with c1:
-            st.markdown(f"#### {habit['name']}")
+            st.markdown(f"#### {habit.name}")
             # Use emoji mapping for visual flair
             cat_emoji = {
                 "Health": "💪", "Productivity": "⚡", "Learning": "📚", 
                 "Mindfulness": "🧘", "Other": "✨"
-            }.get(habit['category'], "✨")
+            }.get(habit.category, "✨")
             
             # The word 'Health', 'Productivity' etc must be present for CSS regex
-            st.caption(f"{cat_emoji} {habit['category']}  •  📅 {format_frequency(habit)}  •  🎯 {habit['target_value']}")
+            st.caption(f"{cat_emoji} {habit.category}  •  📅 {format_frequency(habit)}  •  🎯 {habit.target_value}")
+            measurable = habit.target_value > 1 and on_increment is not None
+            if measurable:
+                st.progress(
+                    min(1.0, state["progress"] / habit.target_value),
+                    text=f"{state['progress']} / {habit.target_value} {habit.target_unit}"
+                )
             
         with c2:
             st.write("") # Spacer
-            if is_done:
-                st.button("✅", key=f"btn_done_{habit['id']}", disabled=True)
+            if state["done"]:
+                st.button("✅", key=f"btn_done_{habit.id}", disabled=True)
+            elif state["skipped"]:
+                st.button("⏭️", key=f"btn_skipped_{habit.id}", disabled=True, help="Skipped today")
+            elif measurable:
+                # Callback runs before the rerun, so each click adds exactly once
+                st.button(
+                    "+1", key=f"btn_inc_{habit.id}", help=f"Add 1 {habit.target_unit}",
+                    on_click=_increment_card, args=(state, habit, today, on_increment)
+                )
             else:
-                if st.button("Done", key=f"btn_{habit['id']}", help="Mark as Done"):
-                    # on_complete is log_habit_completion (returns success, reward_dict)
-                    success, reward = on_complete(habit['id'], today)
-                    if success:
-                        st.session_state.latest_reward = reward
-                        st.rerun()
+                st.button(
+                    "Done", key=f"btn_{habit.id}", help="Mark as Done",
+                    on_click=_complete_card, args=(state, habit, today, on_complete)
+                )
+            if not state["done"] and not state["skipped"] and on_skip is not None:
+                st.button(
+                    "Skip", key=f"btn_skip_{habit.id}", help="Skip today (not counted as a miss)",
+                    on_click=_skip_card, args=(state, habit, today, on_skip)
+                )
 
 def get_category_color(category):
     colors = {
@@ -221,3 +292,68 @@ def format_frequency(habit):
     elif ftype == 'custom':
         return f"Every {val} Days"
     return ftype
+
+def get_page_cursor(state_key):
+    """Cursor for the page currently shown under `state_key` (None = first page)."""
+    return st.session_state.setdefault(state_key, [None])[-1]
+
+def render_pagination(state_key, next_cursor):
+    """
+    Newer/Older buttons for keyset-paginated lists.
+    Keeps a stack of cursors in session_state so each rerun loads exactly one page.
+    """
+    stack = st.session_state.setdefault(state_key, [None])
+    if len(stack) == 1 and next_cursor is None:
+        return
+    c1, c2 = st.columns(2)
+    with c1:
+        if len(stack) > 1:
+            st.button("← Newer", key=f"{state_key}_newer", on_click=stack.pop)
+    with c2:
+        if next_cursor is not None:
+            st.button("Older →", key=f"{state_key}_older", on_click=stack.append, args=(next_cursor,))
+
+def get_timeline(state_key, load_page, owner, generation):
+    """
+    Rows loaded so far for an append-only keyset timeline ("Load older").
+    `load_page(cursor)` returns (df, next_cursor). Pages already shown stay in
+    session_state, so a rerun fetches nothing; switching `owner` or a new data
+    `generation` starts over from the first page.
+    """
+    state = st.session_state.get(state_key)
+    if not state or state["owner"] != owner or state["generation"] != generation:
+        page, cursor = load_page(None)
+        state = st.session_state[state_key] = {
+            "owner": owner, "generation": generation, "rows": page.to_dict('records'), "cursor": cursor
+        }
+    return state
+
+def render_load_older(state_key, load_page):
+    """"Load older" button under a timeline from get_timeline; each click fetches one more page."""
+    state = st.session_state[state_key]
+    if state["cursor"] is None:
+        return
+
+    def load():
+        page, cursor = load_page(state["cursor"])
+        state["rows"] += page.to_dict('records')
+        state["cursor"] = cursor
+
+    st.button("Load older", key=f"{state_key}_older", on_click=load, use_container_width=True)
+
+LOG_STATUS_ICONS = {"Completed": "✅", "Partial": "🟡", "Skipped": "⏭️", "Missed": "❌"}
+
+def render_log_timeline(habit, rows):
+    """One entry per logged day: date, status, value (measurable habits) and notes."""
+    habit = Habit.from_row(habit)
+    for row in rows:
+        status = row.get('status') or "Completed"
+        text = f"{LOG_STATUS_ICONS.get(status, '✅')} {status}"
+        if habit.target_value > 1 and status not in ("Skipped", "Missed"):
+            text += f" • {row.get('value') or 0} / {habit.target_value} {habit.target_unit}"
+        with st.container(border=True):
+            c1, c2 = st.columns([1, 3])
+            c1.markdown(f"**{pd.Timestamp(row['date']):%a %d %b %Y}**")
+            c2.markdown(text)
+            if row.get('notes'):
+                c2.caption(row['notes'])
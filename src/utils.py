@@ -1,90 +1,102 @@
+import sys
 import pandas as pd
 import datetime
+from src.models import Habit
+
+def report_error(message):
+    """
+    Show an error in the UI when running under Streamlit, otherwise print it.
+    Keeps the data layer importable without Streamlit (api.py, cli.py).
+    """
+    st = sys.modules.get("streamlit")
+    if st is not None:
+        from streamlit import runtime
+        if runtime.exists():
+            st.error(message)
+            return
+    print(message, file=sys.stderr)
+
+def to_date(date_check):
+    """Normalize a datetime.date, string, datetime or Timestamp to a datetime.date."""
+    if isinstance(date_check, str):
+        return pd.to_datetime(date_check).date()
+    if isinstance(date_check, (pd.Timestamp, datetime.datetime)):
+        return date_check.date()
+    return date_check
+
+def to_timestamp(value):
+    """Normalize a datetime, Timestamp or ISO string to 'YYYY-MM-DD HH:MM:SS' (None stays None)."""
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return None
+    return pd.Timestamp(value).strftime("%Y-%m-%d %H:%M:%S")
 
 def is_habit_due(habit, date_check):
     """
     Check if a habit is due on the given date (datetime.date, string, or timestamp).
     Handles logic for Daily, Weekly, Bi-weekly, Monthly, Bi-monthly, Custom, and Specific Days.
+    `habit` may be a Habit record (fast path) or a dict/Series row, which is parsed once here.
     """
-    # Normalize date_check to date object
-    if isinstance(date_check, str):
-        date_check = pd.to_datetime(date_check).date()
-    elif isinstance(date_check, pd.Timestamp):
-        date_check = date_check.date()
-    elif isinstance(date_check, datetime.datetime):
-        date_check = date_check.date()
-        
-    # Parse creation date safely
-    try:
-        created_at = pd.to_datetime(habit['created_at']).date()
-    except:
-        created_at = date_check # Fallback
-        
-    # If habit created after the check date, it wasn't due yet
-    if date_check < created_at:
-        return False
+    return Habit.from_row(habit).is_due(to_date(date_check))
+
+# --- TYPED FRAMES ---
+# Column sets shared by both backends. Loaders accept a `columns` projection;
+# anything outside these lists (e.g. logs.notes) must be requested explicitly.
+HABIT_COLUMNS = ['id', 'name', 'category', 'frequency_type', 'frequency_value', 'target_value', 'target_unit', 'created_at', 'is_active', 'next_due_date']
+LOG_COLUMNS = ['id', 'habit_id', 'date', 'value', 'status']
+LOG_ALL_COLUMNS = LOG_COLUMNS + ['notes', 'timestamp']
+# One habit's timeline (get_habit_logs_page); day markers included
+HISTORY_COLUMNS = ['id', 'date', 'value', 'status', 'notes']
+
+# Day markers (value 0): 'Missed' is written by the day-close job for due days
+# left unlogged, 'Skipped' by the user. They are not logs: loaders, streaks and
+# stats ignore them, and a later completion of that day replaces the marker.
+DAY_MARKERS = ('Missed', 'Skipped')
+# Days the day-close job re-checks by default (covers weeks without a run)
+MISSED_LOOKBACK_DAYS = 35
+
+# Reminders may carry a due time (due_at) and a recurrence; see src/notifications.py
+REMINDER_COLUMNS = ['id', 'text', 'priority', 'created_at', 'is_completed', 'due_at', 'recurrence', 'notified_at']
+PROJECT_COLUMNS = ['id', 'text', 'description', 'priority', 'created_at', 'is_completed']
+RECURRENCES = ('daily', 'weekdays', 'weekly', 'monthly')
+
+def _compact_ids(series):
+    """Downcast integer ids to int32; Mongo ObjectId strings are left as-is."""
+    numeric = pd.to_numeric(series, errors='coerce')
+    if len(series) and numeric.notna().all():
+        return numeric.astype('int32')
+    return series.astype(str)
+
+def compact_habits(df, columns=None):
+    """Return habits with compact dtypes and `created_at` parsed once."""
+    columns = columns or HABIT_COLUMNS
+    if df.empty:
+        return pd.DataFrame(columns=columns)
+    df = df[[c for c in columns if c in df.columns]].copy()
+    if 'id' in df: df['id'] = _compact_ids(df['id'])
+    if 'category' in df: df['category'] = df['category'].astype('category')
+    if 'frequency_type' in df: df['frequency_type'] = df['frequency_type'].astype('category')
+    if 'target_value' in df: df['target_value'] = pd.to_numeric(df['target_value'], errors='coerce').fillna(1).astype('int32')
+    if 'is_active' in df: df['is_active'] = pd.to_numeric(df['is_active'], errors='coerce').fillna(0).astype('int8')
+    if 'created_at' in df: df['created_at'] = pd.to_datetime(df['created_at'], errors='coerce', format='mixed')
+    return df.reset_index(drop=True)
+
+def compact_logs(df, columns=None):
+    """Return logs with compact dtypes; `date` becomes a day-resolution datetime."""
+    columns = columns or LOG_COLUMNS
+    if df.empty:
+        return pd.DataFrame(columns=columns)
+    df = df[[c for c in columns if c in df.columns]].copy()
+    if 'id' in df: df['id'] = _compact_ids(df['id'])
+    if 'habit_id' in df: df['habit_id'] = _compact_ids(df['habit_id'])
+    if 'date' in df: df['date'] = pd.to_datetime(df['date'], errors='coerce').dt.normalize().astype('datetime64[s]')
+    if 'value' in df: df['value'] = pd.to_numeric(df['value'], errors='coerce').fillna(0).astype('int32')
+    if 'status' in df: df['status'] = df['status'].astype('category')
+    if 'notes' in df: df['notes'] = df['notes'].astype('string')
+    if 'timestamp' in df: df['timestamp'] = pd.to_datetime(df['timestamp'], errors='coerce', format='mixed')
+    return df.reset_index(drop=True)
 
-    ftype = habit.get('frequency_type', 'daily')
-    fvalue = habit.get('frequency_value')
-    
-    if ftype == 'daily':
-        return True
-    
-    elif ftype == 'days_of_week':
-        # value example: "Mon,Wed,Fri"
-        if not fvalue: return False
-        day_name = date_check.strftime("%a") # Mon, Tue
-        return day_name in fvalue
-        
-    elif ftype == 'weekly':
-        # value: "Mon", "Tue" etc.
-        if not fvalue: return False
-        day_name = date_check.strftime("%a")
-        return day_name == fvalue
-        
-    elif ftype == 'biweekly':
-        # Every 2 weeks on specific day
-        if not fvalue: return False
-        day_name = date_check.strftime("%a")
-        if day_name != fvalue: return False
-        
-        # Calculate weeks since creation
-        delta_days = (date_check - created_at).days
-        week_diff = delta_days // 7
-        return (week_diff % 2) == 0
-        
-    elif ftype == 'monthly':
-        # value: "1", "15" etc.
-        try:
-            target_day = int(fvalue)
-        except:
-            return False
-            
-        return date_check.day == target_day
-        
-    elif ftype == 'bimonthly':
-        try:
-            target_day = int(fvalue)
-        except:
-            return False
-            
-        if date_check.day != target_day: return False
-        
-        # Check month parity
-        current_months = date_check.year * 12 + date_check.month
-        created_months = created_at.year * 12 + created_at.month
-        diff = current_months - created_months
-        return (diff % 2) == 0
-        
-    elif ftype == 'custom':
-        # Every X days
-        try:
-            interval = int(fvalue)
-        except:
-            return 1
-        
-        if interval < 1: interval = 1
-        delta_days = (date_check - created_at).days
-        return (delta_days % interval) == 0
-        
-    return True
+def to_dates(series):
+    """Return the `datetime.date` values of a date column, parsing only if needed."""
+    if not pd.api.types.is_datetime64_any_dtype(series):
+        series = pd.to_datetime(series)
+    return series.dt.date
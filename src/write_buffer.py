@@ -0,0 +1,328 @@
+import os
+import json
+import uuid
+import sqlite3
+import threading
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# --- MONGO WRITE BUFFER ---
+# With the Mongo backend, request-path writes (completions, progress, reminders,
+# projects) are appended to a local SQLite journal and applied to Mongo by a
+# background thread, in order, backing off while Mongo is unreachable. db_mongo
+# merges pending entries into its reads so the app sees its own writes at once.
+# Every applier is idempotent (client-generated ids, upserts, op_id guards), so
+# replaying an entry after a crash between "applied" and "removed" is harmless.
+# The app, api.py and the CLI share the journal: a drainer claims its batch in a
+# write transaction (pending -> applying) and only while no other claim is live,
+# so entries are applied once and in order; applied op_ids are kept for a day
+# and skipped if a stale claim is replayed. Entries that keep failing are parked
+# as 'failed', reported by status()/failed() and requeued with retry_failed().
+
+JOURNAL_PATH = os.getenv(
+    "WRITE_BUFFER_PATH",
+    os.path.join(os.path.dirname(os.getenv("DATABASE_PATH", "data/habits.db")) or ".", "mongo_journal.db")
+)
+BATCH_SIZE = 200
+POLL_SECONDS = 5
+MIN_BACKOFF = 1
+MAX_BACKOFF = 60
+MAX_ATTEMPTS = 5
+CLAIM_LEASE_SECONDS = 300
+
+class NotDrained(Exception):
+    """Buffered writes are still waiting for Mongo."""
+
+# op -> (apply, batched). Batched appliers take a list of consecutive payloads.
+_handlers = {}
+_reconnect_hooks = []
+_state = {"online": True, "backoff": 0, "last_error": None}
+
+_wakeup = threading.Event()
+_drain_lock = threading.Lock()
+_worker = None
+_worker_lock = threading.Lock()
+
+def _connect():
+    os.makedirs(os.path.dirname(JOURNAL_PATH) or ".", exist_ok=True)
+    conn = sqlite3.connect(JOURNAL_PATH, timeout=10)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+def init_journal():
+    conn = _connect()
+    try:
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS journal (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                op TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                status TEXT DEFAULT 'pending',
+                attempts INTEGER DEFAULT 0,
+                last_error TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                claimed_at TIMESTAMP
+            )
+        """)
+        # Journals created before claims
+        if "claimed_at" not in {row['name'] for row in conn.execute("PRAGMA table_info(journal)")}:
+            conn.execute("ALTER TABLE journal ADD COLUMN claimed_at TIMESTAMP")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_journal_status ON journal (status, id)")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS applied_ops (
+                op_id TEXT PRIMARY KEY,
+                applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            ) WITHOUT ROWID
+        """)
+        conn.commit()
+    finally:
+        conn.close()
+
+def register(op, apply, batched=False):
+    """Register the function that applies `op` entries to Mongo."""
+    _handlers[op] = (apply, batched)
+
+def on_reconnect(hook):
+    """Run hook() once Mongo answers again, before any entry is applied (e.g. deferred migrations)."""
+    _reconnect_hooks.append(hook)
+
+def append(op, payload):
+    """Journal a write and wake the drainer. Returns the entry's op_id."""
+    return append_checked(op, payload)[0]
+
+def append_checked(op, payload, check=None):
+    """
+    append() with check() run first under the journal's write lock: appends from
+    other threads and processes wait, so what check() reads (e.g. via pending())
+    cannot change before this entry lands. Returns (op_id, check result).
+    """
+    payload = {**payload, "op_id": uuid.uuid4().hex}
+    start_worker()
+    conn = _connect()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            result = check() if check is not None else None
+            conn.execute("INSERT INTO journal (op, payload) VALUES (?, ?)", (op, json.dumps(payload)))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    finally:
+        conn.close()
+    _wakeup.set()
+    return payload["op_id"], result
+
+# Entries being applied by some drainer are not in Mongo yet either
+UNAPPLIED_SQL = "status IN ('pending', 'applying')"
+
+def pending(*ops):
+    """Payloads not yet applied (with their 'op'), oldest first; optionally only the given ops."""
+    conn = _connect()
+    try:
+        if ops:
+            marks = ", ".join("?" * len(ops))
+            rows = conn.execute(
+                f"SELECT op, payload FROM journal WHERE {UNAPPLIED_SQL} AND op IN ({marks}) ORDER BY id", ops
+            ).fetchall()
+        else:
+            rows = conn.execute(f"SELECT op, payload FROM journal WHERE {UNAPPLIED_SQL} ORDER BY id").fetchall()
+        return [{**json.loads(r['payload']), "op": r['op']} for r in rows]
+    finally:
+        conn.close()
+
+def pending_count():
+    conn = _connect()
+    try:
+        return conn.execute(f"SELECT COUNT(*) FROM journal WHERE {UNAPPLIED_SQL}").fetchone()[0]
+    finally:
+        conn.close()
+
+def failed(limit=100):
+    """Entries parked after MAX_ATTEMPTS, oldest first."""
+    conn = _connect()
+    try:
+        rows = conn.execute(
+            "SELECT id, op, payload, attempts, last_error, created_at FROM journal WHERE status = 'failed' ORDER BY id LIMIT ?",
+            (limit,)
+        ).fetchall()
+        return [dict(r) for r in rows]
+    finally:
+        conn.close()
+
+def retry_failed():
+    """Requeue every failed entry (after the cause is fixed). Returns the number requeued."""
+    conn = _connect()
+    try:
+        cur = conn.execute("UPDATE journal SET status = 'pending', attempts = 0 WHERE status = 'failed'")
+        conn.commit()
+    finally:
+        conn.close()
+    _wakeup.set()
+    return cur.rowcount
+
+def status():
+    conn = _connect()
+    try:
+        failures = conn.execute("SELECT COUNT(*) FROM journal WHERE status = 'failed'").fetchone()[0]
+    finally:
+        conn.close()
+    return {"pending": pending_count(), "failed": failures, "online": _state["online"], "last_error": _state["last_error"]}
+
+def is_online():
+    return _state["online"]
+
+def mark_offline(error):
+    """Called by readers that hit a connection error: the drainer backs off and retries."""
+    _state["online"] = False
+    _state["last_error"] = str(error)
+    _state["backoff"] = _state["backoff"] or MIN_BACKOFF
+
+def _is_connection_error(e):
+    from pymongo.errors import ConnectionFailure
+    return isinstance(e, ConnectionFailure)
+
+def _claim(conn, limit):
+    """
+    Claim the next `limit` pending entries (pending -> applying) in one write
+    transaction. Claims nothing while another drainer's claim is live, so
+    entries are applied in order. Returns the claimed rows, oldest first.
+    """
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        # A drainer that died mid-batch: its entries go back to pending
+        conn.execute(
+            "UPDATE journal SET status = 'pending' WHERE status = 'applying' AND claimed_at < datetime('now', ?)",
+            (f"-{CLAIM_LEASE_SECONDS} seconds",)
+        )
+        conn.execute("DELETE FROM applied_ops WHERE applied_at < datetime('now', '-1 day')")
+        rows = []
+        if conn.execute("SELECT 1 FROM journal WHERE status = 'applying' LIMIT 1").fetchone() is None:
+            rows = conn.execute(
+                """
+                UPDATE journal SET status = 'applying', claimed_at = CURRENT_TIMESTAMP
+                WHERE id IN (SELECT id FROM journal WHERE status = 'pending' ORDER BY id LIMIT ?)
+                RETURNING *
+                """,
+                (limit,)
+            ).fetchall()
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return sorted(rows, key=lambda r: r['id'])
+
+def _apply_group(conn, op, rows):
+    """Apply consecutive entries of one op; batched appliers get them in one call."""
+    apply, batched = _handlers[op]
+    payloads = {r['id']: json.loads(r['payload']) for r in rows}
+    marks = ", ".join("?" * len(rows))
+    done = {r[0] for r in conn.execute(
+        f"SELECT op_id FROM applied_ops WHERE op_id IN ({marks})", [p['op_id'] for p in payloads.values()]
+    )}
+    if done:
+        # Applied under an earlier claim that outlived its lease
+        conn.executemany("DELETE FROM journal WHERE id = ?", [(r['id'],) for r in rows if payloads[r['id']]['op_id'] in done])
+        conn.commit()
+        rows = [r for r in rows if payloads[r['id']]['op_id'] not in done]
+    groups = [rows] if batched else [[r] for r in rows]
+    for group in groups:
+        if not group:
+            continue
+        batch = [payloads[r['id']] for r in group]
+        try:
+            apply(batch if batched else batch[0])
+        except Exception as e:
+            if _is_connection_error(e):
+                raise
+            # Bad entry (not an outage): retry a few times, then park it as failed
+            attempts = group[0]['attempts'] + 1
+            parked = attempts >= MAX_ATTEMPTS
+            conn.executemany(
+                "UPDATE journal SET attempts = ?, status = ?, last_error = ? WHERE id = ?",
+                [(attempts, 'failed' if parked else 'pending', str(e), r['id']) for r in group]
+            )
+            conn.commit()
+            if parked:
+                print(f"Write buffer: parked {len(group)} '{op}' entr{'y' if len(group) == 1 else 'ies'} as failed: {e}")
+            return False
+        conn.executemany("INSERT OR IGNORE INTO applied_ops (op_id) VALUES (?)", [(p['op_id'],) for p in batch])
+        conn.executemany("DELETE FROM journal WHERE id = ?", [(r['id'],) for r in group])
+        conn.commit()
+    return True
+
+def drain(limit=BATCH_SIZE):
+    """
+    Apply up to `limit` pending entries in order. Returns the number applied.
+    Stops at the first failure so later writes never overtake earlier ones.
+    """
+    with _drain_lock:
+        conn = _connect()
+        rows = []
+        try:
+            while _reconnect_hooks:
+                _reconnect_hooks[0]()
+                _reconnect_hooks.pop(0)
+            rows = _claim(conn, limit)
+            applied, start = 0, 0
+            while start < len(rows):
+                end = start
+                while end < len(rows) and rows[end]['op'] == rows[start]['op']:
+                    end += 1
+                if not _apply_group(conn, rows[start]['op'], rows[start:end]):
+                    break
+                applied += end - start
+                start = end
+        except Exception as e:
+            if not _is_connection_error(e):
+                raise
+            mark_offline(e)
+            return 0
+        finally:
+            # Release what this claim did not get to (stopped early or offline)
+            if rows:
+                conn.executemany(
+                    "UPDATE journal SET status = 'pending' WHERE id = ? AND status = 'applying'",
+                    [(r['id'],) for r in rows]
+                )
+                conn.commit()
+            conn.close()
+    _state["online"], _state["backoff"], _state["last_error"] = True, 0, None
+    return applied
+
+def flush():
+    """Drain everything now; raises NotDrained if entries remain (Mongo unreachable or retrying)."""
+    if not is_online():
+        raise NotDrained(_state["last_error"])
+    while drain():
+        pass
+    if pending_count():
+        raise NotDrained(_state["last_error"] or "entries waiting for retry")
+
+def _run_worker():
+    while True:
+        _wakeup.wait(_state["backoff"] or POLL_SECONDS)
+        _wakeup.clear()
+        try:
+            while drain():
+                pass
+        except Exception as e:
+            print(f"Write buffer error: {e}")
+        if not _state["online"]:
+            # Exponential backoff while Mongo is unreachable
+            _state["backoff"] = min(MAX_BACKOFF, max(MIN_BACKOFF, _state["backoff"] * 2))
+
+def start_worker():
+    """Start the drain thread once per process (also drains entries left by a restart)."""
+    global _worker
+    with _worker_lock:
+        if _worker is not None and _worker.is_alive():
+            return _worker
+        init_journal()
+        _worker = threading.Thread(target=_run_worker, name="mongo-write-buffer", daemon=True)
+        _worker.start()
+        _wakeup.set()
+        return _worker